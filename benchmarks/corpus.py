@@ -0,0 +1,115 @@
+import random
+import uuid
+from typing import Iterator
+
+from knowledge_base.storage import QuestionType, Subject, Difficulty, Source
+
+# 408 考试中各科目的分值占比: 数据结构 45, 计算机组成原理 45, 操作系统 35, 计算机网络 25
+SUBJECT_WEIGHTS = {
+    Subject.DATA_STRUCTURE: 45,
+    Subject.COMPUTER_ORGANIZATION: 45,
+    Subject.OPERATING_SYSTEM: 35,
+    Subject.COMPUTER_NETWORK: 25,
+}
+TYPE_WEIGHTS = {
+    QuestionType.SINGLE_CHOICE: 75,
+    QuestionType.SHORT_ANSWER: 15,
+    QuestionType.COMPREHENSIVE_APPLICATION: 5,
+    QuestionType.FILL_IN_THE_BLANK: 3,
+    QuestionType.MULTIPLE_CHOICE: 2,
+}
+DIFFICULTY_WEIGHTS = {Difficulty.EASY: 30, Difficulty.MEDIUM: 50, Difficulty.HARD: 20}
+SOURCE_WEIGHTS = {Source.REAL: 20, Source.INTERNET: 50, Source.AI: 30}
+
+EXAM_POINTS = {
+    Subject.DATA_STRUCTURE: [
+        "线性表", "栈", "队列", "串的模式匹配", "二叉树遍历", "线索二叉树", "哈夫曼树", "并查集", "图的遍历",
+        "最小生成树", "最短路径", "拓扑排序", "关键路径", "折半查找", "B树", "散列表", "快速排序", "堆排序", "归并排序",
+    ],
+    Subject.COMPUTER_ORGANIZATION: [
+        "进制转换", "补码", "浮点数表示", "IEEE754", "加法器", "存储器层次", "Cache 映射", "虚拟存储器", "TLB",
+        "指令格式", "寻址方式", "CISC 与 RISC", "数据通路", "微程序控制器", "指令流水线", "总线仲裁", "中断", "DMA",
+    ],
+    Subject.OPERATING_SYSTEM: [
+        "进程状态", "线程", "处理机调度", "信号量", "管程", "死锁", "银行家算法", "分页存储", "分段存储", "页面置换",
+        "工作集", "文件目录", "索引节点", "磁盘调度", "设备分配", "缓冲区", "SPOOLing",
+    ],
+    Subject.COMPUTER_NETWORK: [
+        "OSI 模型", "奈奎斯特定理", "香农定理", "CRC 校验", "滑动窗口", "CSMA/CD", "以太网", "交换机", "IP 分组",
+        "子网划分", "CIDR", "路由算法", "TCP 拥塞控制", "TCP 连接管理", "UDP", "DNS", "HTTP", "FTP",
+    ],
+}
+_STEMS = [
+    "下列关于{point}的叙述中，正确的是（）。",
+    "在{subject}中，{point}的主要作用是（）。",
+    "若采用{point}，则下列说法错误的是（）。",
+    "某系统使用{point}，请分析其对性能的影响。",
+    "简述{point}的基本原理及其适用场景。",
+    "关于{point}，以下哪一项描述是不正确的（）。",
+]
+_CLAUSES = ["时间复杂度为 O(n log n)", "需要额外的存储空间", "可以并发执行", "在最坏情况下退化",
+            "由硬件直接实现", "依赖操作系统支持", "可以减少访存次数", "会引入额外的开销", "只适用于静态数据"]
+
+
+def _weighted(rng: random.Random, weights: dict):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_questions(n: int, seed: int = 0) -> Iterator[dict]:
+    """
+    生成 n 道合成试题, 科目、题型、难度和来源按 408 试卷的大致比例分布
+
+    Returns:
+        可以直接构造 Question 的字典, 包含 uuid
+    """
+    rng = random.Random(seed)
+    for i in range(n):
+        subject = _weighted(rng, SUBJECT_WEIGHTS)
+        question_type = _weighted(rng, TYPE_WEIGHTS)
+        point = rng.choice(EXAM_POINTS[subject])
+        stem = rng.choice(_STEMS).format(point=point, subject=subject.value)
+        clauses = rng.sample(_CLAUSES, 4)
+        options = "\n".join(f"{label}. {point}{clause}" for label, clause in zip("ABCD", clauses))
+        answer = rng.choice("ABCD") if question_type == QuestionType.SINGLE_CHOICE else f"{point}{rng.choice(_CLAUSES)}"
+        # 编号保证题干互不相同
+        question = f"{stem}（第 {i} 题）"
+        yield {
+            "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+            "document": f"{question}\n{options}\n答案：{answer}",
+            "type": question_type.value,
+            "subject": subject.value,
+            "question": question,
+            "options": options,
+            "answer": answer,
+            "difficulty": _weighted(rng, DIFFICULTY_WEIGHTS).value,
+            "source": _weighted(rng, SOURCE_WEIGHTS).value,
+            "exam_point": point,
+        }
+
+
+def generate_knowledge_points(n: int, seed: int = 0) -> Iterator[dict]:
+    """生成 n 条合成知识点, 科目分布与试题相同"""
+    rng = random.Random(seed + 1)
+    for i in range(n):
+        subject = _weighted(rng, SUBJECT_WEIGHTS)
+        point = rng.choice(EXAM_POINTS[subject])
+        clauses = "，".join(rng.sample(_CLAUSES, 3))
+        yield {
+            "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+            "document": f"{point}是{subject.value}中的重要内容，{clauses}。（知识点 {i}）",
+            "subject": subject.value,
+            "knowledge_point": point,
+            "difficulty": _weighted(rng, DIFFICULTY_WEIGHTS).value,
+            "source": _weighted(rng, SOURCE_WEIGHTS).value,
+            "exam_point": point,
+        }
+
+
+def generate_queries(n: int, seed: int = 0) -> list[str]:
+    """生成 n 条检索用的知识点查询文本"""
+    rng = random.Random(seed + 2)
+    queries = []
+    for _ in range(n):
+        subject = _weighted(rng, SUBJECT_WEIGHTS)
+        queries.append(f"{rng.choice(EXAM_POINTS[subject])}{rng.choice(_CLAUSES)}")
+    return queries
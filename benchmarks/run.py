@@ -0,0 +1,355 @@
+"""
+知识库基准测试
+
+在 SQLite + 指定向量存储后端上导入合成语料, 测量:
+- 导入吞吐量 (MySQL 写入 + SyncManager 同步到向量存储)
+- query_uuid 延迟 p50/p95/p99, 以及 --concurrency 个线程并发查询时的吞吐量和延迟
+- query_uuid 相对于精确检索 (NumpyVectorStore) 的 recall@k
+- test_config_408 的 generate_test 端到端延迟
+- 在新进程中重新打开已持久化的存储并查询后的常驻内存 (RSS) 增量; chromadb-int8 为开启压缩向量索引的 chromadb,
+  同时测试 chromadb 时报告两者的内存比例, 并检查是否达到 --memory-target 倍和 recall@k >= --recall-target
+- 使用真实模型时, CPUEmbeddingFunction (--embedding-backend) 相对于 BAAIEmbeddingFunction 的余弦相似度差异
+
+结果写入 JSON 文件, 便于不同版本之间比较
+
+用法:
+    python -m benchmarks.run --questions 10000 --knowledge-points 2000 --backend chromadb numpy --output bench.json
+    python -m benchmarks.run --embedding BAAI/bge-small-zh-v1.5 --dim 512
+    python -m benchmarks.run --embedding BAAI/bge-small-zh-v1.5 --concurrency 32 --query-batching-ms 5
+    python -m benchmarks.run --backend chromadb chromadb-int8 --questions 50000
+    python -m benchmarks.run --embedding BAAI/bge-large-zh-v1.5 --embedding-backend int8 --backend numpy
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from knowledge_base.config import BAAIEmbeddingFunction, test_config_408
+from knowledge_base.storage import (
+    MySQLClient,
+    NumpyVectorStore,
+    SyncManager,
+    VectorStore,
+    Question,
+    KnowledgePoint,
+    create_vector_store,
+)
+from knowledge_base.embedding import CachedEmbeddingFunction
+from knowledge_base.test_generator import TestGenerator
+from knowledge_base.utils import logger
+
+from .corpus import generate_questions, generate_knowledge_points, generate_queries
+from .stub_embedding import StubEmbeddingFunction
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """返回毫秒为单位的延迟统计"""
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def build_embedding_function(args, workdir: str):
+    """
+    创建 embedding function, 外面包一层持久化缓存, 参考存储与被测存储共用,
+    同一文本只计算一次, 召回率测试不会重复消耗模型推理时间
+    """
+    if args.embedding == "stub":
+        embedding_function = StubEmbeddingFunction(args.dim)
+    else:
+        from knowledge_base.embedding import CPUEmbeddingFunction
+
+        embedding_function = CPUEmbeddingFunction(args.embedding, backend=args.embedding_backend)
+    return CachedEmbeddingFunction(embedding_function, os.path.join(workdir, "embedding_cache"))
+
+
+def bench_embedding_accuracy(args, queries: list[str]) -> dict:
+    """在查询和试题文本上比较 CPUEmbeddingFunction 与 BAAIEmbeddingFunction 的输出, 不经过向量缓存"""
+    from knowledge_base.embedding import CPUEmbeddingFunction, compare_embeddings
+
+    texts = queries[:args.embedding_accuracy_texts // 2]
+    texts += [question["document"] for question in generate_questions(args.embedding_accuracy_texts - len(texts), args.seed)]
+    candidate = CPUEmbeddingFunction(args.embedding, backend=args.embedding_backend, max_length=args.max_length)
+    result = compare_embeddings(BAAIEmbeddingFunction(args.embedding), candidate, texts)
+    logger.info(f"embedding 数值差异: backend={args.embedding_backend}, {result}")
+    return {"backend": args.embedding_backend, "texts": len(texts), **result}
+
+
+def store_config(args, backend: str, path: str | None, embedding_function, query_batching: bool = False) -> dict:
+    config = {
+        "backend": "chromadb" if backend == "chromadb-int8" else backend,
+        "path": path,
+        "embedding_function": embedding_function,
+        "collections": {"questions": {}, "knowledge_points": {}},
+        "max_length": args.max_length,
+        "overlap": args.overlap,
+        "batch_size": args.batch_size,
+        "query_batching": {"max_wait_ms": args.query_batching_ms} if query_batching and args.query_batching_ms > 0 else None,
+    }
+    if backend == "chromadb-int8":
+        config["compressed_index"] = {"path": os.path.join(path or ".", "compressed_index"), "recall_target": args.recall_target}
+    return config
+
+
+def resident_bytes() -> int:
+    """当前进程的常驻内存 (Linux 的 VmRSS), 其它平台返回 0"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _resident_worker(args, backend: str, path: str, workdir: str, queries: list[str], result_queue):
+    """在新进程中打开已持久化的存储, 加载集合并查询, 返回打开前后的常驻内存增量"""
+    embedding_function = build_embedding_function(args, workdir)
+    embedding_function(queries)
+    before = resident_bytes()
+    store = create_vector_store(store_config(args, backend, path, embedding_function))
+    store.warmup()
+    for query in queries:
+        store.query_uuid("questions", query_texts=[query], n_results=args.k)
+    result_queue.put(resident_bytes() - before)
+    store.close()
+
+
+def bench_resident(args, backend: str, path: str, workdir: str, queries: list[str]) -> dict:
+    """NumPy 后端不持久化, 不测试"""
+    if backend == "numpy":
+        return {}
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_resident_worker, args=(args, backend, path, workdir, queries, result_queue))
+    process.start()
+    delta = result_queue.get()
+    process.join()
+    return {"resident_bytes": delta, "resident_mb": delta / 2**20}
+
+
+def bench_ingestion(mysql_client: MySQLClient, store: VectorStore, args) -> dict:
+    """分批写入 MySQL, 每批提交后由 SyncManager 同步到向量存储"""
+    start = time.perf_counter()
+    total = 0
+    for table, records in (
+        (Question, generate_questions(args.questions, args.seed)),
+        (KnowledgePoint, generate_knowledge_points(args.knowledge_points, args.seed)),
+    ):
+        batch = []
+        for record in records:
+            batch.append(table(**record))
+            if len(batch) >= args.batch_size:
+                total += _commit(mysql_client, batch)
+                batch = []
+        total += _commit(mysql_client, batch)
+    seconds = time.perf_counter() - start
+    chunks = store.count("questions") + store.count("knowledge_points")
+    return {
+        "records": total,
+        "chunks": chunks,
+        "seconds": seconds,
+        "records_per_second": total / seconds,
+        "chunks_per_second": chunks / seconds,
+    }
+
+
+def _commit(mysql_client: MySQLClient, records: list) -> int:
+    if not records:
+        return 0
+    with mysql_client.session_scope() as session:
+        session.add_all(records)
+    return len(records)
+
+
+def bench_query(store: VectorStore, queries: list[str], k: int) -> dict:
+    """逐条查询, 包含查询文本的 embedding 时间"""
+    for query in queries[:5]:
+        store.query_uuid("questions", query_texts=[query], n_results=k)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.query_uuid("questions", query_texts=[query], n_results=k)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def bench_concurrent_query(store: VectorStore, queries: list[str], k: int, concurrency: int) -> dict:
+    """
+    concurrency 个线程同时查询, 每个查询文本都是第一次出现, 不命中向量缓存,
+    用于比较开启 query_batching 前后的吞吐量和尾延迟
+    """
+    def query(text: str) -> float:
+        start = time.perf_counter()
+        store.query_uuid("questions", query_texts=[text], n_results=k)
+        return time.perf_counter() - start
+
+    # 加上后缀避免命中 bench_query 写入的向量缓存
+    texts = [f"{query} #{i}" for i, query in enumerate(queries)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(query, texts))
+    seconds = time.perf_counter() - start
+    return {"concurrency": concurrency, "queries_per_second": len(texts) / seconds, **percentiles(latencies)}
+
+
+def bench_recall(store: VectorStore, reference: NumpyVectorStore, queries: list[str], k: int) -> dict:
+    """
+    以 NumpyVectorStore 的精确检索结果为基准计算 recall@k, 两边使用相同的查询向量
+
+    分数不低于基准第 k 个结果的 uuid 都算命中: 合成语料中有内容相同的题目, 分数相同时取哪一个都是正确的
+    """
+    embeddings = store.embedding_function(queries)  # type: ignore
+    hits, total = 0, 0
+    for embedding in embeddings:
+        expected = reference.query_uuid_scores("questions", query_embeddings=[embedding], n_results=k)
+        actual = store.query_uuid_scores("questions", query_embeddings=[embedding], n_results=k)
+        if not expected:
+            continue
+        threshold = expected[-1][1] * (1 - 1e-4)
+        hits += min(sum(1 for _, score in actual if score >= threshold), len(expected))
+        total += len(expected)
+    return {"k": k, "queries": len(queries), "recall": hits / total if total else 1.0}
+
+
+def bench_generate_test(mysql_client: MySQLClient, store: VectorStore, repeats: int) -> dict:
+    """test_config_408 的端到端组卷延迟"""
+    generator = TestGenerator(mysql_client, store, {"knowledge_point_finder": "chromadb", "parallel": True})
+    generator.generate_test(test_config_408)
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.generate_test(test_config_408)
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def build_reference(args, embedding_function) -> NumpyVectorStore:
+    reference = NumpyVectorStore(store_config(args, "numpy", None, embedding_function))
+    batch = []
+    for record in generate_questions(args.questions, args.seed):
+        batch.append(record)
+        if len(batch) >= args.batch_size:
+            reference.add_questions(batch)
+            batch = []
+    reference.add_questions(batch)
+    return reference
+
+
+def run_backend(args, backend: str, workdir: str, queries: list[str]) -> dict:
+    logger.info(f"基准测试: backend={backend}")
+    workdir = os.path.join(workdir, backend)
+    # 每个后端使用独立的向量缓存, 导入吞吐量不受前一个后端的影响
+    embedding_function = build_embedding_function(args, workdir)
+    mysql_client = MySQLClient({"url": f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    store = create_vector_store(store_config(args, backend, os.path.join(workdir, "store"), embedding_function, query_batching=True))
+    SyncManager(mysql_client, store)
+    result = {"ingestion": bench_ingestion(mysql_client, store, args)}
+    result["query_uuid"] = bench_query(store, queries, args.k)
+    if args.concurrency > 1:
+        result["concurrent_query_uuid"] = bench_concurrent_query(store, queries, args.k, args.concurrency)
+    if args.recall_queries > 0:
+        reference = build_reference(args, embedding_function)
+        result["recall"] = bench_recall(store, reference, queries[:args.recall_queries], args.k)
+    result["generate_test"] = bench_generate_test(mysql_client, store, args.generate_repeats)
+    store.close()
+    mysql_client.engine.dispose()
+    result["memory"] = bench_resident(args, backend, os.path.join(workdir, "store"), workdir, queries[:20])
+    return result
+
+
+def compare_memory(results: dict, args) -> dict | None:
+    """chromadb-int8 相对于 chromadb 的常驻内存缩减倍数, 以及是否达到内存和召回率目标"""
+    baseline = results.get("chromadb", {}).get("memory", {}).get("resident_bytes")
+    compressed = results.get("chromadb-int8", {}).get("memory", {}).get("resident_bytes")
+    if not baseline or not compressed:
+        return None
+    reduction = baseline / compressed
+    recall = results["chromadb-int8"].get("recall", {}).get("recall")
+    return {
+        "reduction": reduction,
+        "recall": recall,
+        "meets_target": reduction >= args.memory_target and (recall is None or recall >= args.recall_target),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="知识库基准测试")
+    parser.add_argument("--questions", type=int, default=10000, help="合成试题数量")
+    parser.add_argument("--knowledge-points", type=int, default=2000, help="合成知识点数量")
+    parser.add_argument("--backend", nargs="+", default=["chromadb"], choices=["chromadb", "chromadb-int8", "numpy"])
+    parser.add_argument("--embedding", default="stub", help="stub 或 HuggingFace 模型名称")
+    parser.add_argument("--embedding-backend", default="torch", choices=["torch", "int8", "onnx"])
+    parser.add_argument("--dim", type=int, default=1024, help="stub embedding 的向量维度")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1000, help="每次提交的记录数")
+    parser.add_argument("--queries", type=int, default=200, help="延迟测试的查询数量")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发查询的线程数, 大于 1 时测试并发吞吐量")
+    parser.add_argument("--query-batching-ms", type=float, default=0, help="查询侧动态批处理的等待时间, 0 表示关闭")
+    parser.add_argument("--recall-queries", type=int, default=100, help="召回率测试的查询数量, 0 表示跳过")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--memory-target", type=float, default=4.0, help="chromadb-int8 相对于 chromadb 的常驻内存缩减倍数目标")
+    parser.add_argument("--recall-target", type=float, default=0.95, help="压缩向量索引的 recall@k 目标")
+    parser.add_argument("--embedding-accuracy-texts", type=int, default=200, help="与 BAAIEmbeddingFunction 比较的文本数量, 0 表示跳过")
+    parser.add_argument("--generate-repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="数据目录, 默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="kb_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    queries = generate_queries(args.queries, args.seed)
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": {},
+    }
+    try:
+        if args.embedding != "stub" and args.embedding_accuracy_texts > 0:
+            report["embedding_accuracy"] = bench_embedding_accuracy(args, queries)
+        for backend in args.backend:
+            report["results"][backend] = run_backend(args, backend, workdir, queries)
+        memory = compare_memory(report["results"], args)
+        if memory is not None:
+            report["compressed_memory"] = memory
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps({key: report[key] for key in ("embedding_accuracy", "results", "compressed_memory") if key in report}, ensure_ascii=False, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import hashlib
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+
+class StubEmbeddingFunction(EmbeddingFunction):
+    """
+    确定性的 embedding function, 不需要加载模型
+
+    将文本的单字和二元组哈希到 dim 个桶中 (带随机符号), 归一化后作为向量,
+    字面相近的文本向量也相近, 检索结果有意义, 且每次运行结果完全一致
+
+    Args:
+        dim: 向量维度, 默认与 bge-large-zh 相同
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.model_name = f"stub-{dim}"
+
+    def _features(self, text: str) -> list[str]:
+        return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return list(vectors)  # type: ignore
@@ -1,4 +1,5 @@
 from .knowledge_base import KnowledgeBase
-from .storage import MySQLClient, ChromaDBClient
+from .async_knowledge_base import AsyncKnowledgeBase
+from .storage import MySQLClient, VectorStore, ChromaDBClient, NumpyVectorStore
 
-__all__ = ['KnowledgeBase', 'MySQLClient', 'ChromaDBClient']
\ No newline at end of file
+__all__ = ['KnowledgeBase', 'AsyncKnowledgeBase', 'MySQLClient', 'VectorStore', 'ChromaDBClient', 'NumpyVectorStore']
\ No newline at end of file
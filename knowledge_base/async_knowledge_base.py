@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sqlalchemy import text
+
+from .config import mysql_config, async_config
+from .knowledge_base import KnowledgeBase
+from .storage import AsyncMySQLClient
+from .test_generator import AsyncTestGenerator
+from .test_generator.test_config import TestConfig, TestSectionConfig
+from .test_generator.test_generator import Test
+from .utils import logger
+
+class AsyncKnowledgeBase:
+    """
+    KnowledgeBase 的 asyncio 接口, 用于在一个进程中同时处理大量组卷请求
+
+    组卷的读取路径是异步的: MySQL 使用 async SQLAlchemy, 关键词提取使用异步 LLM 客户端,
+    embedding 和向量检索在有界的线程池中执行; 导入、同步等写入路径仍由内部的 KnowledgeBase 处理
+
+    Example:
+        knowledge_base = AsyncKnowledgeBase()
+        test = await knowledge_base.generate_test(test_config_408)
+        await knowledge_base.close()
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase | None = None, mysql_config: dict = mysql_config, async_config: dict = async_config, **kwargs):
+        """
+        Args:
+            knowledge_base: 已创建的 KnowledgeBase, 不指定时使用 mysql_config 和 kwargs 中的其余配置创建
+            mysql_config: MySQL 配置, 异步客户端与 KnowledgeBase 使用同一个数据库
+            async_config: executor_workers 为执行 embedding 和向量检索的线程数
+        """
+        self.knowledge_base = knowledge_base or KnowledgeBase(mysql_config=mysql_config, **kwargs)
+        self.async_mysql_client = AsyncMySQLClient(mysql_config)
+        self.executor = ThreadPoolExecutor(max_workers=async_config.get("executor_workers", 16), thread_name_prefix="async-kb")
+        self.test_generator = AsyncTestGenerator(self.knowledge_base.test_generator, self.async_mysql_client, self.executor)
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def generate_test(self, config: TestConfig) -> Test:
+        """生成测试试卷"""
+        return await self.test_generator.generate_test(config)
+
+    async def generate_test_section(self, section: TestSectionConfig) -> Test:
+        """生成测试段落"""
+        return await self.test_generator.generate_test_section(section)
+
+    async def save_questions_from_file(self, file_path: str):
+        """在线程池中导入试题文件, 不阻塞事件循环"""
+        await self._run(self.knowledge_base.save_questions_from_file, file_path)
+
+    async def save_knowledge_points_from_file(self, file_path: str):
+        """在线程池中导入知识点文件, 不阻塞事件循环"""
+        await self._run(self.knowledge_base.save_knowledge_points_from_file, file_path)
+
+    async def warmup(self):
+        """预先加载 embedding 模型并建立数据库连接"""
+        await self._run(self.knowledge_base.warmup)
+        async with self.async_mysql_client.session_scope() as session:
+            await session.execute(text("SELECT 1"))
+        logger.info("AsyncKnowledgeBase warmup 完成")
+
+    async def close(self):
+        """关闭异步连接池和线程池, 然后关闭 KnowledgeBase"""
+        await self.async_mysql_client.dispose()
+        self.executor.shutdown(wait=True)
+        self.knowledge_base.close()
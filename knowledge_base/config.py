@@ -1,22 +1,39 @@
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import threading
 from chromadb import Documents, EmbeddingFunction, Embeddings
 
 from .test_generator.test_config import TestConfig, TestSectionConfig
 from .storage import QuestionType, Subject
+from .storage.text_sliptter import SentenceTextSplitter
 
 # 演示自定义 EmbeddingFunction 的用法
 # class MyEmbeddingFunction(EmbeddingFunction):
 #     def __call__(self, input: Documents) -> Embeddings:
 #         # embed the documents somehow
+#         from llama_index.embeddings.openai import OpenAIEmbedding
 #         embeddings = OpenAIEmbedding().get_text_embedding_batch(input)
 #         return embeddings
 
 
 class BAAIEmbeddingFunction(EmbeddingFunction):
+    """bge 模型的 embedding function, 模型在第一次使用 (或调用 warmup) 时才加载"""
+
     def __init__(self, model_name: str = "BAAI/bge-large-zh-v1.5"):
         self.model_name = model_name
-        self.model = HuggingFaceEmbedding(model_name=model_name)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+                    self._model = HuggingFaceEmbedding(model_name=self.model_name)
+        return self._model
+
+    def warmup(self):
+        """预先加载模型"""
+        return self.model
     
     def __call__(self, input: Documents) -> Embeddings:
         # 会提示类型错误，但是可以正常运行
@@ -29,12 +46,45 @@ mysql_config = {
     'user': 'user',
     'password': 'user',
     'database': 'demo',
+    # 连接池, 连接总数不超过 pool_size + max_overflow; pool_size 应不小于 test_generator_config 的 max_workers
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    # 小于 MySQL 的 wait_timeout, 避免使用被服务端关闭的连接
+    'pool_recycle': 3600,
+    'pool_pre_ping': True,
 }
 
 chromadb_config = {
+    # 向量存储后端: chromadb (HNSW) 或 numpy (内存中暴力检索, 结果精确, path 为保存目录)
+    'backend': 'chromadb',
     'allow_reset': True,
     'path': './db_demo',
+    # CPU 部署可以替换为 CPUEmbeddingFunction(backend='int8' 或 'onnx', max_length=512, num_threads=...),
+    # 替换前使用 compare_embeddings 检查与 BAAIEmbeddingFunction 的数值差异 (python -m benchmarks.run --embedding
+    # BAAI/bge-large-zh-v1.5 --embedding-backend int8 的 embedding_accuracy); bge-large-zh 上 int8 和 onnx 的余弦差异
+    # 尚未实测, 部署前需先确认 min_cosine;
+    # 多核机器上可以使用 EmbeddingWorkerPool(functools.partial(CPUEmbeddingFunction, num_threads=...), workers=...)
+    # 在多个进程中并行计算
     'embedding_function': BAAIEmbeddingFunction(),
+    # 持久化的向量缓存, 设置为 None 关闭
+    'embedding_cache': {
+        'path': './embedding_cache',
+        'memory_size': 10000,
+    },
+    # 查询侧的动态批处理, 并发查询的文本最多等待 max_wait_ms 或凑满 max_batch_size 条后一次批量计算;
+    # 单线程使用时只会增加延迟, 并发服务时可以设置为 {'max_wait_ms': 5, 'max_batch_size': 64}
+    'query_batching': None,
+    # 查询向量和查询结果缓存, 写入和删除后对应集合的结果缓存立即失效; 设置为 None 关闭
+    # KnowledgeBase 把集合版本号保存在 MySQL 中, 同步一个事务的变更后每个集合加一, 其它进程的缓存随之失效;
+    # 读到的版本号复用 shared_refresh_interval 秒, 其它进程同步的修改最多延迟这么多秒可见 (本进程的修改立即可见),
+    # 设置为 0 时每次查询都读取一次版本号, 没有延迟但每次查询多一次 MySQL 往返
+    'query_cache': {
+        'max_entries': 10000,
+        'ttl': 300,
+        'embedding_max_entries': 10000,
+        'shared_refresh_interval': 1,
+    },
     'collections': {
         'questions': {
             'name': 'questions',
@@ -45,9 +95,85 @@ chromadb_config = {
             'metadata_fields': ['id', 'type', 'subject', 'knowledge_point', 'difficulty', 'source', 'exam_point'],
         },
     },
-    # 'text_splitter': CharacterTextSplitter(),
-    'max_length': 200,
-    'overlap': 20,
+    # 按中文句子和标点切分, 使用 embedding 模型的分词器计算 token 数, max_length 不超过模型的 512 token 上限;
+    # 也可以换回按字符滑动窗口切分的 CharacterTextSplitter()
+    'text_splitter': SentenceTextSplitter(tokenizer='BAAI/bge-large-zh-v1.5'),
+    'max_length': 512,
+    'overlap': 0,
+    'batch_size': 256,
+    # 按父文档分组查询: 初始候选切片数为 n_results * candidate_factor, 切片分数聚合方式为 max/sum/rrf
+    'candidate_factor': 4,
+    'aggregation': 'max',
+    # 压缩向量索引: 全精度向量只保存在 path 下的 memmap 文件中, 常驻内存的是 int8 编码 (每个切片约 dim + 5 字节),
+    # 查询先在 int8 编码上检索 (支持 where 预过滤), 再读取候选的全精度向量重排, 首次构建时按 recall_target 调整 rerank_factor;
+    # 开启后 ChromaDB 只保存文档和元数据 (1 维占位向量), 需在创建集合前开启; int8 编码是 float32 向量的 1/4,
+    # 但 ChromaDB 自身的开销和切片 id、元数据不变: benchmarks (约 4 万切片, 1024 维) 中进程常驻内存从 218MB 降到 126MB;
+    # 设置为 None 关闭, 直接使用 ChromaDB 的 HNSW 检索
+    'compressed_index': None,
+    # 'compressed_index': {
+    #     'path': './compressed_index',
+    #     'fields': ['uuid', 'type', 'subject', 'difficulty', 'source'],
+    #     'rerank_factor': 4,
+    #     'recall_target': 0.95,
+    # },
+}
+
+sync_config = {
+    # commit: 事务提交后同步写入 ChromaDB; outbox: 写入 sync_outbox 表, 由后台 SyncWorker 异步同步
+    'mode': 'commit',
+    'workers': 2,
+    'batch_size': 256,
+    'poll_interval': 1.0,
+    'max_attempts': 5,
+    'retry_delay': 5.0,
+    # 认领的变更超过 claim_timeout 秒仍未完成 (worker 崩溃) 时由其它 worker 重新认领, 应大于处理一批变更的最长时间
+    'claim_timeout': 300.0,
+}
+
+keyword_index_config = {
+    # 进程内 BM25 关键词索引, 第一次检索或 warmup 时从 MySQL 构建;
+    # 之后检索时最多每 refresh_interval 秒从 question_changes 表读取一次变更, 其它进程的修改也会同步过来,
+    # 变更日志保留 change_retention 秒, 更久没有刷新的进程会重新构建
+    'enabled': True,
+    'k1': 1.5,
+    'b': 0.75,
+    'refresh_interval': 1.0,
+    'change_retention': 86400,
+}
+
+metrics_config = {
+    # 计数器和延迟直方图, 开启后通过 KnowledgeBase.metrics.snapshot() 或 to_prometheus() 读取
+    'enabled': False,
+}
+
+async_config = {
+    # AsyncKnowledgeBase 中执行 embedding 和向量检索的线程数, 异步 MySQL 连接池使用 mysql_config 中的参数
+    'executor_workers': 16,
+}
+
+import_config = {
+    # 从文件导入时每次读取的行数, 决定导入的内存占用
+    'chunk_size': 10000,
+    # 每次 executemany 写入并提交的行数
+    'batch_size': 1000,
+}
+
+test_generator_config = {
+    # 有知识点的段落使用的查找器: keyword (LLM 提取关键词), chromadb (向量检索) 或 hybrid (向量 + BM25 融合)
+    'knowledge_point_finder': 'keyword',
+    # 并行生成各段落, 每个工作线程使用独立的数据库会话
+    'parallel': True,
+    'max_workers': 8,
+    # 知识点关键词提取, llm_client 为 None 时使用 utils.instructor 中的 instructor_client,
+    # async_llm_client 为 AsyncKnowledgeBase 使用的异步客户端, 为 None 时使用 async_instructor_client
+    'llm_client': None,
+    'async_llm_client': None,
+    'keyword_model': 'gpt-4o-mini',
+    'keyword_cache': {
+        'path': './keyword_cache.json',
+        'ttl': 7 * 24 * 3600,
+        'max_entries': 10000,
+    },
 }
 
 test_config_408: TestConfig = TestConfig(sections=[
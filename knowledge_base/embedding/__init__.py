@@ -0,0 +1,7 @@
+from .cache import EmbeddingCache, CachedEmbeddingFunction
+from .cpu_backend import CPUEmbeddingFunction, compare_embeddings
+from .pool import EmbeddingWorkerPool
+from .metered import MeteredEmbeddingFunction
+from .micro_batcher import MicroBatchingEmbeddingFunction
+
+__all__ = ["EmbeddingCache", "CachedEmbeddingFunction", "CPUEmbeddingFunction", "compare_embeddings", "EmbeddingWorkerPool", "MeteredEmbeddingFunction", "MicroBatchingEmbeddingFunction"]
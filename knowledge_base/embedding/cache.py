@@ -0,0 +1,277 @@
+import fcntl
+import json
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from ..utils import get_content_based_uuid, logger, metrics
+
+
+class EmbeddingCache:
+    """
+    基于内容哈希的向量缓存, 磁盘上使用内存映射的 float32 矩阵存储向量, 内存中使用 LRU 作为前端
+
+    目录结构 (每个模型一个子目录):
+        meta.json   模型名称与向量维度
+        vectors.f32 内存映射的向量矩阵, 按行存储
+        index.tsv   追加写入的索引, 每行为 "内容哈希\\t行号"
+        lock        文件锁
+
+    多个进程可以共用同一个目录: 写入时持有 lock 的排它锁, 先读取其它进程追加的索引,
+    再从全局最大行号之后分配新行; 读取未命中时也会读取新追加的索引, 共享其它进程计算的向量
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, path: str, model_name: str, memory_size: int = 10000):
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.path = Path(path) / re.sub(r"[^0-9A-Za-z_.-]", "_", model_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._meta_file = self.path / "meta.json"
+        self._vector_file = self.path / "vectors.f32"
+        self._index_file = self.path / "index.tsv"
+        self._lock_file = self.path / "lock"
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._index: dict[str, int] = {}
+        self._dim: int | None = None
+        self._vectors: np.memmap | None = None
+        # 已读取的索引文件字节数和已分配的行数 (包括其它进程分配的行)
+        self._index_offset = 0
+        self._rows = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        """进程间的文件锁, 同一进程内由 self._lock 互斥"""
+        with open(self._lock_file, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _reset_state(self):
+        self._memory.clear()
+        self._index.clear()
+        self._dim = None
+        self._vectors = None
+        self._index_offset = 0
+        self._rows = 0
+
+    def _load(self):
+        """加载已有的索引和向量文件, 文件缺失或与索引不一致时删除已有文件, 使用空缓存"""
+        with self._lock, self._file_lock():
+            try:
+                self._refresh()
+                if self._dim is not None:
+                    capacity = 0 if self._vectors is None else self._vectors.shape[0]
+                    # 向量先于索引落盘, 索引中的行超出向量文件说明文件被截断或替换过
+                    if capacity == 0 or self._rows > capacity:
+                        raise ValueError(f"向量文件长度不足: rows={self._rows}, capacity={capacity}")
+            except Exception as e:
+                logger.warning(f"加载向量缓存失败, 使用空缓存: {self.path}, {e}")
+                # 保留旧索引会让之后写入的行与旧条目对应错误, 删除全部文件重新开始
+                self._reset_state()
+                for file in (self._meta_file, self._vector_file, self._index_file):
+                    file.unlink(missing_ok=True)
+                return
+        if self._index:
+            logger.info(f"加载向量缓存: {self.path}, 条目数: {len(self._index)}")
+
+    def _refresh(self):
+        """读取 (其它进程) 新追加的索引行, 向量文件变大时重新映射, 调用方持有 self._lock 和文件锁"""
+        if not self._meta_file.exists():
+            if self._dim is not None:
+                # 其它进程删除了损坏的缓存
+                self._reset_state()
+            return
+        if self._dim is None:
+            self._dim = int(json.loads(self._meta_file.read_text(encoding="utf-8"))["dim"])
+        if self._index_file.exists():
+            with open(self._index_file, "rb") as f:
+                f.seek(0, 2)
+                if f.tell() < self._index_offset:
+                    # 其它进程重建了缓存, 从头读取
+                    dim = self._dim
+                    self._reset_state()
+                    self._dim = dim
+                f.seek(self._index_offset)
+                data = f.read()
+            # 只处理完整的行, 写入中断时最后一行可能不完整
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("utf-8").splitlines():
+                parts = line.split("\t")
+                if len(parts) != 2 or not parts[1].isdigit():
+                    continue
+                row = int(parts[1])
+                self._index[parts[0]] = row
+                self._rows = max(self._rows, row + 1)
+            self._index_offset += end
+        if not self._vector_file.exists():
+            raise FileNotFoundError(f"向量文件不存在: {self._vector_file}")
+        capacity = self._vector_file.stat().st_size // (self._dim * 4)
+        if self._vectors is None or capacity > self._vectors.shape[0]:
+            self._vectors = np.memmap(self._vector_file, dtype=np.float32, mode="r+", shape=(capacity, self._dim)) if capacity else None
+
+    def _init_storage(self, dim: int):
+        """第一次写入时根据向量维度创建存储文件, 调用方持有文件锁, 其它进程已创建时不会执行"""
+        self._vectors = np.memmap(
+            self._vector_file, dtype=np.float32, mode="w+", shape=(self.INITIAL_CAPACITY, dim)
+        )
+        self._index_file.unlink(missing_ok=True)
+        # meta.json 最后写入, 其它进程看到它时向量文件已经存在
+        self._meta_file.write_text(
+            json.dumps({"model_name": self.model_name, "dim": dim}, ensure_ascii=False), encoding="utf-8"
+        )
+        self._dim = dim
+
+    def _ensure_capacity(self, rows: int):
+        """容量不足时按倍数扩展向量文件, 调用方持有文件锁"""
+        assert self._vectors is not None and self._dim is not None
+        capacity = self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        while capacity < rows:
+            capacity *= 2
+        self._vectors.flush()
+        del self._vectors
+        with open(self._vector_file, "r+b") as f:
+            # 其它进程可能已经扩展得更大, 不能缩小
+            if f.seek(0, 2) < capacity * self._dim * 4:
+                f.truncate(capacity * self._dim * 4)
+        self._vectors = np.memmap(self._vector_file, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """
+        批量查询缓存, 未命中时读取其它进程新追加的索引后再查一次
+
+        Args:
+            keys: 内容哈希列表
+
+        Returns:
+            与 keys 一一对应的向量, 未命中的位置为 None
+        """
+        with self._lock:
+            result = self._lookup(keys)
+            if any(vector is None for vector in result) and self._meta_file.exists():
+                try:
+                    with self._file_lock(shared=True):
+                        self._refresh()
+                except Exception as e:
+                    logger.warning(f"读取向量缓存索引失败: {self.path}, {e}")
+                    return result
+                result = [vector if vector is not None else self._lookup([key])[0] for key, vector in zip(keys, result)]
+        return result
+
+    def _lookup(self, keys: list[str]) -> list[np.ndarray | None]:
+        result: list[np.ndarray | None] = []
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            elif key in self._index and self._vectors is not None and self._index[key] < self._vectors.shape[0]:
+                vector = np.array(self._vectors[self._index[key]])
+                self._remember(key, vector)
+            result.append(vector)
+        return result
+
+    def put_many(self, keys: list[str], vectors: list) -> None:
+        """
+        批量写入缓存, 已存在的 key (包括其它进程写入的) 会被忽略
+
+        Args:
+            keys: 内容哈希列表
+            vectors: 与 keys 一一对应的向量
+        """
+        if not keys:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._dim is None:
+                self._init_storage(matrix.shape[1])
+            assert self._vectors is not None
+            if matrix.shape[1] != self._dim:
+                raise ValueError(f"向量维度不匹配: expected={self._dim}, actual={matrix.shape[1]}")
+            lines = []
+            for key, vector in zip(keys, matrix):
+                if key in self._index:
+                    continue
+                row = self._rows
+                self._ensure_capacity(row + 1)
+                self._vectors[row] = vector
+                self._index[key] = row
+                self._rows += 1
+                self._remember(key, vector)
+                lines.append(f"{key}\t{row}\n")
+            if lines:
+                # 先落盘向量, 再追加索引, 保证索引中的行一定有效
+                self._vectors.flush()
+                with open(self._index_file, "ab") as f:
+                    # 丢弃中断写入留下的不完整行, 避免与新行拼接
+                    if f.tell() > self._index_offset:
+                        f.truncate(self._index_offset)
+                    data = "".join(lines).encode("utf-8")
+                    f.write(data)
+                self._index_offset += len(data)
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """
+    为任意 embedding function 增加持久化缓存, 只有未命中的文本才会交给模型计算
+
+    缓存以文本内容的 uuid (与切片 id 相同的 get_content_based_uuid) 和模型名称作为键
+    """
+
+    def __init__(
+        self,
+        embedding_function: EmbeddingFunction,
+        path: str,
+        model_name: str | None = None,
+        memory_size: int = 10000,
+    ):
+        self.embedding_function = embedding_function
+        self.model_name = model_name or getattr(
+            embedding_function, "model_name", embedding_function.__class__.__name__
+        )
+        self.cache = EmbeddingCache(path, self.model_name, memory_size)
+
+    def warmup(self):
+        """预先加载被包装的 embedding function"""
+        warmup = getattr(self.embedding_function, "warmup", None)
+        if callable(warmup):
+            warmup()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [get_content_based_uuid(text) for text in input]
+        vectors = self.cache.get_many(keys)
+        # 同一批次中重复的文本只计算一次
+        missing: dict[str, str] = {}
+        for key, text, vector in zip(keys, input, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            embeddings = self.embedding_function(list(missing.values()))
+            computed = dict(zip(missing.keys(), np.asarray(embeddings, dtype=np.float32)))
+            self.cache.put_many(list(computed.keys()), list(computed.values()))
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        logger.debug(f"向量缓存: total={len(keys)}, miss={len(missing)}")
+        metrics.inc("embedding_cache_requests_total", len(keys) - len(missing), result="hit")
+        metrics.inc("embedding_cache_requests_total", len(missing), result="miss")
+        return vectors  # type: ignore
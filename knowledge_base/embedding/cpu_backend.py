@@ -0,0 +1,187 @@
+import os
+import threading
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from ..utils import logger
+
+
+class CPUEmbeddingFunction(EmbeddingFunction):
+    """
+    面向 CPU 推理优化的 bge embedding function
+
+    - backend: torch (float32), int8 (torch 动态量化, 只量化 Linear 层) 或 onnx (ONNX Runtime)
+    - 先对全部输入分词, 按 token 长度排序后分批, 每批只填充到批内最长长度, 减少无效计算
+    - max_length 控制截断长度, num_threads 控制算子内并行线程数
+
+    与 BAAIEmbeddingFunction 一样取 [CLS] 向量并归一化, 可以用 compare_embeddings 检查数值是否一致
+
+    Args:
+        model_name: HuggingFace 模型名称或本地路径
+        backend: torch、int8 或 onnx
+        max_length: 最大序列长度, 超出部分截断
+        batch_size: 每次前向计算的文本数量
+        num_threads: 算子内并行线程数, 默认使用全部 CPU 核心
+        onnx_path: onnx 模型文件路径, 文件不存在时会从 model_name 导出
+        pooling: cls 或 mean
+        normalize: 是否对输出做 L2 归一化
+    """
+
+    BACKENDS = ("torch", "int8", "onnx")
+
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-large-zh-v1.5",
+        backend: str = "int8",
+        max_length: int = 512,
+        batch_size: int = 32,
+        num_threads: int | None = None,
+        onnx_path: str | None = None,
+        pooling: str = "cls",
+        normalize: bool = True,
+    ):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"不支持的推理后端: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.onnx_path = onnx_path or os.path.join("./onnx", model_name.replace("/", "_") + ".onnx")
+        self.pooling = pooling
+        self.normalize = normalize
+        self._tokenizer = None
+        self._model = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def warmup(self):
+        """预先加载分词器和模型"""
+        self._load()
+
+    def _load(self):
+        if self._tokenizer is not None:
+            return
+        with self._lock:
+            if self._tokenizer is not None:
+                return
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            if self.backend == "onnx":
+                self._session = self._load_onnx()
+            else:
+                self._model = self._load_torch()
+            self._tokenizer = tokenizer
+            logger.info(
+                f"加载 CPU embedding 模型: {self.model_name}, backend={self.backend}, threads={self.num_threads}"
+            )
+
+    def _load_torch(self):
+        import torch
+        from transformers import AutoModel
+
+        torch.set_num_threads(self.num_threads)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        if self.backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+
+        if not os.path.exists(self.onnx_path):
+            self._export_onnx()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def _export_onnx(self):
+        """将 HuggingFace 模型导出为 onnx, batch 和序列长度为动态维度"""
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        logger.info(f"导出 onnx 模型: {self.onnx_path}")
+        os.makedirs(os.path.dirname(self.onnx_path) or ".", exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        inputs = AutoTokenizer.from_pretrained(self.model_name)(["导出"], return_tensors="pt")
+        names = list(inputs.keys())
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(inputs[name] for name in names),
+                self.onnx_path,
+                input_names=names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+            )
+
+    def _forward(self, batch: dict) -> np.ndarray:
+        """对一个已填充的批次做前向计算, 返回池化后的向量"""
+        mask = batch["attention_mask"]
+        if self._session is not None:
+            feed = {item.name: batch[item.name] for item in self._session.get_inputs() if item.name in batch}
+            hidden = self._session.run(None, feed)[0]
+        else:
+            import torch
+
+            with torch.inference_mode():
+                output = self._model(**{name: torch.from_numpy(value) for name, value in batch.items()})  # type: ignore
+            hidden = output.last_hidden_state.numpy()
+        if self.pooling == "mean":
+            weights = mask[..., None].astype(np.float32)
+            vectors = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        else:
+            vectors = hidden[:, 0]
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+        self._load()
+        assert self._tokenizer is not None
+        encoded = self._tokenizer(list(input), truncation=True, max_length=self.max_length)
+        features = list(encoded.keys())
+        # 按 token 长度排序, 同一批次的长度接近, 填充最少
+        order = sorted(range(len(input)), key=lambda i: len(encoded["input_ids"][i]))
+        result: list[np.ndarray | None] = [None] * len(input)
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            batch = self._tokenizer.pad(
+                {name: [encoded[name][i] for i in indices] for name in features},
+                padding="longest",
+                return_tensors="np",
+            )
+            vectors = self._forward({name: np.asarray(batch[name], dtype=np.int64) for name in features})
+            for i, vector in zip(indices, vectors):
+                result[i] = vector
+        return result  # type: ignore
+
+
+def compare_embeddings(reference: EmbeddingFunction, candidate: EmbeddingFunction, texts: list[str]) -> dict[str, float]:
+    """
+    比较两个 embedding function 在同一批文本上的输出, 用于检查量化或 onnx 后端与原模型的数值差异
+
+    Returns:
+        min_cosine: 对应向量余弦相似度的最小值
+        mean_cosine: 对应向量余弦相似度的平均值
+        max_abs_diff: 归一化后对应分量的最大绝对误差
+    """
+    expected = np.asarray(reference(texts), dtype=np.float32)
+    actual = np.asarray(candidate(texts), dtype=np.float32)
+    expected /= np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual /= np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    cosine = (expected * actual).sum(axis=1)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+    }
@@ -0,0 +1,32 @@
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from ..utils import metrics
+
+
+class MeteredEmbeddingFunction(EmbeddingFunction):
+    """
+    记录 embedding 调用指标的包装: 调用次数与耗时 (embedding_seconds)、批大小 (embedding_batch_size)
+    和文本字符数 (embedding_characters_total, 不依赖具体模型的分词器, 作为 token 数的近似)
+
+    指标关闭时只多一次布尔判断
+    """
+
+    def __init__(self, embedding_function: EmbeddingFunction):
+        self.embedding_function = embedding_function
+        # 与被包装对象保持相同的模型名称, 向量缓存的目录不会因为包装而改变
+        self.model_name = getattr(embedding_function, "model_name", embedding_function.__class__.__name__)
+
+    def warmup(self):
+        """预先加载被包装的 embedding function"""
+        warmup = getattr(self.embedding_function, "warmup", None)
+        if callable(warmup):
+            warmup()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not metrics.enabled:
+            return self.embedding_function(input)
+        model = self.model_name
+        metrics.observe("embedding_batch_size", len(input), model=model)
+        metrics.inc("embedding_characters_total", sum(len(text) for text in input), model=model)
+        with metrics.time("embedding_seconds", model=model):
+            return self.embedding_function(input)
@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from ..utils import logger, metrics
+
+
+class MicroBatchingEmbeddingFunction(EmbeddingFunction):
+    """
+    合并并发请求的 embedding 包装, 用于查询侧
+
+    并发的查询各自只有一两条文本, 逐个计算时模型一直在做批大小为 1 的前向计算, 效率最低。
+    调用方把文本放入队列后等待结果, 后台线程收到第一个请求后最多再等待 max_wait_ms,
+    或凑满 max_batch_size 条文本, 然后对合并 (去重) 后的文本做一次批量计算, 再按请求拆分结果
+
+    单线程调用时每次请求会多等待最多 max_wait_ms, 只应在并发查询的场景下开启
+
+    Args:
+        embedding_function: 被包装的 embedding function
+        max_wait_ms: 收到第一个请求后等待更多请求的最长时间 (毫秒)
+        max_batch_size: 一次批量计算的最大文本数量, 单个请求超过该数量时单独计算
+    """
+
+    def __init__(self, embedding_function: EmbeddingFunction, max_wait_ms: float = 5.0, max_batch_size: int = 64):
+        self.embedding_function = embedding_function
+        # 与被包装对象保持相同的模型名称, 向量缓存的目录不会因为包装而改变
+        self.model_name = getattr(embedding_function, "model_name", embedding_function.__class__.__name__)
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue: queue.Queue[tuple[list[str], Future] | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def warmup(self):
+        """预先加载被包装的 embedding function 并启动后台线程"""
+        warmup = getattr(self.embedding_function, "warmup", None)
+        if callable(warmup):
+            warmup()
+        with self._lock:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        """调用方需持有 _lock, 与后台线程退出时的清理互斥, 保证入队的请求总有线程处理"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """停止后台线程, 已提交的请求会先处理完"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        if not texts:
+            return []
+        future: Future = Future()
+        with self._lock:
+            self._ensure_started()
+            self._queue.put((texts, future))
+        return future.result()
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException:
+            # 后台线程意外退出: 重置 _thread 使下一次调用重新启动线程, 队列中剩余的请求直接失败
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                    error = RuntimeError("embedding 批处理线程已退出")
+                    while True:
+                        try:
+                            request = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if request is not None:
+                            self._fail([request], error)
+            raise
+
+    def _loop(self):
+        pending: tuple[list[str], Future] | None = None
+        while True:
+            first = pending or self._queue.get()
+            pending = None
+            if first is None:
+                return
+            requests = [first]
+            try:
+                size = len(first[0])
+                deadline = time.monotonic() + self.max_wait
+                stopping = False
+                while size < self.max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if request is None:
+                        stopping = True
+                        break
+                    if size + len(request[0]) > self.max_batch_size:
+                        # 放到下一批, 保证每批不超过 max_batch_size (单个超大请求除外)
+                        pending = request
+                        break
+                    requests.append(request)
+                    size += len(request[0])
+                self._embed(requests)
+                if stopping:
+                    if pending is not None:
+                        self._embed([pending])
+                    return
+            except Exception as e:
+                # 任何异常都不能让调用方一直等待
+                logger.exception(f"embedding 批处理失败: {e}")
+                self._fail(requests + ([pending] if pending is not None else []), e)
+                pending = None
+            except BaseException as e:
+                self._fail(requests + ([pending] if pending is not None else []), e)
+                raise
+
+    def _embed(self, requests: list[tuple[list[str], Future]]):
+        """对一批请求做一次批量计算, 相同的文本只计算一次"""
+        texts = list(dict.fromkeys(text for request_texts, _ in requests for text in request_texts))
+        metrics.observe("embedding_microbatch_requests", len(requests), model=self.model_name)
+        try:
+            embeddings = list(self.embedding_function(texts))
+            if len(embeddings) != len(texts):
+                raise ValueError(f"embedding function 返回了 {len(embeddings)} 个向量, 输入为 {len(texts)} 条文本")
+            by_text = dict(zip(texts, embeddings))
+            results = [[by_text[text] for text in request_texts] for request_texts, _ in requests]
+        except Exception as e:
+            logger.exception(f"批量计算 embedding 失败: {e}")
+            self._fail(requests, e)
+            return
+        for (_, future), result in zip(requests, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(requests: list[tuple[list[str], Future]], error: BaseException):
+        for _, future in requests:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,295 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from ..utils import logger
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """在工作进程中连接共享内存, 生命周期由主进程管理"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    except TypeError:
+        # Python 3.13 之前没有 track 参数, 子进程与主进程共用同一个 resource_tracker, 重复注册不影响主进程释放
+        return shared_memory.SharedMemory(name=name)
+
+
+def _write_texts(buf, encoded: list[bytes]):
+    """按 [数量][各文本字节数][UTF-8 内容] 的格式把一批文本写入共享内存"""
+    header = np.array([len(encoded), *(len(text) for text in encoded)], dtype=np.int64).tobytes()
+    payload = header + b"".join(encoded)
+    buf[:len(payload)] = payload
+
+
+def _read_texts(buf) -> list[str]:
+    """_write_texts 的逆操作"""
+    count = int(np.frombuffer(buf, dtype=np.int64, count=1)[0])
+    lengths = np.frombuffer(buf, dtype=np.int64, count=count, offset=8).tolist()
+    offset = 8 * (count + 1)
+    texts = []
+    for length in lengths:
+        texts.append(bytes(buf[offset:offset + length]).decode("utf-8"))
+        offset += length
+    return texts
+
+
+def _worker_main(factory, task_queue, result_queue, slot_names: list[str], batch_size: int, dim: int):
+    """
+    工作进程入口: 加载一份模型, 循环处理任务
+
+    输入文本从任务指定的输入共享内存中读取 (槽位扩容后名称会变化, 按名称重新连接), 结果写入对应的输出槽位
+    """
+    embedding_function = factory()
+    warmup = getattr(embedding_function, "warmup", None)
+    if callable(warmup):
+        warmup()
+    slots = [_attach_shared_memory(name) for name in slot_names]
+    inputs: dict[int, shared_memory.SharedMemory] = {}
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            task_id, slot, input_name = task
+            size = 0
+            try:
+                shm = inputs.get(slot)
+                if shm is None or shm.name != input_name:
+                    if shm is not None:
+                        shm.close()
+                    shm = inputs[slot] = _attach_shared_memory(input_name)
+                texts = _read_texts(shm.buf)
+                size = len(texts)
+                vectors = np.asarray(embedding_function(texts), dtype=np.float32)
+                if vectors.shape != (size, dim):
+                    raise ValueError(f"向量形状不匹配: expected={(size, dim)}, actual={vectors.shape}")
+                np.ndarray((batch_size, dim), dtype=np.float32, buffer=slots[slot].buf)[:size] = vectors
+                result_queue.put((task_id, size, None))
+            except Exception as e:
+                result_queue.put((task_id, 0, f"{type(e).__name__}: {e}"))
+    finally:
+        for shm in [*slots, *inputs.values()]:
+            shm.close()
+
+
+class EmbeddingWorkerPool(EmbeddingFunction):
+    """
+    多进程 embedding 服务, 每个工作进程持有一份模型, 可以直接作为 embedding_function 使用
+
+    - 输入按 batch_size 切分为任务, 分配给在途任务最少的工作进程, 多个线程可以同时调用, 共享同一个进程池
+    - 输入文本和结果都通过共享内存槽位传递, 队列中只有任务编号和槽位, 避免序列化文本和大数组;
+      槽位数量 (max_pending) 即在途任务上限, 槽位用尽时调用方阻塞等待, 形成背压
+    - 工作进程异常退出时, 只有分配给它的任务失败, 并启动新的工作进程替换它
+    - close() 会等待在途任务完成后退出工作进程, 也可以使用 with 语句
+
+    Args:
+        factory: 在工作进程中创建 embedding function 的可调用对象, 需要可以被 pickle
+            (如 functools.partial(CPUEmbeddingFunction, backend="int8", num_threads=2))
+        dim: 向量维度, bge-large-zh 为 1024
+        workers: 工作进程数量, 默认使用全部 CPU 核心
+        batch_size: 每个任务的文本数量
+        max_pending: 在途任务上限, 默认为 workers * 2
+        start_method: 进程启动方式, 默认 spawn, 避免子进程继承已加载的模型和线程
+    """
+
+    # 输入槽位的初始大小按每条文本的字节数估计, 放不下时扩容
+    INPUT_BYTES_PER_TEXT = 1024
+    # 检查工作进程是否存活的间隔
+    CHECK_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        factory: Callable[[], EmbeddingFunction],
+        dim: int = 1024,
+        workers: int | None = None,
+        batch_size: int = 64,
+        max_pending: int | None = None,
+        start_method: str = "spawn",
+    ):
+        self.factory = factory
+        self.dim = dim
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_pending = max_pending or self.workers * 2
+        self._context = mp.get_context(start_method)
+        self._slots = [
+            shared_memory.SharedMemory(create=True, size=batch_size * dim * 4) for _ in range(self.max_pending)
+        ]
+        self._inputs = [
+            shared_memory.SharedMemory(create=True, size=8 * (batch_size + 1) + batch_size * self.INPUT_BYTES_PER_TEXT)
+            for _ in range(self.max_pending)
+        ]
+        self._free_slots: queue.Queue[int] = queue.Queue()
+        for slot in range(self.max_pending):
+            self._free_slots.put(slot)
+        self._result_queue = self._context.Queue()
+        # task_id -> (future, 槽位, 工作进程序号)
+        self._tasks: dict[int, tuple[Future, int, int]] = {}
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._closed = False
+        # 每个工作进程使用独立的任务队列, 才能知道进程退出时哪些任务没有完成
+        self._processes: list = [None] * self.workers
+        self._task_queues: list = [None] * self.workers
+        self._in_flight: list[set[int]] = [set() for _ in range(self.workers)]
+        for index in range(self.workers):
+            self._start_worker(index)
+        self._collector = threading.Thread(target=self._collect, name="embedding-pool-collector", daemon=True)
+        self._collector.start()
+        logger.info(f"启动 embedding 工作进程: {self.workers}, batch_size={batch_size}, max_pending={self.max_pending}")
+
+    def _start_worker(self, index: int):
+        """启动 (或替换) 第 index 个工作进程, 替换时使用新的任务队列, 旧队列中的任务已经失败"""
+        old_queue = self._task_queues[index]
+        if old_queue is not None:
+            old_queue.cancel_join_thread()
+            old_queue.close()
+        task_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.factory, task_queue, self._result_queue, [shm.name for shm in self._slots], self.batch_size, self.dim),
+            name=f"embedding-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._task_queues[index] = task_queue
+        self._processes[index] = process
+
+    def _collect(self):
+        """读取工作进程的结果, 从共享内存中复制向量并释放槽位; 定期检查工作进程是否存活"""
+        checked_at = time.monotonic()
+        while True:
+            try:
+                message = self._result_queue.get(timeout=self.CHECK_INTERVAL)
+            except queue.Empty:
+                if self._closed and not self._tasks:
+                    return
+                message = ()
+            if message is None:
+                return
+            if message:
+                self._complete(*message)
+            if not self._closed and time.monotonic() - checked_at >= self.CHECK_INTERVAL:
+                checked_at = time.monotonic()
+                self._check_workers()
+
+    def _complete(self, task_id: int, size: int, error: str | None):
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task is None:
+                # 任务已经因为工作进程退出而失败, 槽位也已释放
+                return
+            future, slot, index = task
+            self._in_flight[index].discard(task_id)
+        vectors = None
+        if error is None:
+            buffer = np.ndarray((self.batch_size, self.dim), dtype=np.float32, buffer=self._slots[slot].buf)
+            vectors = buffer[:size].copy()
+            del buffer
+        self._free_slots.put(slot)
+        if error is None:
+            future.set_result(vectors)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _check_workers(self):
+        """使已退出的工作进程上的任务失败, 并启动新的工作进程替换它"""
+        failed: list[tuple[Future, int, int]] = []
+        with self._lock:
+            if self._closed:
+                return
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                task_ids, self._in_flight[index] = self._in_flight[index], set()
+                failed.extend(self._tasks.pop(task_id) for task_id in task_ids if task_id in self._tasks)
+                logger.error(f"embedding 工作进程异常退出, 重新启动: {process.name}, exitcode={process.exitcode}, 失败任务数: {len(task_ids)}")
+                self._start_worker(index)
+        for future, slot, _ in failed:
+            self._free_slots.put(slot)
+            if not future.done():
+                future.set_exception(RuntimeError("embedding 工作进程异常退出"))
+
+    def _fail_all(self, error: Exception):
+        with self._lock:
+            tasks, self._tasks = self._tasks, {}
+            for in_flight in self._in_flight:
+                in_flight.clear()
+        for future, _, _ in tasks.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _write_input(self, slot: int, texts: list[str]) -> str:
+        """把文本写入槽位的输入共享内存, 放不下时换成更大的共享内存, 返回其名称"""
+        encoded = [text.encode("utf-8") for text in texts]
+        size = 8 * (len(encoded) + 1) + sum(len(text) for text in encoded)
+        shm = self._inputs[slot]
+        if size > shm.size:
+            # 已连接旧共享内存的工作进程按名称发现变化后重新连接, unlink 不影响已有的映射
+            shm.close()
+            shm.unlink()
+            shm = self._inputs[slot] = shared_memory.SharedMemory(create=True, size=max(size, shm.size * 2))
+        _write_texts(shm.buf, encoded)
+        return shm.name
+
+    def _submit(self, texts: list[str]) -> Future:
+        # 获取槽位, 在途任务达到上限时阻塞
+        slot = self._free_slots.get()
+        try:
+            input_name = self._write_input(slot, texts)
+        except BaseException:
+            self._free_slots.put(slot)
+            raise
+        future: Future = Future()
+        task_id = next(self._task_ids)
+        with self._lock:
+            index = min(range(self.workers), key=lambda i: len(self._in_flight[i]))
+            self._tasks[task_id] = (future, slot, index)
+            self._in_flight[index].add(task_id)
+            self._task_queues[index].put((task_id, slot, input_name))
+        return future
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self._closed:
+            raise RuntimeError("embedding 工作进程池已关闭")
+        texts = list(input)
+        futures = [self._submit(texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+        vectors = [vector for future in futures for vector in future.result()]
+        return vectors  # type: ignore
+
+    def close(self, timeout: float | None = 30.0):
+        """等待在途任务完成后关闭工作进程并释放共享内存"""
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+            for task_queue in self._task_queues:
+                task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"工作进程未能在 {timeout}s 内退出, 强制终止: {process.name}")
+                process.terminate()
+        # 工作进程已退出, 结果队列中剩余的结果处理完后收集线程结束
+        self._result_queue.put(None)
+        self._collector.join(timeout)
+        self._fail_all(RuntimeError("embedding 工作进程池已关闭"))
+        for shm in [*self._slots, *self._inputs]:
+            shm.close()
+            shm.unlink()
+        logger.info("embedding 工作进程已停止")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
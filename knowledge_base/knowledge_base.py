@@ -1,45 +1,75 @@
-from pathlib import Path
-import uuid
-
-from .config import mysql_config, chromadb_config
-from .storage import MySQLClient, ChromaDBClient, SyncManager
-from .utils import load_data, logger
+from .config import mysql_config, chromadb_config, sync_config, keyword_index_config, test_generator_config, metrics_config, import_config
+from .storage import MySQLClient, VectorStore, SyncManager, SyncWorker, KeywordIndex, FileImporter, create_vector_store
+from .utils import logger, metrics
 from .storage import Question, KnowledgePoint
 from .test_generator import TestGenerator
 
 class KnowledgeBase:
-    def __init__(self, mysql_config: dict = mysql_config, chromadb_config: dict = chromadb_config):
+    def __init__(
+        self,
+        mysql_config: dict = mysql_config,
+        chromadb_config: dict = chromadb_config,
+        sync_config: dict = sync_config,
+        test_generator_config: dict = test_generator_config,
+        keyword_index_config: dict = keyword_index_config,
+        metrics_config: dict = metrics_config,
+        import_config: dict = import_config,
+    ):
+        # 指标是进程内全局的, 在创建各组件之前开启, 才能记录初始化阶段的 MySQL 查询和 embedding 调用
+        self.metrics = metrics
+        if metrics_config.get("enabled", False):
+            metrics.enable()
         self.chromadb_config = chromadb_config
         self.mysql_client = MySQLClient(mysql_config)
-        self.chromadb_client = ChromaDBClient(chromadb_config)
-        self.sync_manager = SyncManager(self.mysql_client, self.chromadb_client)
-        self.test_generator = TestGenerator(self.mysql_client, self.chromadb_client)
+        # 向量存储后端由 chromadb_config 中的 backend 决定, chromadb_client 保留为旧名称
+        self.vector_store: VectorStore = create_vector_store(chromadb_config)
+        self.chromadb_client = self.vector_store
+        if self.vector_store.query_cache is not None:
+            # 版本号保存在 MySQL 中, 任一进程同步变更后所有进程的查询结果缓存都会失效
+            self.vector_store.query_cache.share_generations(self.mysql_client)
+        self.keyword_index: KeywordIndex | None = None
+        if keyword_index_config.get("enabled", False):
+            # 第一次检索 (或 warmup) 时才从 MySQL 构建, 之后按 question_changes 增量刷新
+            self.keyword_index = KeywordIndex(
+                k1=keyword_index_config.get("k1", 1.5),
+                b=keyword_index_config.get("b", 0.75),
+                mysql_client=self.mysql_client,
+                refresh_interval=keyword_index_config.get("refresh_interval", 1.0),
+                change_retention=keyword_index_config.get("change_retention", 86400),
+            )
+        sync_mode = sync_config.get("mode", "commit")
+        self.sync_manager = SyncManager(self.mysql_client, self.vector_store, mode=sync_mode, keyword_index=self.keyword_index)
+        self.sync_worker: SyncWorker | None = None
+        if sync_mode == "outbox":
+            self.sync_worker = SyncWorker(self.mysql_client, self.vector_store, sync_config, keyword_index=self.keyword_index)
+            self.sync_worker.start()
+        self.importer = FileImporter(self.mysql_client, self.sync_manager, import_config)
+        self.test_generator = TestGenerator(self.mysql_client, self.vector_store, test_generator_config, keyword_index=self.keyword_index)
+
+    def warmup(self):
+        """预先加载 embedding 模型和分词器、打开集合、构建关键词索引并创建 LLM 客户端, 避免第一个请求承担初始化开销"""
+        self.vector_store.warmup()
+        if self.keyword_index is not None:
+            self.keyword_index.refresh()
+        self.test_generator.keyword_question_finder.extractor.warmup()
+        logger.info("KnowledgeBase warmup 完成")
+
+    def close(self):
+        """停止后台同步线程并关闭向量存储"""
+        if self.sync_worker is not None:
+            self.sync_worker.stop()
+        self.vector_store.close()
     
     def save_questions_from_file(self, file_path: str):
-        """从文件中添加试题到 MySQL"""
+        """从文件中流式导入试题到 MySQL, 每批提交后 SyncManager 会将插入的数据同步到向量存储"""
         try:
-            df = load_data(Path(file_path))
-            # 只保留Question模型中定义的字段，忽略多余字段
-            question_fields = {col.name for col in Question.__table__.columns}
-            questions = [
-                Question(**{k: v for k, v in row.items() if k in question_fields}, uuid=str(uuid.uuid4()))
-                for row in df.to_dict(orient="records")
-            ]
-            self.mysql_client.save_questions(questions)
-            logger.info(f"Saved {len(questions)} questions to MySQL")
+            self.importer.import_file("questions", file_path)
         except Exception as e:
             logger.exception(f"Failed to save questions from file: {e}")
     
     def save_knowledge_points_from_file(self, file_path: str):
-        """从文件中添加知识点到 MySQL"""
+        """从文件中流式导入知识点到 MySQL"""
         try:
-            df = load_data(Path(file_path))
-            knowledge_point_fields = {col.name for col in KnowledgePoint.__table__.columns}
-            knowledge_points = [
-                KnowledgePoint(**{k: v for k, v in row.items() if k in knowledge_point_fields}, uuid=str(uuid.uuid4()))
-                for row in df.to_dict(orient="records")
-            ]
-            self.mysql_client.save_knowledge_points(knowledge_points)
-            logger.info(f"Saved {len(knowledge_points)} knowledge points to MySQL")
+            self.importer.import_file("knowledge_points", file_path)
         except Exception as e:
             logger.exception(f"Failed to save knowledge points from file: {e}")
@@ -1,6 +1,14 @@
-from .mysql_client import MySQLClient
+from .mysql_client import MySQLClient, fetch_records_by_uuids
+from .async_mysql_client import AsyncMySQLClient, afetch_records_by_uuids
+from .vector_store import VectorStore, create_vector_store
 from .chromadb_client import ChromaDBClient
+from .numpy_store import NumpyVectorStore
 from .sync_manager import SyncManager
+from .sync_worker import SyncWorker
+from .importer import FileImporter
+from .compressed_index import CompressedVectorIndex
+from .query_cache import QueryCache
+from .keyword_index import KeywordIndex, reciprocal_rank_fusion
 from .models import *
 
-__all__ = ["MySQLClient", "ChromaDBClient", "SyncManager"]
\ No newline at end of file
+__all__ = ["MySQLClient", "fetch_records_by_uuids", "AsyncMySQLClient", "afetch_records_by_uuids", "VectorStore", "create_vector_store", "ChromaDBClient", "NumpyVectorStore", "SyncManager", "SyncWorker", "FileImporter", "KeywordIndex", "reciprocal_rank_fusion", "CompressedVectorIndex", "QueryCache"]
\ No newline at end of file
@@ -0,0 +1,81 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .mysql_client import MySQLClient, Record, UUID_CHUNK_SIZE
+from ..utils import logger
+
+# 同步驱动 -> 对应的异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+async def afetch_records_by_uuids(session: AsyncSession, table: type[Record], uuids: List[str], chunk_size: int = UUID_CHUNK_SIZE) -> List[Record]:
+    """fetch_records_by_uuids 的异步版本, 按 uuids 的顺序返回记录"""
+    uuids = list(dict.fromkeys(uuids))
+    records = {}
+    for start in range(0, len(uuids), chunk_size):
+        statement = select(table).where(table.uuid.in_(uuids[start:start + chunk_size]))
+        for record in (await session.execute(statement)).scalars():
+            records[record.uuid] = record
+    return [records[uuid] for uuid in uuids if uuid in records]
+
+class AsyncMySQLClient:
+    """
+    基于 SQLAlchemy asyncio 的 MySQL 客户端, 等待数据库时不占用线程, 用于 AsyncKnowledgeBase 的读取路径
+
+    与 MySQLClient 使用相同的配置和连接池参数, 驱动替换为 aiomysql (SQLite 为 aiosqlite),
+    也可以通过 async_url 直接指定; 表结构由 MySQLClient 创建, 写入仍然通过 MySQLClient 以便触发同步事件
+    """
+
+    def __init__(self, config: dict):
+        user = config.get("user")
+        password = config.get("password")
+        host = config.get("host")
+        port = config.get("port")
+        database = config.get("database")
+        url = config.get("async_url") or self._async_url(
+            config.get("url") or f'mysql+mysqlconnector://{user}:{password}@{host}:{port}/{database}'
+        )
+        self.engine = create_async_engine(url, **MySQLClient._pool_options(url, config))
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    @staticmethod
+    def _async_url(url: str) -> str:
+        parsed = make_url(url)
+        drivername = ASYNC_DRIVERS.get(parsed.drivername)
+        if drivername is None:
+            logger.warning(f"未知的数据库驱动, 按异步驱动使用: {parsed.drivername}")
+            return url
+        return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+    @asynccontextmanager
+    async def session_scope(self) -> AsyncIterator[AsyncSession]:
+        """MySQLClient.session_scope 的异步版本, AsyncSession 不能在并发的协程之间共享"""
+        session = self.Session()
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def get_records_by_uuids(self, table: type[Record], uuids: List[str], session: AsyncSession | None = None) -> List[Record]:
+        """按 uuid 批量读取记录, 结果保持 uuids 的顺序"""
+        if session is not None:
+            return await afetch_records_by_uuids(session, table, uuids)
+        async with self.session_scope() as session:
+            return await afetch_records_by_uuids(session, table, uuids)
+
+    async def dispose(self):
+        """关闭连接池中的所有连接"""
+        await self.engine.dispose()
@@ -1,34 +1,44 @@
+import os
+import threading
 import chromadb
-from typing import Optional, Union
-from chromadb.api.types import (
-    Embedding,
-    PyEmbedding,
-    OneOrMany,
-    Document,
-    Image,
-    URI,
-    ID,
-    Where,
-    WhereDocument,
-    Include,
-)
+from typing import Iterator
+from chromadb.api.types import Include
 from chromadb.config import Settings
 
-from ..utils import get_content_based_uuid, logger
-from .text_sliptter import CharacterTextSplitter
+from ..utils import logger, metrics
+from .compressed_index import CompressedVectorIndex
+from .vector_store import VectorStore
 
 
-class ChromaDBClient:
+class ChromaDBClient(VectorStore):
+    """
+    基于 ChromaDB 的向量存储
+
+    启用 compressed_index 时 ChromaDB 只保存切片的文档和元数据, 写入 1 维的占位向量 (HNSW 图也只有最少的邻居),
+    全精度向量只保存在压缩索引的 memmap 文件中, 常驻内存的只有 int8 编码; 所有向量检索都由压缩索引完成,
+    ids / where_document / 索引中没有的 where 字段先在 ChromaDB 中过滤出候选切片 id 再交给压缩索引
+    """
+
+    backend = "chromadb"
+    # 压缩模式下集合的 HNSW 参数, 占位向量完全相同, 图只需要能完成插入
+    PLACEHOLDER_HNSW = {"hnsw:M": 4, "hnsw:construction_ef": 8, "hnsw:search_ef": 8}
+
     def __init__(self, config: dict):
-        self.config = config
+        super().__init__(config)
         self.allow_reset = config.get("allow_reset", False)
         self.client = chromadb.PersistentClient(
             path=config["path"], settings=Settings(allow_reset=self.allow_reset)
         )
-        self.embedding_function = config.get("embedding_function", None)
-        self.text_splitter = config.get("text_splitter", CharacterTextSplitter())
-        self.max_length = config.get("max_length", 10)
-        self.overlap = config.get("overlap", 2)
+        # 可选的压缩向量索引, 启用后查询在 int8 编码上检索并用全精度向量重排, ChromaDB 中只有占位向量
+        self.compressed_index_config = config.get("compressed_index", None)
+        if self.compressed_index_config is not None and self.embedding_function is None:
+            logger.warning("压缩向量索引需要自定义 embedding_function, 已关闭")
+            self.compressed_index_config = None
+        self._compressed_indexes: dict[str, CompressedVectorIndex] = {}
+        # 集合 -> 写入 ChromaDB 的占位向量维度, 压缩模式之前创建的集合仍然是模型的维度
+        self._placeholder_dims: dict[str, int] = {}
+        # 构建压缩索引和写入 (ChromaDB 与压缩索引) 互斥, 构建期间写入的切片不会遗漏
+        self._compressed_lock = threading.RLock()
         self._create_collections(config["collections"])
 
     def _is_collection_exists(self, collection_name: str):
@@ -64,7 +74,9 @@ class ChromaDBClient:
                     f"创建集合: {collection_name} 使用自定义 embedding_function: {self.embedding_function}"
                 )
                 self.client.create_collection(
-                    name=collection_name, embedding_function=self.embedding_function
+                    name=collection_name,
+                    embedding_function=self.embedding_function,
+                    metadata=self.PLACEHOLDER_HNSW if self.compressed_index_config is not None else None,
                 )
             else:
                 logger.info(f"创建集合: {collection_name} 使用默认 embedding_function")
@@ -85,135 +97,247 @@ class ChromaDBClient:
         )
         return collection
 
-    def _add_document(self, collection_name: str, document: str, metadata: dict):
+    def _placeholder_dim(self, collection_name: str, collection) -> int:
+        """压缩模式下写入 ChromaDB 的占位向量维度: 空集合为 1, 已有数据时与集合中的向量一致"""
+        dim = self._placeholder_dims.get(collection_name)
+        if dim is None:
+            page = collection.get(limit=1, include=["embeddings"])
+            dim = len(page["embeddings"][0]) if len(page["ids"]) > 0 else 1  # type: ignore
+            if dim > 1:
+                logger.warning(f"集合: {collection_name} 中保存着全精度向量, 重置并重新同步后才能减少内存")
+            self._placeholder_dims[collection_name] = dim
+        return dim
+
+    def _add_documents(self, collection_name: str, documents: list[tuple[str, dict]]):
         """
-        添加文档, 会先进行文本分割, 然后添加到集合中
+        批量添加文档, 先对所有文档进行文本分割, 然后按 batch_size 分批添加到集合中
 
         Args:
             collection_name: 集合名称
-            document: 文档
-            metadata: 文档元数据
+            documents: (文档, 文档元数据) 列表
         """
-        chunks = self.text_splitter.split(document, self.max_length, self.overlap)
+        ids, chunks, metadatas = self._build_chunks(documents)
+        if not ids:
+            return
+        metrics.inc("vector_store_chunks_total", len(ids), backend=self.backend, collection=collection_name)
         collection = self._get_collection_with_embedding_function(collection_name)
-        for chunk in chunks:
-            chunk_uuid = get_content_based_uuid(chunk)
-            collection.add(ids=[chunk_uuid], documents=[chunk], metadatas=[metadata])
-
-    def add_question(self, data: dict) -> None:
-        try:
-            self._add_document("questions", data["question"], data)
-            self._add_document("questions", data["answer"], data)
-            options = data.get("options", None)
-            if options is not None:
-                self._add_document("questions", data["options"], data)
-        except Exception as e:
-            logger.exception(f"Failed to add question: {e}")
-            raise e
-
-    def add_knowledge_point(self, data: dict) -> None:
-        try:
-            self._add_document("knowledge_points", data["document"], data)
-        except Exception as e:
-            logger.exception(f"Failed to add knowledge point: {e}")
-            raise e
-
-    def _extract_uuid_from(self, query_result) -> set:
-        """从查询结果中提取 metadatas 里的 uuid 列表"""
-        ids = query_result["ids"][0]
-        metadatas = query_result["metadatas"][0]
-
-        if len(ids) != len(metadatas):
-            raise ValueError("ids 和 metadatas 的长度不匹配")
+        if self.compressed_index_config is None:
+            for start in range(0, len(ids), self.batch_size):
+                end = start + self.batch_size
+                collection.add(ids=ids[start:end], documents=chunks[start:end], metadatas=metadatas[start:end])
+        else:
+            # 全精度向量只写入压缩索引, ChromaDB 中写入占位向量; 先确保索引已构建, 否则向量会丢失
+            index = self.get_compressed_index(collection_name)
+            assert index is not None
+            placeholder = [0.0] * self._placeholder_dim(collection_name, collection)
+            for start in range(0, len(ids), self.batch_size):
+                end = start + self.batch_size
+                embeddings = self.embedding_function(chunks[start:end])  # type: ignore
+                with self._compressed_lock:
+                    collection.add(
+                        ids=ids[start:end],
+                        documents=chunks[start:end],
+                        metadatas=metadatas[start:end],
+                        embeddings=[placeholder] * len(ids[start:end]),
+                    )
+                    index.add(ids[start:end], embeddings, metadatas[start:end])
+            # 切片数每翻一倍重新调整 rerank_factor, 新建的集合边写入边增长时召回率也能达到 recall_target
+            if index.needs_tuning():
+                index.tune(k=self.compressed_index_config.get("tune_k", 10))
+        logger.debug(f"批量添加到集合: {collection_name}, 文档数: {len(documents)}, 切片数: {len(ids)}")
+
+    def get_content_hashes(self, collection_name: str, uuids: list[str]) -> dict[str, str | None]:
+        """
+        批量获取已入库记录的内容哈希
 
-        uuid_list = [meta.get("uuid") for meta in metadatas]
+        Args:
+            collection_name: 集合名称
+            uuids: 原始 uuid 列表
 
-        return set(uuid_list)
+        Returns:
+            uuid -> 内容哈希, 不在集合中的 uuid 不会出现在结果中, 旧数据没有哈希时为 None
+        """
+        collection = self._get_collection_with_embedding_function(collection_name)
+        hashes: dict[str, str | None] = {}
+        for start in range(0, len(uuids), self.FILTER_BATCH_SIZE):
+            batch = uuids[start:start + self.FILTER_BATCH_SIZE]
+            result = collection.get(where={"uuid": {"$in": batch}}, include=["metadatas"])
+            for metadata in result["metadatas"] or []:
+                hashes[str(metadata["uuid"])] = metadata.get("content_hash")  # type: ignore
+        return hashes
+
+    def iter_uuids(self, collection_name: str, page_size: int = 1000) -> Iterator[str]:
+        """
+        分页遍历集合中的所有原始 uuid (每个 uuid 只返回一次)
 
-    def query_uuid(
-        self,
-        collection_name: str,
-        query_embeddings: Optional[
-            Union[
-                OneOrMany[Embedding],
-                OneOrMany[PyEmbedding],
-            ]
-        ] = None,
-        query_texts: Optional[OneOrMany[Document]] = None,
-        query_images: Optional[OneOrMany[Image]] = None,
-        query_uris: Optional[OneOrMany[URI]] = None,
-        ids: Optional[OneOrMany[ID]] = None,
-        n_results: int = 10,
-        where: Optional[Where] = None,
-        where_document: Optional[WhereDocument] = None,
-        include: Include = [
-            "metadatas",
-            "documents",
-            "distances",
-        ],
-    ) -> list[str]:
+        Args:
+            collection_name: 集合名称
+            page_size: 每页读取的切片数量
+        """
+        collection = self._get_collection_with_embedding_function(collection_name)
+        seen = set()
+        offset = 0
+        while True:
+            result = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            metadatas = result["metadatas"] or []
+            for metadata in metadatas:
+                uuid = str(metadata.get("uuid"))
+                if uuid not in seen:
+                    seen.add(uuid)
+                    yield uuid
+            if len(metadatas) < page_size:
+                return
+            offset += page_size
+
+    def get_compressed_index(self, collection_name: str) -> CompressedVectorIndex | None:
         """
-        查询文档, 在 chromadb 原生的 query 基础上, 添加了对 metadata 中 uuid 的提取
+        获取集合的压缩向量索引, 第一次调用时加载已保存的索引并与 ChromaDB 对齐, 没有保存的索引时从 ChromaDB 构建
+
+        Returns:
+            未启用压缩索引时返回 None
         """
+        if self.compressed_index_config is None:
+            return None
+        index = self._compressed_indexes.get(collection_name)
+        if index is not None:
+            return index
+        with self._compressed_lock:
+            index = self._compressed_indexes.get(collection_name)
+            if index is None:
+                index = self._build_compressed_index(collection_name)
+                self._compressed_indexes[collection_name] = index
+        return index
+
+    def _build_compressed_index(self, collection_name: str, page_size: int = 1000) -> CompressedVectorIndex:
+        """调用方需持有 _compressed_lock"""
+        config = dict(self.compressed_index_config)  # type: ignore
+        path = os.path.join(config.pop("path", "./compressed_index"), collection_name)
+        config.pop("tune_k", None)
+        index = CompressedVectorIndex(path, **config)
         collection = self._get_collection_with_embedding_function(collection_name)
-        result = collection.query(
-            query_embeddings=query_embeddings,
-            query_texts=query_texts,
-            query_images=query_images,
-            query_uris=query_uris,
-            ids=ids,
-            n_results=n_results
-            + 100,  # FIXME: 这里加 100 是为了避免查询结果不足, 需要优化
-            where=where,
-            where_document=where_document,
-            include=include,
+        if index.load():
+            self._sync_compressed_index(collection, index, page_size)
+        else:
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=offset)
+                if len(page["ids"]) > 0:
+                    index.add(page["ids"], self._page_embeddings(page), page["metadatas"])  # type: ignore
+                if len(page["ids"]) < page_size:
+                    break
+                offset += page_size
+            index.tune(k=self.compressed_index_config.get("tune_k", 10))  # type: ignore
+        index.save()
+        usage = index.memory_usage()
+        logger.info(
+            f"压缩向量索引就绪: {collection_name}, 切片数: {len(index)}, "
+            f"索引常驻内存: {usage['resident']} 字节, 全精度向量文件: {usage['full_precision']} 字节"
         )
-        uuids = list(self._extract_uuid_from(result))
-        return list(set(uuids[:n_results]))
+        return index
+
+    def _sync_compressed_index(self, collection, index: CompressedVectorIndex, page_size: int):
+        """按切片 id 对齐已加载的索引和 ChromaDB: 删除多余的切片, 只读取缺少的切片的向量"""
+        chroma_ids = set()
+        offset = 0
+        while True:
+            page = collection.get(include=[], limit=page_size, offset=offset)
+            chroma_ids.update(page["ids"])
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        index_ids = index.ids()
+        index.delete_ids(list(index_ids - chroma_ids))
+        missing = list(chroma_ids - index_ids)
+        for start in range(0, len(missing), page_size):
+            page = collection.get(ids=missing[start:start + page_size], include=["embeddings", "metadatas", "documents"])
+            index.add(page["ids"], self._page_embeddings(page), page["metadatas"])  # type: ignore
+        logger.info(f"对齐压缩向量索引: {index.path}, 删除: {len(index_ids - chroma_ids)}, 补充: {len(missing)}")
+
+    def _page_embeddings(self, page) -> list:
+        """
+        collection.get 结果中切片的全精度向量: 压缩模式之前写入的集合直接使用 ChromaDB 中的向量,
+        只有占位向量时 (如未保存的索引丢失) 用 embedding_function 重新计算
+        """
+        embeddings = page["embeddings"]
+        if len(embeddings) > 0 and len(embeddings[0]) > 1:
+            return embeddings
+        logger.info(f"ChromaDB 中只有占位向量, 重新计算 {len(page['ids'])} 个切片的向量")
+        return self.embedding_function(page["documents"])  # type: ignore
+
+    def count(self, collection_name: str) -> int:
+        return self._get_collection_with_embedding_function(collection_name).count()
+
+    def _query_chunks(self, collection_name: str, n_results: int, **query):
+        """切片级别的查询, 启用压缩索引时由压缩索引完成, 否则使用 collection.query"""
+        index = self.get_compressed_index(collection_name)
+        if index is None:
+            collection = self._get_collection_with_embedding_function(collection_name)
+            return collection.query(n_results=n_results, include=["metadatas", "distances"], **query)
+        if {"query_images", "query_uris"} & query.keys():
+            raise ValueError("压缩向量索引只支持 query_texts/query_embeddings 查询")
+        query_embeddings = query.get("query_embeddings")
+        if query_embeddings is None:
+            texts = query["query_texts"]
+            query_embeddings = self.embed_queries([texts] if isinstance(texts, str) else list(texts))
+        where = query.get("where")
+        allowed = None
+        if "ids" in query or "where_document" in query or not index.supports(where):
+            # 索引无法判断的条件先在 ChromaDB 的元数据中过滤
+            ids = query.get("ids")
+            collection = self._get_collection_with_embedding_function(collection_name)
+            allowed = collection.get(
+                ids=[ids] if isinstance(ids, str) else ids, where=where, where_document=query.get("where_document"), include=[]
+            )["ids"]
+            where = None
+        return index.query(query_embeddings, n_results, where, ids=allowed)
 
     def query_metadata(
         self,
         collection_name: str,
         uuids: list[str],
         include: Include = ["metadatas", "documents"],
-    ):
+    ) -> dict[str, dict[str, list]]:
         """
-        查询文档, 在 chromadb 原生的 query 基础上, 添加了对 metadata 中 uuid 的提取
-        """
-        collection = self._get_collection_with_embedding_function(collection_name)
-        result = {}
-        for uuid in uuids:
-            result[uuid] = collection.get(where={"uuid": uuid}, include=include)
-        return result
-
-    def update_document(self, collection_name: str, uuid: str, metadata: dict):
-        """
-        更新文档, 根据 uuid 删除文档, 然后重新添加
+        批量查询 uuid 对应的所有切片, 使用 $in 条件分批查询, 每批最多 FILTER_BATCH_SIZE 个 uuid
 
-        Args:
-            collection_name: 集合名称
-            uuid: 文档 uuid
-            metadata: 文档元数据
+        Returns:
+            uuid -> {"ids": [...], include 中的每个字段: [...]}, 没有切片的 uuid 对应空列表
         """
         collection = self._get_collection_with_embedding_function(collection_name)
-        collection.delete(where={"uuid": uuid})
-        if collection_name == "questions":
-            self.add_question(metadata)
-        elif collection_name == "knowledge_points":
-            self.add_knowledge_point(metadata)
-        else:
-            logger.error(f"不支持的集合名称: {collection_name}")
+        fields = ["ids", *include]
+        result: dict[str, dict[str, list]] = {uuid: {field: [] for field in fields} for uuid in uuids}
+        unique_uuids = list(result.keys())
+        for start in range(0, len(unique_uuids), self.FILTER_BATCH_SIZE):
+            batch = unique_uuids[start:start + self.FILTER_BATCH_SIZE]
+            # 需要 metadatas 才能按 uuid 分组
+            chunks = collection.get(
+                where={"uuid": {"$in": batch}}, include=list({*include, "metadatas"})  # type: ignore
+            )
+            for i, metadata in enumerate(chunks["metadatas"] or []):
+                group = result[str(metadata["uuid"])]
+                for field in fields:
+                    group[field].append(chunks[field][i])  # type: ignore
+        return result
 
-    def delete_document(self, collection_name: str, uuid: str):
+    def delete_documents(self, collection_name: str, uuids: list[str]):
         """
-        删除文档, 使用 where 删除 metadata 中指定 uuid 的文档
+        批量删除文档, 使用 $in 条件删除 metadata 中 uuid 属于 uuids 的所有切片
 
         Args:
             collection_name: 集合名称
-            uuid: 原始 uuid
+            uuids: 原始 uuid 列表
         """
+        if not uuids:
+            return
         collection = self._get_collection_with_embedding_function(collection_name)
-        collection.delete(where={"uuid": uuid})
+        with self._compressed_lock, metrics.time("vector_store_seconds", backend=self.backend, op="delete", collection=collection_name):
+            for start in range(0, len(uuids), self.FILTER_BATCH_SIZE):
+                batch = uuids[start:start + self.FILTER_BATCH_SIZE]
+                collection.delete(where={"uuid": {"$in": batch}})
+            index = self._compressed_indexes.get(collection_name)
+            if index is not None:
+                index.delete_uuids(uuids)
+        self.invalidate(collection_name)
 
     def get_collection(self, collection_name: str):
         """
@@ -275,6 +399,29 @@ class ChromaDBClient:
 
         return {"collection_name": collection_name, "total_count": count}
 
+    def warmup(self):
+        """预先加载 embedding 模型并打开所有集合, 服务在接收请求前调用"""
+        super().warmup()
+        for collection_name in self.config["collections"].keys():
+            count = self._get_collection_with_embedding_function(collection_name).count()
+            self.get_compressed_index(collection_name)
+            logger.info(f"集合: {collection_name} 已就绪, 切片数: {count}")
+
+    def close(self):
+        """保存压缩向量索引"""
+        with self._compressed_lock:
+            for index in self._compressed_indexes.values():
+                index.save()
+        super().close()
+
     def _reset(self):
         self.client.reset()
+        with self._compressed_lock:
+            for index in self._compressed_indexes.values():
+                index.clear()
+                index.remove_files()
+            self._compressed_indexes.clear()
+            self._placeholder_dims.clear()
         self._create_collections(self.config["collections"])
+        for collection_name in self.config["collections"]:
+            self.invalidate(collection_name)
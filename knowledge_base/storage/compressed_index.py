@@ -0,0 +1,502 @@
+import json
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from .where_filter import where_fields, where_mask
+from ..utils import logger
+
+
+class CompressedVectorIndex:
+    """
+    int8 标量量化的两阶段向量索引
+
+    - 内存中只保存每个维度按比例量化的 int8 编码和向量的平方范数, 每个向量约占 dim + 4 字节
+    - 全精度向量保存在 memmap 文件中, 只有重排时读取候选向量, 由操作系统按需换页;
+      重排用 pread 读取候选行, 加载、tune() 和 save() 会扫描或写入整个文件, 结束后重新映射,
+      读入的页面留在操作系统的页缓存中, 不计入进程的常驻内存
+    - 查询时先用 int8 编码计算近似距离, 取 n_results * rerank_factor 个候选, 再用全精度向量计算
+      精确的平方 L2 距离 (与 ChromaDB 默认的 l2 距离一致) 重新排序
+    - 元数据列中重复的取值共用同一个对象 (uuid 以外的字段取值很少, 同一文档的切片相邻且 uuid 相同)
+    - 量化比例是每个维度的最大绝对值, 新向量超出范围时扩大比例并重新量化受影响的维度
+    - 元数据只保存 fields 中的字段, 支持按 where 条件预过滤, 删除时按 uuid 打标记, 标记过多时自动压缩
+    - save() 保存 id 和元数据, load() 从已有的向量文件恢复, 重启时不需要从头构建
+
+    Args:
+        path: 全精度向量文件所在目录
+        dim: 向量维度, 为 None 时由第一次添加的向量确定
+        fields: 需要保存的元数据字段, 必须包含 uuid
+        rerank_factor: 第一阶段候选数量相对于 n_results 的倍数
+        recall_target: tune() 调整 rerank_factor 时要求达到的 recall@k
+        max_rerank_factor: tune() 时 rerank_factor 的上限
+    """
+
+    # 计算近似距离时每次解码的行数, 控制临时 float32 矩阵的大小
+    BLOCK_SIZE = 1024
+
+    def __init__(
+        self,
+        path: str,
+        dim: int | None = None,
+        fields: Iterable[str] = ("uuid", "type", "subject", "difficulty", "source"),
+        rerank_factor: int = 4,
+        recall_target: float = 0.95,
+        max_rerank_factor: int = 64,
+    ):
+        self.path = path
+        self.dim = dim
+        self.fields = tuple(dict.fromkeys(("uuid", *fields)))
+        self.rerank_factor = rerank_factor
+        self.recall_target = recall_target
+        self.max_rerank_factor = max_rerank_factor
+        self._lock = threading.RLock()
+        self._size = 0
+        # 向量文件的行数, 内存中的编码等数组按自己的长度单独扩容
+        self._capacity = 0
+        # 上一次 tune() 时的切片数, 见 needs_tuning()
+        self._tuned_size = 0
+        self._scale: np.ndarray | None = None
+        self._codes = np.empty((0, dim or 0), dtype=np.int8)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._columns: dict[str, np.ndarray] = {field: np.empty(0, dtype=object) for field in self.fields}
+        self._ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        # (类型, 取值) -> 元数据列中共用的对象, 不包括 uuid
+        self._values: dict[tuple, object] = {}
+        self._vectors: np.memmap | None = None
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._meta_path = os.path.join(path, "index.json")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._rows
+
+    def supports(self, where: dict | None) -> bool:
+        """where 条件中的字段是否都保存在索引中"""
+        return where_fields(where) <= set(self.fields)
+
+    def memory_usage(self) -> dict[str, int]:
+        """
+        返回索引自身的常驻内存与全精度向量的字节数 (不含 id 和元数据)
+
+        Returns:
+            resident: int8 编码、范数和删除标记占用的内存
+            full_precision: 同样数量的 float32 向量占用的空间, 保存在 memmap 文件中
+        """
+        return {
+            "resident": self._codes.nbytes + self._norms.nbytes + self._alive.nbytes,
+            "full_precision": self._capacity * (self.dim or 0) * 4,
+        }
+
+    def _reserve(self, size: int):
+        """内存中的数组和向量文件扩容到至少 size 行, 容量按两倍增长"""
+        assert self.dim is not None
+        rows = len(self._norms)
+        if size > rows:
+            rows = max(size, rows * 2, 1024)
+            codes = np.zeros((rows, self.dim), dtype=np.int8)
+            codes[:self._size] = self._codes[:self._size]
+            self._codes = codes
+            self._norms = np.concatenate([self._norms[:self._size], np.zeros(rows - self._size, dtype=np.float32)])
+            self._alive = np.concatenate([self._alive[:self._size], np.zeros(rows - self._size, dtype=bool)])
+            for field, column in self._columns.items():
+                self._columns[field] = np.concatenate([column[:self._size], np.full(rows - self._size, None, dtype=object)])
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2, 1024)
+        if self._vectors is not None:
+            self._vectors.flush()
+        # 扩大文件后重新映射, 已有的数据保留在文件中
+        with open(self._vectors_path, "ab" if self._vectors is not None else "wb") as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def _remap(self):
+        """写回并重新映射向量文件, 释放扫描整个文件时读入的页面"""
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+
+    def needs_tuning(self) -> bool:
+        """切片数达到上一次 tune() 时的两倍 (或从未 tune) 时需要重新调整 rerank_factor"""
+        return len(self) >= max(2 * self._tuned_size, 1)
+
+    def _shared_values(self, field: str, values: list) -> list:
+        """元数据列的取值: uuid 与上一行相同时共用上一行的对象, 其它字段按取值共用"""
+        if field == "uuid":
+            shared, previous = [], None
+            for value in values:
+                if value == previous:
+                    value = previous
+                shared.append(value)
+                previous = value
+            return shared
+        return [self._values.setdefault((type(value), value), value) for value in values]
+
+    def _quantize(self, vectors: np.ndarray, dims: np.ndarray | slice = slice(None)) -> np.ndarray:
+        assert self._scale is not None
+        return np.clip(np.rint(vectors / self._scale[dims]), -127, 127).astype(np.int8)
+
+    def _update_scale(self, vectors: np.ndarray):
+        """按新向量扩大量化比例, 比例变化的维度用全精度向量重新量化已有的行"""
+        peak = np.maximum(np.abs(vectors).max(axis=0), 1e-6) / 127.0
+        if self._scale is None:
+            self._scale = peak
+            return
+        dims = np.flatnonzero(peak > self._scale)
+        if len(dims) == 0:
+            return
+        self._scale = np.maximum(self._scale, peak)
+        if self._size == 0:
+            return
+        assert self._vectors is not None
+        for start in range(0, self._size, self.BLOCK_SIZE):
+            end = min(start + self.BLOCK_SIZE, self._size)
+            self._codes[start:end, dims] = self._quantize(self._vectors[start:end][:, dims], dims)
+        logger.debug(f"压缩向量索引: {self.path}, 重新量化 {len(dims)} 个维度")
+
+    def add(self, ids: list[str], embeddings, metadatas: list[dict]):
+        """添加切片, 已存在的 id 会被忽略 (与 ChromaDB 的 add 行为一致)"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if len(ids) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._codes = np.empty((0, self.dim), dtype=np.int8)
+            if vectors.shape != (len(ids), self.dim):
+                raise ValueError(f"向量形状不匹配: expected={(len(ids), self.dim)}, actual={vectors.shape}")
+            keep = []
+            seen = set()
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in self._rows and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    keep.append(i)
+            if not keep:
+                return
+            vectors = vectors[keep]
+            self._update_scale(vectors)
+            start, end = self._size, self._size + len(keep)
+            self._reserve(end)
+            assert self._vectors is not None
+            self._vectors[start:end] = vectors
+            self._codes[start:end] = self._quantize(vectors)
+            self._norms[start:end] = (vectors * vectors).sum(axis=1)
+            self._alive[start:end] = True
+            for field, column in self._columns.items():
+                column[start:end] = self._shared_values(field, [metadatas[i].get(field) for i in keep])
+            for row, i in enumerate(keep, start=start):
+                self._ids.append(ids[i])
+                self._rows[ids[i]] = row
+            self._size = end
+
+    def delete_uuids(self, uuids: list[str]):
+        """删除 metadata 中 uuid 属于 uuids 的所有切片"""
+        if not uuids or self._size == 0:
+            return
+        with self._lock:
+            self._delete_rows(self._alive[:self._size] & np.isin(self._columns["uuid"][:self._size], list(uuids)))
+
+    def delete_ids(self, ids: list[str]):
+        """按切片 id 删除"""
+        with self._lock:
+            mask = np.zeros(self._size, dtype=bool)
+            mask[[self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]] = True
+            self._delete_rows(mask)
+
+    def ids(self) -> set[str]:
+        """索引中所有切片的 id"""
+        with self._lock:
+            return set(self._rows)
+
+    def _delete_rows(self, mask: np.ndarray):
+        for row in np.flatnonzero(mask):
+            self._rows.pop(self._ids[row], None)
+        self._alive[:self._size] &= ~mask
+        # 删除的行超过一半时压缩, 避免检索时扫描大量无效行
+        if self._size >= 1024 and len(self._rows) * 2 < self._size:
+            self._compact()
+
+    def _compact(self):
+        """移除已删除的行, 重写全精度向量文件"""
+        # 重写后行号改变, 已保存的元数据不再对应向量文件
+        if os.path.exists(self._meta_path):
+            os.remove(self._meta_path)
+        rows = np.flatnonzero(self._alive[:self._size])
+        assert self._vectors is not None
+        vectors = np.array(self._vectors[rows])
+        codes, norms = self._codes[rows], self._norms[rows]
+        columns = {field: column[rows] for field, column in self._columns.items()}
+        ids = [self._ids[row] for row in rows]
+        self.clear()
+        self._reserve(len(rows))
+        assert self._vectors is not None
+        self._vectors[:len(rows)] = vectors
+        self._codes[:len(rows)] = codes
+        self._norms[:len(rows)] = norms
+        self._alive[:len(rows)] = True
+        for field, column in self._columns.items():
+            column[:len(rows)] = columns[field]
+        self._ids = ids
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self._size = len(rows)
+        logger.debug(f"压缩向量索引: {self.path}, 剩余切片数: {self._size}")
+
+    def save(self):
+        """
+        将 id、元数据和删除标记保存到 index.json, 向量已在 vectors.f32 中, 先写临时文件再替换
+
+        保存后新增的行只追加到向量文件末尾, 已保存的元数据仍然对应文件的前 size 行
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._remap()
+            data = {
+                "dim": self.dim,
+                "size": self._size,
+                "capacity": self._capacity,
+                "rerank_factor": self.rerank_factor,
+                "tuned_size": self._tuned_size,
+                "ids": self._ids,
+                "alive": self._alive[:self._size].tolist(),
+                "columns": {field: column[:self._size].tolist() for field, column in self._columns.items()},
+            }
+            with open(f"{self._meta_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(f"{self._meta_path}.tmp", self._meta_path)
+        logger.debug(f"保存压缩向量索引: {self.path}, 切片数: {len(self)}")
+
+    def load(self) -> bool:
+        """
+        从 save() 保存的文件恢复索引, 量化比例按全部向量重新计算
+
+        Returns:
+            是否加载成功, 文件不存在或与当前配置不一致时返回 False, 调用方需要重新构建
+        """
+        if not (os.path.exists(self._meta_path) and os.path.exists(self._vectors_path)):
+            return False
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                data = json.load(f)
+            dim, size, capacity = data["dim"], data["size"], data["capacity"]
+            if (self.dim is not None and dim != self.dim) or set(data["columns"]) != set(self.fields):
+                logger.warning(f"压缩向量索引与当前配置不一致, 重新构建: {self.path}")
+                return False
+            if os.path.getsize(self._vectors_path) < capacity * dim * 4:
+                logger.warning(f"压缩向量索引的向量文件不完整, 重新构建: {self.path}")
+                return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取压缩向量索引失败, 重新构建: {self.path}, {e}")
+            return False
+        with self._lock:
+            self.clear()
+            self.dim = dim
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            self._capacity = capacity
+            self._size = size
+            # 内存中的数组只分配已有的行, 向量文件中预留的行在添加时才扩容
+            self._alive = np.array(data["alive"], dtype=bool).reshape(size)
+            self._columns = {}
+            for field in self.fields:
+                column = np.full(size, None, dtype=object)
+                column[:] = self._shared_values(field, data["columns"][field])
+                self._columns[field] = column
+            self._ids = list(data["ids"])
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids) if self._alive[row]}
+            self.rerank_factor = data.get("rerank_factor", self.rerank_factor)
+            self._tuned_size = data.get("tuned_size", len(self._rows))
+            self._scale = None
+            peak = np.zeros(dim, dtype=np.float32)
+            for start in range(0, size, self.BLOCK_SIZE):
+                end = min(start + self.BLOCK_SIZE, size)
+                peak = np.maximum(peak, np.abs(self._vectors[start:end]).max(axis=0))
+            self._update_scale(peak[None, :])
+            self._codes = np.zeros((size, dim), dtype=np.int8)
+            self._norms = np.zeros(size, dtype=np.float32)
+            for start in range(0, size, self.BLOCK_SIZE):
+                end = min(start + self.BLOCK_SIZE, size)
+                vectors = np.asarray(self._vectors[start:end])
+                self._codes[start:end] = self._quantize(vectors)
+                self._norms[start:end] = (vectors * vectors).sum(axis=1)
+            vectors = None
+            self._remap()
+        logger.info(f"加载压缩向量索引: {self.path}, 切片数: {len(self)}")
+        return True
+
+    def remove_files(self):
+        """删除保存的向量文件和元数据, 调用前先 clear()"""
+        for path in (self._vectors_path, self._meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def clear(self):
+        """清空索引 (保留量化比例)"""
+        with self._lock:
+            self._vectors = None
+            self._size = self._capacity = self._tuned_size = 0
+            self._codes = np.empty((0, self.dim or 0), dtype=np.int8)
+            self._norms = np.empty(0, dtype=np.float32)
+            self._alive = np.empty(0, dtype=bool)
+            self._columns = {field: np.empty(0, dtype=object) for field in self.fields}
+            self._ids, self._rows = [], {}
+            self._values = {}
+
+    def _approximate_distances(self, queries: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """用 int8 编码计算近似的平方 L2 距离 (省略与排序无关的 |q|^2), 不满足 mask 的行为 inf"""
+        assert self._scale is not None
+        scaled = (queries * self._scale).T
+        distances = np.empty((len(queries), self._size), dtype=np.float32)
+        for start in range(0, self._size, self.BLOCK_SIZE):
+            end = min(start + self.BLOCK_SIZE, self._size)
+            products = self._codes[start:end].astype(np.float32) @ scaled
+            distances[:, start:end] = (self._norms[start:end, None] - 2 * products).T
+        distances[:, ~mask] = np.inf
+        return distances
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """用 pread 读取指定的行 (已排序), 不经过 memmap, 读入的页面不计入进程的常驻内存"""
+        assert self.dim is not None
+        row_bytes = self.dim * 4
+        buffer = bytearray(len(rows) * row_bytes)
+        with open(self._vectors_path, "rb", buffering=0) as f:
+            for i, row in enumerate(rows):
+                buffer[i * row_bytes:(i + 1) * row_bytes] = os.pread(f.fileno(), row_bytes, int(row) * row_bytes)
+        return np.frombuffer(buffer, dtype=np.float32).reshape(len(rows), self.dim)
+
+    def _exact_distances(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = self._read_vectors(np.sort(rows))
+        distances = self._norms[np.sort(rows)] - 2 * (vectors @ query) + float(query @ query)
+        order = np.argsort(rows)
+        result = np.empty(len(rows), dtype=np.float32)
+        result[order] = distances
+        return result
+
+    @staticmethod
+    def _top_rows(distances: np.ndarray, n: int) -> np.ndarray:
+        """返回距离最小的 n 行 (已排序), 跳过 inf"""
+        n = min(n, len(distances))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.argpartition(distances, n - 1)[:n]
+        rows = rows[np.argsort(distances[rows], kind="stable")]
+        return rows[np.isfinite(distances[rows])]
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: dict | None = None,
+        rerank_factor: int | None = None,
+        ids: Iterable[str] | None = None,
+    ) -> dict[str, list[list]]:
+        """
+        两阶段检索, 返回格式与 collection.query 一致, 可以直接交给 _aggregate_scores 聚合
+
+        Args:
+            ids: 只在这些切片中检索, 为 None 时不限制
+
+        Returns:
+            {"ids": [[...]], "distances": [[...]], "metadatas": [[...]]}, metadatas 中只有 fields 中的字段
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        rerank_factor = rerank_factor or self.rerank_factor
+        result: dict[str, list[list]] = {"ids": [], "distances": [], "metadatas": []}
+        with self._lock:
+            if self._size == 0:
+                return {key: [[] for _ in queries] for key in result}
+            mask = self._alive[:self._size] & where_mask(self._columns, self._size, where)
+            if ids is not None:
+                allowed = np.zeros(self._size, dtype=bool)
+                allowed[[self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]] = True
+                mask &= allowed
+            approximate = self._approximate_distances(queries, mask)
+            for query, distances in zip(queries, approximate):
+                candidates = self._top_rows(distances, n_results * rerank_factor)
+                exact = self._exact_distances(query, candidates)
+                order = np.argsort(exact, kind="stable")[:n_results]
+                rows = candidates[order]
+                result["ids"].append([self._ids[row] for row in rows])
+                result["distances"].append([float(distance) for distance in exact[order]])
+                result["metadatas"].append(
+                    [{field: self._columns[field][row] for field in self.fields} for row in rows]
+                )
+        return result
+
+    def _exact_search(self, queries: np.ndarray, n_results: int, where: dict | None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """全精度向量的精确检索, 返回每个查询的 (行号, 平方 L2 距离), 调用方需持有 _lock"""
+        if self._size == 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        assert self._vectors is not None
+        mask = self._alive[:self._size] & where_mask(self._columns, self._size, where)
+        distances = np.empty((len(queries), self._size), dtype=np.float32)
+        for start in range(0, self._size, self.BLOCK_SIZE):
+            end = min(start + self.BLOCK_SIZE, self._size)
+            distances[:, start:end] = (self._norms[start:end, None] - 2 * (self._vectors[start:end] @ queries.T)).T
+        distances[:, ~mask] = np.inf
+        result = []
+        for query, row_distances in zip(queries, distances):
+            rows = self._top_rows(row_distances, n_results)
+            result.append((rows, row_distances[rows] + float(query @ query)))
+        return result
+
+    def exact_query(self, query_embeddings, n_results: int = 10, where: dict | None = None) -> list[list[str]]:
+        """直接使用全精度向量的精确检索, 用于评估召回率"""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            return [[self._ids[row] for row in rows] for rows, _ in self._exact_search(queries, n_results, where)]
+
+    def evaluate_recall(self, query_embeddings, k: int = 10, rerank_factor: int | None = None) -> float:
+        """
+        计算两阶段检索相对于精确检索的 recall@k
+
+        距离与精确检索的第 k 个结果相同的切片也算命中, 重复的切片 (如相同的答案) 距离相同, 取哪一个都是正确的
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            expected = self._exact_search(queries, k, None)
+            actual = self.query(queries, k, rerank_factor=rerank_factor)["distances"]
+        hits, total = 0, 0
+        for (rows, distances), found in zip(expected, actual):
+            if len(rows) == 0:
+                continue
+            threshold = distances[-1] + 1e-4 * max(1.0, abs(float(distances[-1])))
+            hits += min(sum(1 for distance in found if distance <= threshold), len(rows))
+            total += len(rows)
+        return hits / total if total else 1.0
+
+    def tune(self, query_embeddings=None, k: int = 10, sample_size: int = 100, seed: int = 0) -> float:
+        """
+        逐步加倍 rerank_factor, 直到 recall@k 达到 recall_target 或 rerank_factor 达到上限
+
+        Args:
+            query_embeddings: 用于评估的查询向量, 为 None 时从索引中随机抽取 sample_size 个向量
+            k: 评估的 recall@k
+
+        Returns:
+            调整后的 recall@k
+        """
+        with self._lock:
+            if query_embeddings is None:
+                rows = np.flatnonzero(self._alive[:self._size])
+                if len(rows) == 0:
+                    return 1.0
+                rows = np.random.default_rng(seed).choice(rows, min(sample_size, len(rows)), replace=False)
+                assert self._vectors is not None
+                query_embeddings = np.array(self._vectors[np.sort(rows)])
+            recall = self.evaluate_recall(query_embeddings, k)
+            while recall < self.recall_target and self.rerank_factor < self.max_rerank_factor:
+                self.rerank_factor = min(self.rerank_factor * 2, self.max_rerank_factor)
+                recall = self.evaluate_recall(query_embeddings, k)
+            self._tuned_size = len(self)
+            self._remap()
+        logger.info(f"压缩向量索引: {self.path}, rerank_factor={self.rerank_factor}, recall@{k}={recall:.4f}")
+        return recall
@@ -0,0 +1,134 @@
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+from sqlalchemy import insert, String
+
+from .mysql_client import MySQLClient
+from .sync_manager import SyncManager
+from .models import Question, KnowledgePoint
+from ..utils import iter_data_chunks, logger, metrics
+
+class FileImporter:
+    """
+    流式导入数据文件到 MySQL, 内存占用只与 chunk_size 有关, 与文件大小无关
+
+    - 文件按块读取 (见 utils.iter_data_chunks), 每块内的列筛选和校验都是向量化的
+    - 校验后的记录用 Core insert 的 executemany 按 batch_size 分批写入, 每批单独提交,
+      中途失败时已提交的批次保留
+    - Core insert 不触发 ORM 事件, 指定 sync_manager 时每批插入后调用 track_inserted, 提交后同步到向量存储
+    - 文件中的 uuid 与文件中更早的行或表中已有的记录重复时跳过该行 (计入 duplicates), 重复导入同一个文件不会因
+      uuid 唯一索引中途失败; 更早的块已经提交, 按表查询即可覆盖整个文件, 不需要在内存中保存全部 uuid
+    """
+
+    TABLES = {"questions": Question, "knowledge_points": KnowledgePoint}
+
+    def __init__(self, mysql_client: MySQLClient, sync_manager: SyncManager | None = None, config: dict | None = None):
+        config = config or {}
+        self.mysql_client = mysql_client
+        self.sync_manager = sync_manager
+        self.chunk_size = config.get("chunk_size", 10000)
+        self.batch_size = config.get("batch_size", 1000)
+
+    def import_file(
+        self,
+        collection_name: str,
+        path: str | Path,
+        progress: Callable[[dict], None] | None = None,
+    ) -> dict:
+        """
+        导入一个数据文件
+
+        Args:
+            collection_name: questions 或 knowledge_points
+            path: 数据文件路径, 支持 .csv、.parquet、.xlsx、.pkl 和 .npy
+            progress: 每个块导入完成后调用, 参数与返回值相同
+
+        Returns:
+            {"read": 读取行数, "inserted": 写入行数, "skipped": 校验失败跳过的行数, "duplicates": uuid 重复跳过的行数,
+            "seconds": 耗时}
+        """
+        table = self.TABLES.get(collection_name)
+        if table is None:
+            raise ValueError(f"不支持的集合名称: {collection_name}")
+        stats = {"read": 0, "inserted": 0, "skipped": 0, "duplicates": 0, "seconds": 0.0}
+        start = time.perf_counter()
+        for chunk in iter_data_chunks(Path(path), self.chunk_size):
+            records, skipped = self._prepare(table, chunk)
+            records, duplicates = self._dedupe(table, records)
+            for offset in range(0, len(records), self.batch_size):
+                self._insert_batch(table, collection_name, records[offset:offset + self.batch_size])
+            stats["read"] += len(chunk)
+            stats["inserted"] += len(records)
+            stats["skipped"] += skipped
+            stats["duplicates"] += duplicates
+            stats["seconds"] = time.perf_counter() - start
+            metrics.inc("import_rows_total", len(records), collection=collection_name, status="inserted")
+            metrics.inc("import_rows_total", skipped, collection=collection_name, status="skipped")
+            metrics.inc("import_rows_total", duplicates, collection=collection_name, status="duplicate")
+            logger.info(
+                f"导入 {path}: 读取 {stats['read']}, 写入 {stats['inserted']}, 跳过 {stats['skipped']}, "
+                f"重复 {stats['duplicates']}, "
+                f"{stats['read'] / max(stats['seconds'], 1e-9):.0f} 行/秒"
+            )
+            if progress is not None:
+                progress(dict(stats))
+        logger.info(f"导入完成: {path} -> {collection_name}, {stats}")
+        return stats
+
+    def _prepare(self, table, chunk: pd.DataFrame) -> tuple[list[dict], int]:
+        """
+        筛选并校验一个块, 返回可写入的记录和跳过的行数
+
+        - 只保留表中定义的列, 忽略 id 和多余的列
+        - 缺少必填列时报错; 必填字段为空或字符串超过列长度的行被跳过
+        - 没有 uuid 列或 uuid 为空的行生成新的 uuid
+        """
+        columns = {column.name: column for column in table.__table__.columns if column.name != "id"}
+        missing = [name for name, column in columns.items() if not column.nullable and name != "uuid" and name not in chunk.columns]
+        if missing:
+            raise ValueError(f"数据文件缺少必填列: {missing}")
+        frame = chunk[[name for name in columns if name in chunk.columns]].astype(object)
+        frame = frame.where(frame.notna(), None)
+        valid = pd.Series(True, index=frame.index)
+        for name in frame.columns:
+            column = columns[name]
+            values = frame[name]
+            present = values.notna()
+            if isinstance(column.type, String):
+                # 不同格式读出的类型不同 (parquet 中可能是整数), 统一转换为字符串
+                values = values.where(~present, values.astype(str))
+                values = values.where(~present | (values != ""), None)
+                present = values.notna()
+                frame[name] = values
+                if column.type.length is not None:
+                    valid &= ~present | (values.str.len() <= column.type.length)
+            if not column.nullable and name != "uuid":
+                valid &= present
+        frame = frame[valid]
+        if "uuid" not in frame.columns:
+            frame["uuid"] = None
+        missing_uuid = frame["uuid"].isna()
+        if missing_uuid.any():
+            frame.loc[missing_uuid, "uuid"] = [str(uuid.uuid4()) for _ in range(int(missing_uuid.sum()))]
+        return frame.to_dict(orient="records"), int((~valid).sum())
+
+    def _dedupe(self, table, records: list[dict]) -> tuple[list[dict], int]:
+        """去掉块内 uuid 重复的行 (保留第一行) 和 uuid 已在表中的行, 返回剩余的记录和去掉的行数"""
+        unique: dict[str, dict] = {}
+        for record in records:
+            unique.setdefault(record["uuid"], record)
+        existing = self.mysql_client.existing_uuids(table, list(unique))
+        kept = [record for record_uuid, record in unique.items() if record_uuid not in existing]
+        if len(kept) < len(records):
+            logger.warning(f"跳过 uuid 重复的行: {len(records) - len(kept)}, 其中已在表中: {len(existing)}")
+        return kept, len(records) - len(kept)
+
+    def _insert_batch(self, table, collection_name: str, records: list[dict]):
+        """用 executemany 写入一批记录并提交"""
+        with self.mysql_client.session_scope() as session:
+            session.execute(insert(table), records)
+            if self.sync_manager is not None:
+                self.sync_manager.track_inserted(session, collection_name, [record["uuid"] for record in records])
@@ -0,0 +1,300 @@
+import heapq
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List
+
+from sqlalchemy import delete, func, select
+
+from .models import Question, QuestionChange
+from .mysql_client import MySQLClient, fetch_records_by_uuids, UUID_CHUNK_SIZE
+from ..utils import logger
+
+try:
+    import jieba  # type: ignore
+except ImportError:
+    jieba = None
+
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[A-Za-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文分词, 安装了 jieba 时使用搜索引擎模式分词, 否则中文使用单字 + 二元组, 英文和数字按单词切分
+    """
+    if not text:
+        return []
+    if jieba is not None:
+        return [token.lower() for token in jieba.cut_for_search(text) if token.strip()]
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if run.isascii():
+            tokens.append(run.lower())
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[tuple[str, float]]:
+    """
+    倒数排名融合, 将多个排序结果合并为一个
+
+    Args:
+        rankings: 多个按相关性排序的 uuid 列表
+        k: 平滑常数
+
+    Returns:
+        按融合分数从高到低排列的 (uuid, score) 列表
+    """
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, uuid in enumerate(ranking, start=1):
+            scores[uuid] = scores.get(uuid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class KeywordIndex:
+    """
+    进程内的 BM25 倒排索引, 索引 Question 的 question 和 document 字段
+
+    每个文档额外保存 type/subject/difficulty/source 字段, 用于检索时的等值过滤,
+    查询只遍历查询词对应的倒排链, 延迟与题库总量基本无关
+
+    指定 mysql_client 时索引与 MySQL 保持一致, 不依赖本进程的同步回调:
+    - 第一次检索 (或 refresh()) 时才从 MySQL 构建
+    - 之后检索时最多每 refresh_interval 秒读取一次 question_changes 中的新变更, 重新读取变更的试题;
+      其它进程的修改也会写入该表, 所以每个进程的索引都会跟上
+    - 自增 id 按分配顺序而不是提交顺序可见, 读到的 id 不连续时记下缺失的 id, 之后 GAP_TIMEOUT 秒内继续检查
+    - 超过 change_retention 秒没有刷新时变更日志可能已被清理, 直接重新构建
+    """
+
+    FIELDS = ("type", "subject", "difficulty", "source")
+    # 缺失的变更 id 的最长等待时间, 应大于最长的写事务; 过期后视为回滚
+    GAP_TIMEOUT = 300.0
+    # 清理过期变更日志的间隔
+    PRUNE_INTERVAL = 3600.0
+
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tokenizer: Callable[[str], List[str]] = tokenize,
+        mysql_client: MySQLClient | None = None,
+        refresh_interval: float = 1.0,
+        change_retention: float = 86400.0,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+        self.mysql_client = mysql_client
+        self.refresh_interval = refresh_interval
+        self.change_retention = change_retention
+        self._refresh_lock = threading.RLock()
+        self._built = False
+        self._watermark = 0  # 已处理的最大变更 id
+        self._gaps: dict[int, float] = {}  # 小于 watermark 但尚未读到的变更 id -> 发现的时间
+        self._refreshed_at = 0.0
+        self._checked_at = 0.0
+        self._pruned_at = 0.0
+        self._lock = threading.RLock()
+        self._postings: dict[str, dict[str, int]] = {}  # 词 -> {uuid: 词频}
+        self._doc_terms: dict[str, dict[str, int]] = {}  # uuid -> {词: 词频}, 删除时使用
+        self._doc_fields: dict[str, dict[str, str]] = {}
+        self._doc_lengths: dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._doc_lengths
+
+    @staticmethod
+    def _document_text(data: dict) -> str:
+        return f"{data.get('question') or ''}\n{data.get('document') or ''}"
+
+    def add(self, data: dict):
+        """添加或替换一条试题, data 为 Question.to_dict() 的结果"""
+        self.add_many([data])
+
+    def add_many(self, data: List[dict]):
+        """批量添加或替换试题"""
+        with self._lock:
+            for item in data:
+                uuid = str(item["uuid"])
+                self._remove(uuid)
+                terms: dict[str, int] = {}
+                for token in self.tokenizer(self._document_text(item)):
+                    terms[token] = terms.get(token, 0) + 1
+                for term, frequency in terms.items():
+                    self._postings.setdefault(term, {})[uuid] = frequency
+                length = sum(terms.values())
+                self._doc_terms[uuid] = terms
+                self._doc_fields[uuid] = {field: str(item.get(field, "")) for field in self.FIELDS}
+                self._doc_lengths[uuid] = length
+                self._total_length += length
+
+    def remove_many(self, uuids: List[str]):
+        """批量删除试题"""
+        with self._lock:
+            for uuid in uuids:
+                self._remove(uuid)
+
+    def _remove(self, uuid: str):
+        terms = self._doc_terms.pop(uuid, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(uuid, None)
+                if not posting:
+                    del self._postings[term]
+        self._doc_fields.pop(uuid, None)
+        self._total_length -= self._doc_lengths.pop(uuid, 0)
+
+    def search(self, query: str, n_results: int = 10, filters: dict[str, str] | None = None) -> List[tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            n_results: 返回数量
+            filters: 字段等值过滤条件, 字段取值范围见 FIELDS
+
+        Returns:
+            按 BM25 分数从高到低排列的 (uuid, score) 列表
+        """
+        self._maybe_refresh()
+        terms = set(self.tokenizer(query))
+        with self._lock:
+            total = len(self._doc_lengths)
+            if total == 0 or not terms:
+                return []
+            average_length = self._total_length / total
+            scores: dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                for uuid, frequency in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[uuid] / average_length)
+                    scores[uuid] = scores.get(uuid, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            if filters:
+                scores = {
+                    uuid: score
+                    for uuid, score in scores.items()
+                    if all(self._doc_fields[uuid].get(field) == value for field, value in filters.items())
+                }
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def build(self, mysql_client: MySQLClient | None = None, batch_size: int = 1000):
+        """
+        从 MySQL 按主键分页读取全部试题重建索引
+
+        变更日志的水位取 GAP_TIMEOUT 之前的最大 id, 构建期间和之前尚未提交的变更会在下一次刷新时重新读取;
+        构建完成后一次性替换, 期间本进程写入当前索引的变更同样会在下一次刷新时重新读取
+        """
+        mysql_client = mysql_client or self.mysql_client
+        assert mysql_client is not None
+        columns = [Question.uuid, Question.question, Question.document, *(getattr(Question, field) for field in self.FIELDS)]
+        with self._refresh_lock:
+            started = time.time()
+            with mysql_client.session_scope() as session:
+                settled = datetime.now() - timedelta(seconds=self.GAP_TIMEOUT)
+                statement = select(func.max(QuestionChange.id)).where(QuestionChange.created_at < settled)
+                watermark = session.execute(statement).scalar() or 0
+            # 在新的索引中构建, 构建期间检索仍使用当前索引, 读取失败时当前索引保持不变
+            index = KeywordIndex(self.k1, self.b, self.tokenizer)
+            for rows in mysql_client.iter_pages(Question, columns, batch_size):
+                index.add_many(rows)
+            with self._lock:
+                self._postings, self._doc_terms = index._postings, index._doc_terms
+                self._doc_fields, self._doc_lengths = index._doc_fields, index._doc_lengths
+                self._total_length = index._total_length
+            self._watermark, self._gaps = watermark, {}
+            self._refreshed_at = started
+            self._built = True
+        logger.info(f"关键词索引构建完成, 试题数: {len(self)}, 词数: {len(self._postings)}")
+
+    def refresh(self, batch_size: int = 1000):
+        """从 question_changes 增量刷新索引, 尚未构建或长时间没有刷新时重新构建"""
+        if self.mysql_client is None:
+            return
+        with self._refresh_lock:
+            if not self._built or time.time() - self._refreshed_at > self.change_retention - self.GAP_TIMEOUT:
+                self.build(batch_size=batch_size)
+                return
+            started = time.time()
+            now = time.monotonic()
+            changes: dict[int, str] = {}
+            with self.mysql_client.session_scope() as session:
+                last_id = self._watermark
+                while True:
+                    statement = (
+                        select(QuestionChange.id, QuestionChange.uuid)
+                        .where(QuestionChange.id > last_id)
+                        .order_by(QuestionChange.id)
+                        .limit(batch_size)
+                    )
+                    page = session.execute(statement).all()
+                    changes.update((row.id, row.uuid) for row in page)
+                    if len(page) < batch_size:
+                        break
+                    last_id = page[-1].id
+                gaps = list(self._gaps)
+                for start in range(0, len(gaps), UUID_CHUNK_SIZE):
+                    statement = select(QuestionChange.id, QuestionChange.uuid).where(QuestionChange.id.in_(gaps[start:start + UUID_CHUNK_SIZE]))
+                    changes.update((row.id, row.uuid) for row in session.execute(statement))
+                uuids = list(dict.fromkeys(changes[change_id] for change_id in sorted(changes)))
+                data = [record.to_dict() for record in fetch_records_by_uuids(session, Question, uuids)]
+            self.remove_many(uuids)
+            self.add_many(data)
+            # 更新水位并记录新出现的缺口, 读到的缺口和过期的缺口不再检查
+            expected = self._watermark + 1
+            for change_id in sorted(change_id for change_id in changes if change_id > self._watermark):
+                for missing in range(expected, change_id):
+                    self._gaps[missing] = now
+                expected = change_id + 1
+            self._watermark = max(self._watermark, expected - 1)
+            self._gaps = {
+                change_id: found_at for change_id, found_at in self._gaps.items()
+                if change_id not in changes and now - found_at < self.GAP_TIMEOUT
+            }
+            self._refreshed_at = started
+            if uuids:
+                logger.debug(f"关键词索引刷新: {len(uuids)} 道试题, 水位: {self._watermark}, 缺口: {len(self._gaps)}")
+            if started - self._pruned_at > self.PRUNE_INTERVAL:
+                self._pruned_at = started
+                self._prune()
+
+    def _prune(self):
+        """删除超过保留时间的变更日志, 多个进程同时清理不影响结果"""
+        assert self.mysql_client is not None
+        with self.mysql_client.session_scope() as session:
+            cutoff = datetime.now() - timedelta(seconds=self.change_retention)
+            session.execute(delete(QuestionChange).where(QuestionChange.created_at < cutoff))
+
+    def _maybe_refresh(self):
+        """检索前调用: 尚未构建时等待构建, 之后每 refresh_interval 秒由一个线程刷新, 其它线程不等待"""
+        if self.mysql_client is None:
+            return
+        if not self._built:
+            self.refresh()
+            return
+        if time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._checked_at >= self.refresh_interval:
+                self._checked_at = time.monotonic()
+                self.refresh()
+        except Exception as e:
+            logger.warning(f"刷新关键词索引失败, 继续使用当前索引: {e}")
+        finally:
+            self._refresh_lock.release()
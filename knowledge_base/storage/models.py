@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Enum
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Enum, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import inspect
 import enum
@@ -42,7 +43,11 @@ def to_dict(model) -> dict:
 
 class Question(Base):
     __tablename__ = "questions"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # 同步、向量检索结果回表都按 uuid 查询
+        Index("ux_questions_uuid", "uuid", unique=True),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True)
     uuid = Column(String(255), nullable=False)
@@ -61,7 +66,10 @@ class Question(Base):
 
 class KnowledgePoint(Base):
     __tablename__ = "knowledge_points"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ux_knowledge_points_uuid", "uuid", unique=True),
+        {'extend_existing': True},
+    )
     id = Column(Integer, primary_key=True)
     uuid = Column(String(255), nullable=False)
     document = Column(String(2048), nullable=False)  # 存入向量数据库的文本
@@ -72,4 +80,53 @@ class KnowledgePoint(Base):
     exam_point = Column(String(255), nullable=True)
 
     def to_dict(self) -> dict:
-        return to_dict(self)
\ No newline at end of file
+        return to_dict(self)
+
+class SyncOutbox(Base):
+    """
+    MySQL 到 ChromaDB 同步的事务性发件箱, 与 Question/KnowledgePoint 的变更在同一事务中写入,
+    由 SyncWorker 异步读取并同步到 ChromaDB
+    """
+    __tablename__ = "sync_outbox"
+    __table_args__ = (
+        Index("ix_sync_outbox_status_id", "status", "id"),
+        {'extend_existing': True},
+    )
+    id = Column(Integer, primary_key=True)
+    collection = Column(String(255), nullable=False)  # questions 或 knowledge_points
+    uuid = Column(String(255), nullable=False)
+    op = Column(String(32), nullable=False)  # insert, update 或 delete
+    status = Column(String(32), nullable=False, default="pending")  # pending, processing 或 failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(2048), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    available_at = Column(DateTime, nullable=False, default=datetime.now)  # 重试退避, 早于该时间不处理
+    claimed_at = Column(DateTime, nullable=True)  # status 为 processing 时 worker 认领的时间
+    claimed_by = Column(String(32), nullable=True)  # 认领的标识, 每次认领随机生成, 完成或失败时只更新自己认领的行
+
+    def to_dict(self) -> dict:
+        return to_dict(self)
+
+class QuestionChange(Base):
+    """
+    试题的变更日志, 由 SyncManager 与试题的插入、修改、删除在同一事务中写入, 只追加不修改;
+    各进程的 KeywordIndex 按 id 增量读取并刷新, 超过保留时间的记录被清理
+    """
+    __tablename__ = "question_changes"
+    __table_args__ = (
+        Index("ix_question_changes_created_at", "created_at"),
+        {'extend_existing': True},
+    )
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(255), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+class CollectionGeneration(Base):
+    """
+    向量存储中每个集合的版本号, 任一进程写入或删除集合后加一,
+    各进程的查询结果缓存 (QueryCache) 在查询时读取, 版本号变化后之前缓存的结果不再使用
+    """
+    __tablename__ = "collection_generations"
+    __table_args__ = {'extend_existing': True}
+    collection = Column(String(255), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
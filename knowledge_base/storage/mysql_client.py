@@ -1,9 +1,38 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from typing import List
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Iterator, List, TypeVar
 
-from .models import Base, Question, KnowledgePoint
-from ..utils import logger
+from .models import Base, Question, KnowledgePoint, CollectionGeneration, SyncOutbox
+from ..utils import logger, metrics
+
+Record = TypeVar("Record", Question, KnowledgePoint)
+
+# 每条 IN 查询的 uuid 数量上限, 避免语句过长
+UUID_CHUNK_SIZE = 500
+
+def fetch_records_by_uuids(session: Session, table: type[Record], uuids: List[str], chunk_size: int = UUID_CHUNK_SIZE) -> List[Record]:
+    """
+    在给定的 session 中按 uuid 分批读取记录, 每批一条走唯一索引的 IN 查询
+
+    Args:
+        session: 数据库会话
+        table: Question 或 KnowledgePoint
+        uuids: 要读取的 uuid, 重复的 uuid 只返回一次
+        chunk_size: 每条 IN 查询的 uuid 数量
+
+    Returns:
+        按 uuids 顺序排列的记录, 不存在的 uuid 被忽略
+    """
+    uuids = list(dict.fromkeys(uuids))
+    records = {}
+    for start in range(0, len(uuids), chunk_size):
+        statement = select(table).where(table.uuid.in_(uuids[start:start + chunk_size]))
+        for record in session.execute(statement).scalars():
+            records[record.uuid] = record
+    return [records[uuid] for uuid in uuids if uuid in records]
 
 class MySQLClient:
     def __init__(self, config: dict):
@@ -12,29 +41,212 @@ class MySQLClient:
         host = config.get("host")
         port = config.get("port")
         database = config.get("database")
-        self.engine = create_engine(f'mysql+mysqlconnector://{user}:{password}@{host}:{port}/{database}')
+        # 可以直接指定数据库 url, 如基准测试中使用的 sqlite:///bench.db
+        url = config.get("url") or f'mysql+mysqlconnector://{user}:{password}@{host}:{port}/{database}'
+        self.engine = create_engine(url, **self._pool_options(url, config))
+        self._register_metrics()
         Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        # create_all 不会修改已存在的表, 旧表的 uuid 索引和 sync_outbox 的新列需要单独补建
+        self._ensure_uuid_indexes()
+        self._ensure_outbox_columns()
+        # 提交后不过期已加载的属性, 会话关闭后返回的记录仍可直接读取
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    @staticmethod
+    def _pool_options(url: str, config: dict) -> dict:
+        """
+        连接池参数, SQLite 使用 SQLAlchemy 的默认连接池, 不支持这些参数
+
+        - pool_size: 常驻连接数, 应不小于并发使用数据库的线程数 (如 test_generator 的 max_workers)
+        - max_overflow: 高峰时允许额外创建的连接数, 连接总数不超过 pool_size + max_overflow
+        - pool_timeout: 连接池耗尽时等待空闲连接的秒数, 超时抛出异常而不是继续创建连接
+        - pool_recycle: 连接的最长使用秒数, 应小于 MySQL 的 wait_timeout, 避免使用被服务端断开的连接
+        - pool_pre_ping: 取出连接时先检测是否可用, 失效的连接会被透明地重建
+        """
+        if url.startswith("sqlite"):
+            return {}
+        return {
+            "pool_size": config.get("pool_size", 10),
+            "max_overflow": config.get("max_overflow", 20),
+            "pool_timeout": config.get("pool_timeout", 30),
+            "pool_recycle": config.get("pool_recycle", 3600),
+            "pool_pre_ping": config.get("pool_pre_ping", True),
+        }
+
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """
+        一个工作单元: 正常结束时提交, 抛出异常时回滚, 最后关闭会话将连接归还连接池
+
+        Example:
+            with mysql_client.session_scope() as session:
+                session.add_all(questions)
+        """
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
     
     def save_questions(self, questions: List[Question]):
-        session = self.Session()
-        session.add_all(questions)
-        session.commit()
+        with self.session_scope() as session:
+            session.add_all(questions)
     
     def save_knowledge_points(self, knowledge_points: List[KnowledgePoint]):
-        session = self.Session()
-        session.add_all(knowledge_points)
-        session.commit()
+        with self.session_scope() as session:
+            session.add_all(knowledge_points)
     
     def get_record_by_uuid(self, table: type[Question] | type[KnowledgePoint], uuid: str) -> Question | KnowledgePoint | None:
-        session = self.Session()
-        return session.query(table).filter(table.uuid == uuid).first()
+        with self.session_scope() as session:
+            return session.query(table).filter(table.uuid == uuid).first()
     
     def get_question_by_uuid(self, uuid: str) -> Question | None:
-        session = self.Session()
-        return session.query(Question).filter(Question.uuid == uuid).first()
+        return self.get_record_by_uuid(Question, uuid)  # type: ignore
+
+    def get_records_by_uuids(self, table: type[Record], uuids: List[str], session: Session | None = None) -> List[Record]:
+        """
+        按 uuid 批量读取记录, 结果保持 uuids 的顺序, 见 fetch_records_by_uuids
+
+        Args:
+            table: Question 或 KnowledgePoint
+            uuids: 要读取的 uuid
+            session: 使用已有的会话, 不指定时在一个新的工作单元中读取, 返回的记录与会话分离
+        """
+        if session is not None:
+            return fetch_records_by_uuids(session, table, uuids)
+        with self.session_scope() as session:
+            return fetch_records_by_uuids(session, table, uuids)
+
+    def iter_pages(self, table: type[Record], columns: list | None = None, batch_size: int = 1000, after_id: int = 0) -> Iterator[List[dict]]:
+        """
+        按主键分页读取整张表 (WHERE id > :last ORDER BY id LIMIT :n), 每页在一个新的短事务中读取
+
+        mysql-connector 不支持服务端游标, yield_per 仍会把整个结果集读入客户端内存;
+        按主键分页每次只取一页, 内存占用只与 batch_size 有关
+
+        Args:
+            table: Question 或 KnowledgePoint
+            columns: 只读取这些列 (id 总会被读取), 为 None 时读取完整记录
+            batch_size: 每页的记录数量
+            after_id: 从主键大于该值的记录开始
+
+        Returns:
+            每页一个字典列表, 完整记录为 to_dict() 的结果
+        """
+        last_id = after_id
+        while True:
+            with self.session_scope() as session:
+                if columns is None:
+                    statement = select(table).where(table.id > last_id).order_by(table.id).limit(batch_size)
+                    page = [record.to_dict() for record in session.execute(statement).scalars()]
+                else:
+                    statement = select(table.id, *columns).where(table.id > last_id).order_by(table.id).limit(batch_size)
+                    page = [dict(row) for row in session.execute(statement).mappings()]
+            if not page:
+                return
+            yield page
+            if len(page) < batch_size:
+                return
+            last_id = page[-1]["id"]
+
+    def existing_uuids(self, table: type[Record], uuids: List[str], chunk_size: int = UUID_CHUNK_SIZE) -> set[str]:
+        """返回 uuids 中在表里存在的 uuid, 分批走唯一索引查询"""
+        existing = set()
+        with self.session_scope() as session:
+            for start in range(0, len(uuids), chunk_size):
+                statement = select(table.uuid).where(table.uuid.in_(uuids[start:start + chunk_size]))
+                existing.update(session.execute(statement).scalars())
+        return existing
+
+    def get_generation(self, collection_name: str) -> int:
+        """读取集合的共享版本号, 见 CollectionGeneration"""
+        with self.session_scope() as session:
+            statement = select(CollectionGeneration.generation).where(CollectionGeneration.collection == collection_name)
+            return session.execute(statement).scalar() or 0
+
+    def bump_generation(self, collection_name: str):
+        """集合的共享版本号加一, 在单独的短事务中执行"""
+        statement = (
+            update(CollectionGeneration)
+            .where(CollectionGeneration.collection == collection_name)
+            .values(generation=CollectionGeneration.generation + 1)
+        )
+        try:
+            with self.session_scope() as session:
+                if session.execute(statement).rowcount == 0:
+                    session.add(CollectionGeneration(collection=collection_name, generation=1))
+        except IntegrityError:
+            # 其它进程同时插入了这一行, 改为更新
+            with self.session_scope() as session:
+                session.execute(statement)
+
+    def _ensure_uuid_indexes(self):
+        """
+        为已存在的表补建 uuid 唯一索引
+
+        MySQL 上使用 ALGORITHM=INPLACE, LOCK=NONE 在线建索引, 建索引期间表仍可读写;
+        已有重复 uuid 时建索引会失败, 只记录错误, 需要清理重复数据后重启
+        """
+        inspector = inspect(self.engine)
+        for table in (Question, KnowledgePoint):
+            name = table.__tablename__
+            existing = {index["name"] for index in inspector.get_indexes(name)}
+            for index in table.__table__.indexes:
+                if index.name in existing:
+                    continue
+                logger.info(f"创建索引: {name}.{index.name}")
+                try:
+                    if self.engine.dialect.name == "mysql":
+                        columns = ", ".join(column.name for column in index.columns)
+                        with self.engine.begin() as connection:
+                            connection.execute(text(
+                                f"ALTER TABLE {name} ADD {'UNIQUE ' if index.unique else ''}INDEX {index.name} ({columns}), "
+                                "ALGORITHM=INPLACE, LOCK=NONE"
+                            ))
+                    else:
+                        index.create(self.engine)
+                except Exception as e:
+                    logger.error(f"创建索引失败: {name}.{index.name}, {e}")
     
-    def get_session(self):
+    def _ensure_outbox_columns(self):
+        """为已存在的 sync_outbox 表补建新增的可空列 (如 claimed_at)"""
+        name = SyncOutbox.__tablename__
+        existing = {column["name"] for column in inspect(self.engine).get_columns(name)}
+        for column in SyncOutbox.__table__.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            logger.info(f"添加列: {name}.{column.name}")
+            column_type = column.type.compile(dialect=self.engine.dialect)
+            with self.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {name} ADD COLUMN {column.name} {column_type} NULL"))
+
+    def _register_metrics(self):
+        """按语句类型 (SELECT/INSERT/UPDATE/DELETE...) 记录执行耗时, 指标关闭时只做一次布尔判断"""
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if metrics.enabled:
+                context._metrics_start = time.perf_counter()
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = getattr(context, "_metrics_start", None)
+            if start is not None:
+                metrics.observe("mysql_query_seconds", time.perf_counter() - start, statement=statement.split(None, 1)[0].upper())
+
+        def handle_error(exception_context):
+            if metrics.enabled:
+                statement = (exception_context.statement or "").split(None, 1)
+                metrics.inc("mysql_query_errors_total", statement=statement[0].upper() if statement else "")
+
+        event.listen(self.engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(self.engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(self.engine, "handle_error", handle_error)
+
+    def get_session(self) -> Session:
+        """返回一个新的会话, 需要由调用方关闭, 一般应使用 session_scope"""
         return self.Session()
     
     def _reset_tables(self):
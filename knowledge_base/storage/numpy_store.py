@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+from typing import Iterator
+
+import numpy as np
+from chromadb.api.types import Include
+
+from ..utils import logger, metrics
+from .vector_store import VectorStore
+from .where_filter import where_fields, where_mask
+
+
+class _Collection:
+    """一个集合的切片: 连续存放的归一化向量矩阵, 以及按行对齐的 id、文档和元数据"""
+
+    def __init__(self, dim: int | None = None):
+        self.dim = dim
+        self.size = 0
+        self.matrix = np.empty((0, dim or 0), dtype=np.float32)
+        self.alive = np.empty(0, dtype=bool)
+        self.ids: list[str] = []
+        self.documents: list[str | None] = []
+        self.metadatas: list[dict | None] = []
+        # 元数据字段 -> 每行的取值, 用于 where 预过滤
+        self.columns: dict[str, np.ndarray] = {}
+        self.rows: dict[str, int] = {}
+        self.uuid_rows: dict[str, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _reserve(self, size: int):
+        capacity = len(self.alive)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        assert self.dim is not None
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        self.matrix = matrix
+        self.alive = np.concatenate([self.alive[:self.size], np.zeros(capacity - self.size, dtype=bool)])
+        for field, column in self.columns.items():
+            self.columns[field] = np.concatenate([column[:self.size], np.full(capacity - self.size, None, dtype=object)])
+
+    def add(self, ids: list[str], vectors: np.ndarray, documents: list[str], metadatas: list[dict]):
+        """添加切片, 已存在的 id 会被忽略 (与 ChromaDB 的 add 行为一致)"""
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+        keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in self.rows]
+        if not keep:
+            return
+        start, end = self.size, self.size + len(keep)
+        self._reserve(end)
+        vectors = vectors[keep]
+        self.matrix[start:end] = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        self.alive[start:end] = True
+        for row, i in enumerate(keep, start=start):
+            metadata = metadatas[i]
+            self.ids.append(ids[i])
+            self.documents.append(documents[i])
+            self.metadatas.append(metadata)
+            self.rows[ids[i]] = row
+            self.uuid_rows.setdefault(str(metadata.get("uuid")), []).append(row)
+            for field, value in metadata.items():
+                if field not in self.columns:
+                    self.columns[field] = np.full(len(self.alive), None, dtype=object)
+                self.columns[field][row] = value
+        self.size = end
+
+    def delete_uuids(self, uuids: list[str]):
+        # 写时复制: 查询在锁外读取的是旧列表的快照, 这里不能原地修改
+        self.documents = list(self.documents)
+        self.metadatas = list(self.metadatas)
+        for uuid in uuids:
+            for row in self.uuid_rows.pop(uuid, []):
+                self.alive[row] = False
+                self.rows.pop(self.ids[row], None)
+                self.documents[row] = self.metadatas[row] = None
+        # 删除的行超过一半时压缩, 避免查询时计算大量无效行
+        if self.size >= 1024 and len(self.rows) * 2 < self.size:
+            self.compact()
+
+    def compact(self):
+        rows = np.flatnonzero(self.alive[:self.size])
+        ids = [self.ids[row] for row in rows]
+        documents = [self.documents[row] for row in rows]
+        metadatas = [self.metadatas[row] for row in rows]
+        compacted = _Collection(self.dim)
+        compacted.add(ids, self.matrix[rows], documents, metadatas)  # type: ignore[arg-type]
+        self.__dict__.update(compacted.__dict__)
+
+    def mask(self, where: dict | None) -> np.ndarray:
+        mask = self.alive[:self.size].copy()
+        if where:
+            columns = {field: self.columns.get(field, np.full(self.size, None, dtype=object)) for field in where_fields(where)}
+            mask &= where_mask(columns, self.size, where)
+        return mask
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    NumPy 暴力检索的向量存储, 返回精确的最近邻, 也可以作为其他后端的召回率基准
+
+    - 每个集合的向量归一化后连续存放在一个 float32 矩阵中, 一批查询只需要一次矩阵乘法加 argpartition
+    - where 条件先转换为布尔掩码, 在排序前过滤
+    - 距离为归一化向量的平方 L2 距离 (2 - 2 * cos), 与 ChromaDB 默认的 l2 空间一致
+    - 配置了 path 时启动时加载, close() 时保存到 path 目录下, 否则只保存在内存中
+
+    几十万切片以内的集合查询延迟低于 HNSW, 且召回率为 100%
+    """
+
+    backend = "numpy"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        if self.embedding_function is None:
+            raise ValueError("NumpyVectorStore 需要配置 embedding_function")
+        self.path = config.get("path", None)
+        self._lock = threading.RLock()
+        self._collections: dict[str, _Collection] = {name: _Collection() for name in config["collections"]}
+        if self.path is not None:
+            self.load()
+
+    def _collection(self, collection_name: str) -> _Collection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            raise ValueError(f"集合不存在: {collection_name}")
+        return collection
+
+    def _add_documents(self, collection_name: str, documents: list[tuple[str, dict]]):
+        ids, chunks, metadatas = self._build_chunks(documents)
+        if not ids:
+            return
+        metrics.inc("vector_store_chunks_total", len(ids), backend=self.backend, collection=collection_name)
+        collection = self._collection(collection_name)
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            vectors = np.asarray(self.embedding_function(chunks[start:end]), dtype=np.float32)  # type: ignore
+            with self._lock:
+                collection.add(ids[start:end], vectors, chunks[start:end], metadatas[start:end])
+        logger.debug(f"批量添加到集合: {collection_name}, 文档数: {len(documents)}, 切片数: {len(ids)}")
+
+    def delete_documents(self, collection_name: str, uuids: list[str]):
+        if not uuids:
+            return
+        with metrics.time("vector_store_seconds", backend=self.backend, op="delete", collection=collection_name), self._lock:
+            self._collection(collection_name).delete_uuids([str(uuid) for uuid in uuids])
+        self.invalidate(collection_name)
+
+    def count(self, collection_name: str) -> int:
+        return len(self._collection(collection_name))
+
+    def _query_chunks(self, collection_name: str, n_results: int, **query):
+        unsupported = set(query) - {"query_embeddings", "where"}
+        if unsupported or "query_embeddings" not in query:
+            raise ValueError(f"NumpyVectorStore 只支持 query_texts/query_embeddings 和 where 查询, 不支持: {unsupported}")
+        queries = np.atleast_2d(np.asarray(query["query_embeddings"], dtype=np.float32))
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        collection = self._collection(collection_name)
+        result: dict[str, list[list]] = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+        # 锁内只取掩码和各数组的引用: 添加只写入 size 之后的行, 扩容、压缩和删除都会替换为新对象,
+        # 快照在锁外保持不变, 矩阵乘法和排序不会阻塞写入和其他查询
+        with self._lock:
+            mask = collection.mask(query.get("where"))
+            matrix = collection.matrix[:collection.size]
+            ids, documents, metadatas = collection.ids, collection.documents, collection.metadatas
+        n = min(n_results, int(mask.sum()))
+        if n <= 0:
+            return {key: [[] for _ in queries] for key in result}
+        similarities = queries @ matrix.T
+        similarities[:, ~mask] = -np.inf
+        top = np.argpartition(-similarities, n - 1, axis=1)[:, :n]
+        for row_similarities, rows in zip(similarities, top):
+            rows = rows[np.argsort(-row_similarities[rows], kind="stable")]
+            result["ids"].append([ids[row] for row in rows])
+            result["distances"].append([float(2 - 2 * row_similarities[row]) for row in rows])
+            result["metadatas"].append([metadatas[row] for row in rows])
+            result["documents"].append([documents[row] for row in rows])
+        return result
+
+    def get_content_hashes(self, collection_name: str, uuids: list[str]) -> dict[str, str | None]:
+        collection = self._collection(collection_name)
+        hashes: dict[str, str | None] = {}
+        with self._lock:
+            for uuid in uuids:
+                rows = collection.uuid_rows.get(str(uuid))
+                if rows:
+                    hashes[str(uuid)] = collection.metadatas[rows[0]].get("content_hash")  # type: ignore
+        return hashes
+
+    def iter_uuids(self, collection_name: str, page_size: int = 1000) -> Iterator[str]:
+        with self._lock:
+            uuids = list(self._collection(collection_name).uuid_rows)
+        yield from uuids
+
+    def query_metadata(
+        self,
+        collection_name: str,
+        uuids: list[str],
+        include: Include = ["metadatas", "documents"],
+    ) -> dict[str, dict[str, list]]:
+        collection = self._collection(collection_name)
+        fields = ["ids", *include]
+        result: dict[str, dict[str, list]] = {uuid: {field: [] for field in fields} for uuid in uuids}
+        with self._lock:
+            for uuid, group in result.items():
+                for row in collection.uuid_rows.get(str(uuid), []):
+                    values = {
+                        "ids": collection.ids[row],
+                        "metadatas": collection.metadatas[row],
+                        "documents": collection.documents[row],
+                        "embeddings": collection.matrix[row].copy(),
+                    }
+                    for field in fields:
+                        group[field].append(values[field])
+        return result
+
+    def _files(self, collection_name: str) -> tuple[str, str]:
+        assert self.path is not None
+        return os.path.join(self.path, f"{collection_name}.npy"), os.path.join(self.path, f"{collection_name}.json")
+
+    def save(self):
+        """将所有集合保存到 path 目录, 先写临时文件再替换"""
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            for collection_name, collection in self._collections.items():
+                rows = np.flatnonzero(collection.alive[:collection.size])
+                matrix_path, data_path = self._files(collection_name)
+                with open(f"{matrix_path}.tmp", "wb") as f:
+                    np.save(f, collection.matrix[rows])
+                with open(f"{data_path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(
+                        {
+                            "ids": [collection.ids[row] for row in rows],
+                            "documents": [collection.documents[row] for row in rows],
+                            "metadatas": [collection.metadatas[row] for row in rows],
+                        },
+                        f,
+                        ensure_ascii=False,
+                    )
+                os.replace(f"{matrix_path}.tmp", matrix_path)
+                os.replace(f"{data_path}.tmp", data_path)
+        logger.info(f"保存向量存储: {self.path}")
+
+    def load(self):
+        """从 path 目录加载已保存的集合"""
+        with self._lock:
+            for collection_name in self._collections:
+                matrix_path, data_path = self._files(collection_name)
+                if not (os.path.exists(matrix_path) and os.path.exists(data_path)):
+                    continue
+                with open(data_path, encoding="utf-8") as f:
+                    data = json.load(f)
+                collection = _Collection()
+                if data["ids"]:
+                    collection.add(data["ids"], np.load(matrix_path), data["documents"], data["metadatas"])
+                self._collections[collection_name] = collection
+                logger.info(f"加载集合: {collection_name}, 切片数: {len(collection)}")
+
+    def close(self):
+        self.save()
+        super().close()
+
+    def _reset(self):
+        with self._lock:
+            self._collections = {name: _Collection() for name in self.config["collections"]}
+        for collection_name in self.config["collections"]:
+            self.invalidate(collection_name)
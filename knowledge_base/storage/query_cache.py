@@ -0,0 +1,192 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable
+
+import numpy as np
+
+from ..utils import logger, metrics
+
+
+class _LRUCache:
+    """线程安全的 LRU 缓存, 每个条目在写入 ttl 秒后过期"""
+
+    def __init__(self, max_entries: int, ttl: float | None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryCache:
+    """
+    向量存储的查询缓存: 查询文本 -> 查询向量, 以及查询 -> 按相关性排序的 (uuid, 分数) 列表
+
+    结果缓存的键包含集合的版本号, 集合每次写入或删除后版本号加一 (见 VectorStore.invalidate),
+    旧版本的结果不会再被读到, 之后按 LRU 淘汰或过期; 查询向量只与文本和模型有关, 不需要失效
+
+    进程内的版本号只能感知本进程的写入; 多个进程共用一个向量存储时 (如 outbox 模式下只有处理变更的
+    进程写入), 需要调用 share_generations 使用共享的版本号, 否则其它进程的修改要等 ttl 过期后才可见;
+    读到的共享版本号复用 shared_refresh_interval 秒, 其它进程的修改最多延迟这么久可见, 本进程的修改立即可见
+
+    Args:
+        max_entries: 结果缓存的最大条目数
+        ttl: 结果缓存的过期时间 (秒), None 表示不过期
+        embedding_max_entries: 查询向量缓存的最大条目数
+        embedding_ttl: 查询向量缓存的过期时间 (秒)
+        shared_refresh_interval: 共享版本号的复用时间 (秒), 0 表示每次查询都读取 (每次查询多一次 MySQL 往返),
+            大于 0 时其它进程的修改最多延迟这么久才可见
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float | None = 300,
+        embedding_max_entries: int = 10000,
+        embedding_ttl: float | None = None,
+        shared_refresh_interval: float = 1.0,
+    ):
+        self._results = _LRUCache(max_entries, ttl)
+        self._embeddings = _LRUCache(embedding_max_entries, embedding_ttl)
+        self._lock = threading.Lock()
+        self._generations: dict[str, int] = {}
+        self._shared = None
+        self._shared_refresh_interval = shared_refresh_interval
+        self._shared_generations: dict[str, tuple[int, float]] = {}
+        # 每个线程在 deferred() 中失效的集合, 退出时统一更新共享版本号
+        self._deferred = threading.local()
+
+    def share_generations(self, source):
+        """
+        使用多个进程共享的版本号, 查询时读取, 失效时加一
+
+        Args:
+            source: 提供 get_generation(collection_name) 和 bump_generation(collection_name) 的对象, 如 MySQLClient
+        """
+        self._shared = source
+
+    def generation(self, collection_name: str) -> Hashable | None:
+        """
+        当前的版本号, 作为结果缓存键的一部分
+
+        Returns:
+            读取共享版本号失败时返回 None, 调用方不应使用缓存
+        """
+        local = self._generations.get(collection_name, 0)
+        if self._shared is None:
+            return local
+        now = time.monotonic()
+        cached = self._shared_generations.get(collection_name)
+        if cached is not None and now - cached[1] < self._shared_refresh_interval:
+            return (local, cached[0])
+        try:
+            shared = self._shared.get_generation(collection_name)
+        except Exception as e:
+            logger.warning(f"读取共享版本号失败, 本次查询不使用缓存: {e}")
+            return None
+        self._shared_generations[collection_name] = (shared, now)
+        return (local, shared)
+
+    def invalidate(self, collection_name: str):
+        """集合内容发生变化, 之前缓存的该集合的查询结果全部失效 (启用共享版本号时对所有进程生效)"""
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+        self._shared_generations.pop(collection_name, None)
+        pending = getattr(self._deferred, "collections", None)
+        if pending is not None:
+            pending.add(collection_name)
+        else:
+            self._bump_shared(collection_name)
+
+    @contextmanager
+    def deferred(self):
+        """
+        with 块内多次失效同一个集合时, 本进程的版本号立即加一, 共享版本号只在退出时加一
+
+        同步一个事务的变更会先删除再写入, 每个集合只需要一次 MySQL 写入; 写入全部完成后才更新共享版本号,
+        其它进程不会在新版本号下缓存写入一半的结果. 可以嵌套, 最外层退出时更新
+        """
+        if getattr(self._deferred, "collections", None) is not None:
+            yield
+            return
+        self._deferred.collections = set()
+        try:
+            yield
+        finally:
+            collections, self._deferred.collections = self._deferred.collections, None
+            for collection_name in sorted(collections):
+                self._bump_shared(collection_name)
+
+    def _bump_shared(self, collection_name: str):
+        if self._shared is None:
+            return
+        self._shared_generations.pop(collection_name, None)
+        try:
+            self._shared.bump_generation(collection_name)
+        except Exception as e:
+            logger.exception(f"更新共享版本号失败, 其它进程的缓存在 ttl 过期前可能返回旧结果: {e}")
+
+    def clear(self):
+        self._results.clear()
+        self._embeddings.clear()
+
+    def get_embeddings(self, texts: list[str]) -> list[Any | None]:
+        """按顺序返回已缓存的查询向量, 未命中的位置为 None"""
+        embeddings = [self._embeddings.get(text) for text in texts]
+        if metrics.enabled:
+            hits = sum(embedding is not None for embedding in embeddings)
+            metrics.inc("query_cache_requests_total", hits, kind="embedding", result="hit")
+            metrics.inc("query_cache_requests_total", len(texts) - hits, kind="embedding", result="miss")
+        return embeddings
+
+    def put_embeddings(self, texts: list[str], embeddings: list[Any]):
+        for text, embedding in zip(texts, embeddings):
+            self._embeddings.put(text, embedding)
+
+    def result_key(self, collection_name: str, generation: Hashable, query_embeddings: Any, **query) -> tuple:
+        """
+        结果缓存的键: 集合、版本号、查询向量的摘要和其余查询参数 (where、n_results、aggregation 等)
+
+        查询文本会先转换为查询向量, 所以同一文本和直接传入同一向量的查询共用缓存
+        """
+        vectors = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        digest = hashlib.blake2b(vectors.tobytes(), digest_size=16).hexdigest()
+        params = json.dumps(query, sort_keys=True, ensure_ascii=False, default=str)
+        return (collection_name, generation, vectors.shape, digest, params)
+
+    def get_result(self, key: tuple) -> list[tuple[str, float]] | None:
+        result = self._results.get(key)
+        metrics.inc("query_cache_requests_total", kind="result", result="miss" if result is None else "hit")
+        return list(result) if result is not None else None
+
+    def put_result(self, key: tuple, result: list[tuple[str, float]]):
+        self._results.put(key, tuple(result))
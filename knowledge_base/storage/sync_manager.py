@@ -1,16 +1,41 @@
-from sqlalchemy import event
+import json
+import os
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session, object_session
 
-from .chromadb_client import ChromaDBClient
-from .mysql_client import MySQLClient
-from .models import Question, KnowledgePoint
-from ..utils import logger
+from .vector_store import VectorStore
+from .mysql_client import MySQLClient, fetch_records_by_uuids
+from .keyword_index import KeywordIndex
+from .models import Question, KnowledgePoint, SyncOutbox, QuestionChange
+from ..utils import logger, metrics
 
 class SyncManager:
-    def __init__(self, mysql_client: MySQLClient, chromadb_client: ChromaDBClient):
+    """
+    MySQL 到向量存储 (ChromaDB 或 NumPy) 的同步管理器
+
+    行级事件 (after_insert/after_update/after_delete) 只记录待同步的变更, 变更缓存在 session.info 中
+    - commit 模式: 事务提交 (after_commit) 后按集合批量删除/写入向量存储, 事务回滚 (after_rollback) 时直接丢弃
+    - outbox 模式: 每次 flush 后 (after_flush) 将变更批量写入 sync_outbox 表, 与业务数据同属一个事务,
+      由 SyncWorker 在后台同步到向量存储
+
+    两种模式下试题的变更都会在同一事务中写入 question_changes 表, 供所有进程的 KeywordIndex 增量刷新
+    """
+
+    PENDING_KEY = "sync_manager_pending"
+    QUESTION_CHANGES_KEY = "sync_manager_question_changes"
+    MODES = ("commit", "outbox")
+    TABLES = {"questions": Question, "knowledge_points": KnowledgePoint}
+
+    def __init__(self, mysql_client: MySQLClient, vector_store: VectorStore, mode: str = "commit", keyword_index: KeywordIndex | None = None):
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的同步模式: {mode}")
         self.mysql_client = mysql_client
-        self.chromadb_client = chromadb_client
+        self.vector_store = vector_store
+        self.mode = mode
+        # 关键词索引与向量存储使用同一批变更更新
+        self.keyword_index = keyword_index
         self.register_events()
-    
+
     def _type_valid(self, target):
         """ 检查目标类型是否支持 """
         if isinstance(target, Question):
@@ -21,58 +46,248 @@ class SyncManager:
             logger.error(f"不支持的类型: {type(target)}")
             return False
 
+    def _collection_name(self, target) -> str:
+        """ 获取目标对应的 ChromaDB 集合名称 """
+        return "questions" if isinstance(target, Question) else "knowledge_points"
+
+    def _record(self, target, op: str):
+        """
+        记录一条待同步的变更, 同一 uuid 的多次变更会被合并
+
+        Args:
+            target: Question 或 KnowledgePoint 对象
+            op: insert, update 或 delete
+        """
+        session = object_session(target)
+        # 只处理本管理器对应数据库的 session
+        if session is None or session.bind is not self.mysql_client.engine:
+            return
+        # outbox 模式下由 SyncWorker 从 MySQL 读取最新数据, 不需要保存元数据
+        metadata = target.to_dict() if op != "delete" and self.mode == "commit" else None
+        self._add_pending(session, self._collection_name(target), str(target.uuid), op, metadata)
+        if isinstance(target, Question):
+            session.info.setdefault(self.QUESTION_CHANGES_KEY, []).append(str(target.uuid))
+
+    def _add_pending(self, session: Session, collection_name: str, uuid: str, op: str, metadata: dict | None):
+        """将一条变更合并到 session 的待同步变更中"""
+        pending = session.info.setdefault(self.PENDING_KEY, {"questions": {}, "knowledge_points": {}})
+        changes = pending[collection_name]
+        previous = changes.pop(uuid, None)
+        previous_op = previous[0] if previous else None
+        if previous_op == "insert" and op == "delete":
+            # 本事务内插入又删除, ChromaDB 中从未出现过
+            return
+        if previous_op == "insert":
+            op = "insert"
+        elif previous_op == "delete" and op == "insert":
+            op = "update"
+        changes[uuid] = (op, metadata)
+
+    def track_inserted(self, session: Session, collection_name: str, uuids: list[str]):
+        """
+        记录通过 Core insert 批量写入的记录, Core 语句不经过 ORM, 不会触发 after_insert 事件
+
+        必须在插入语句执行之后、事务提交之前调用, 变更与插入的数据一起提交或回滚
+        - commit 模式: 在同一事务中读回插入的记录, 提交后随其它变更一起同步到向量存储
+        - outbox 模式: 直接在当前事务的连接上写入 sync_outbox
+
+        Args:
+            session: 执行插入的 session
+            collection_name: questions 或 knowledge_points
+            uuids: 插入记录的 uuid
+        """
+        if not uuids:
+            return
+        if collection_name == "questions":
+            session.connection().execute(insert(QuestionChange), [{"uuid": uuid} for uuid in uuids])
+        if self.mode == "outbox":
+            rows = [{"collection": collection_name, "uuid": uuid, "op": "insert"} for uuid in uuids]
+            session.connection().execute(insert(SyncOutbox), rows)
+            logger.debug(f"写入 sync_outbox: {len(rows)}")
+            return
+        table = self.TABLES[collection_name]
+        for record in fetch_records_by_uuids(session, table, uuids):
+            self._add_pending(session, collection_name, str(record.uuid), "insert", record.to_dict())
+            # 提交前已取出元数据, 不需要保留在 identity map 中
+            session.expunge(record)
+
     def sync_on_insert(self, mapper, connection, target):
-        """监听 MySQL 插入事件，同步到 ChromaDB"""
+        """监听 MySQL 插入事件，记录待同步到 ChromaDB 的变更"""
         try:
             logger.debug(f"Syncing on insert: {target}")
-            metadata = target.to_dict()
             if self._type_valid(target):
-                if isinstance(target, Question):
-                    self.chromadb_client.add_question(data=metadata)
-                elif isinstance(target, KnowledgePoint):
-                    self.chromadb_client.add_knowledge_point(data=metadata)
+                self._record(target, "insert")
         except Exception as e:
             logger.exception(f"Failed to sync on insert: {e}")
             raise e
 
     def sync_on_update(self, mapper, connection, target):
-        """监听 MySQL 更新事件，同步到 ChromaDB"""
+        """监听 MySQL 更新事件，记录待同步到 ChromaDB 的变更"""
         try:
             logger.debug(f"Syncing on update: {target}")
-            metadata = target.to_dict()
             if self._type_valid(target):
-                if isinstance(target, Question):
-                    self.chromadb_client.update_document(collection_name="questions", uuid=str(target.uuid), metadata=metadata)
-                elif isinstance(target, KnowledgePoint):
-                    self.chromadb_client.update_document(collection_name="knowledge_points", uuid=str(target.uuid), metadata=metadata)
+                self._record(target, "update")
         except Exception as e:
             logger.exception(f"Failed to sync on update: {e}")
             raise e
 
     def sync_on_delete(self, mapper, connection, target):
-        """监听 MySQL 删除事件，同步到 ChromaDB"""
+        """监听 MySQL 删除事件，记录待同步到 ChromaDB 的变更"""
         logger.debug(f"Syncing on delete: {target}")
         try:
             if self._type_valid(target):
-                if isinstance(target, Question):
-                    self.chromadb_client.delete_document(collection_name="questions", uuid=str(target.uuid))
-                elif isinstance(target, KnowledgePoint):
-                    self.chromadb_client.delete_document(collection_name="knowledge_points", uuid=str(target.uuid))
+                self._record(target, "delete")
         except Exception as e:
             logger.exception(f"Failed to sync on delete: {e}")
             raise e
 
-    def full_sync(self):
-        """全量同步 MySQL 到 ChromaDB"""
-        session = self.mysql_client.get_session()
-        # 同步 questions
-        questions = session.query(Question).all()
-        for question in questions:
-            self.chromadb_client.add_question(data=question.to_dict())
-        # 同步 knowledge_points
-        knowledge_points = session.query(KnowledgePoint).all()
-        for knowledge_point in knowledge_points:
-            self.chromadb_client.add_knowledge_point(data=knowledge_point.to_dict())
+    def _apply(self, pending: dict[str, dict[str, tuple[str, dict | None]]]):
+        """
+        将一个事务内的变更批量写入向量存储, 每个集合只有一次批量删除和一次批量添加
+
+        Args:
+            pending: 集合名称 -> {uuid: (op, metadata)}
+        """
+        # 一个事务的变更全部写入后每个集合的共享版本号只加一次
+        with self.vector_store.deferred_invalidation():
+            for collection_name, changes in pending.items():
+                if not changes:
+                    continue
+                # 更新和删除都需要先清理旧的切片, 切片 id 基于内容生成, 更新后会变化
+                stale = [uuid for uuid, (op, _) in changes.items() if op != "insert"]
+                data = [metadata for op, metadata in changes.values() if op != "delete"]
+                self.vector_store.delete_documents(collection_name, stale)
+                self.vector_store.add_documents(collection_name, data)  # type: ignore
+                if self.keyword_index is not None and collection_name == "questions":
+                    self.keyword_index.remove_many(stale)
+                    self.keyword_index.add_many(data)  # type: ignore
+                logger.debug(f"同步到集合: {collection_name}, 删除: {len(stale)}, 写入: {len(data)}")
+
+    def sync_on_commit(self, session: Session):
+        """监听事务提交事件，批量同步本事务内的变更"""
+        pending = session.info.pop(self.PENDING_KEY, None)
+        if not pending:
+            return
+        try:
+            with metrics.time("sync_apply_seconds", mode="commit"):
+                self._apply(pending)
+            metrics.inc("sync_applied_total", sum(len(changes) for changes in pending.values()), mode="commit")
+        except Exception as e:
+            metrics.inc("sync_failures_total", mode="commit")
+            logger.exception(f"Failed to sync on commit: {e}")
+            raise e
+
+    def sync_on_flush(self, session: Session, flush_context):
+        """监听 flush 事件，将本次 flush 的变更写入 sync_outbox 表"""
+        pending = session.info.pop(self.PENDING_KEY, None)
+        if not pending:
+            return
+        rows = [
+            {"collection": collection_name, "uuid": uuid, "op": op}
+            for collection_name, changes in pending.items()
+            for uuid, (op, _) in changes.items()
+        ]
+        if not rows:
+            return
+        try:
+            # 使用当前事务的连接, 与业务数据一起提交或回滚
+            session.connection().execute(insert(SyncOutbox), rows)
+            logger.debug(f"写入 sync_outbox: {len(rows)}")
+        except Exception as e:
+            logger.exception(f"Failed to write sync outbox: {e}")
+            raise e
+
+    def log_question_changes(self, session: Session, flush_context):
+        """监听 flush 事件, 将本次 flush 中变更的试题写入 question_changes 表"""
+        uuids = session.info.pop(self.QUESTION_CHANGES_KEY, None)
+        if not uuids:
+            return
+        session.connection().execute(insert(QuestionChange), [{"uuid": uuid} for uuid in dict.fromkeys(uuids)])
+
+    def sync_on_rollback(self, session: Session):
+        """监听事务回滚事件，丢弃本事务内的变更"""
+        session.info.pop(self.QUESTION_CHANGES_KEY, None)
+        pending = session.info.pop(self.PENDING_KEY, None)
+        if pending:
+            logger.debug(f"事务回滚, 丢弃待同步变更: { {name: len(changes) for name, changes in pending.items()} }")
+
+    def full_sync(self, batch_size: int = 1000, checkpoint_path: str | None = None):
+        """
+        增量式全量同步 MySQL 到向量存储
+
+        按主键顺序流式读取记录, 与向量存储中保存的内容哈希比较, 只重新写入新增或变化的记录,
+        然后删除 MySQL 中已不存在的 uuid 对应的切片
+
+        Args:
+            batch_size: 每批读取和写入的记录数量
+            checkpoint_path: 检查点文件路径, 指定后每批完成都会记录进度, 中断后再次调用会从上次的位置继续,
+                同步全部完成后删除检查点文件
+        """
+        checkpoint = self._load_checkpoint(checkpoint_path)
+        for collection_name, table in self.TABLES.items():
+            progress = checkpoint.setdefault(collection_name, {"last_id": 0, "done": False})
+            if progress["done"]:
+                logger.info(f"全量同步: {collection_name} 已完成, 跳过")
+                continue
+            self._stream_sync(collection_name, table, progress, batch_size, checkpoint, checkpoint_path)
+            self._delete_orphans(collection_name, table, batch_size)
+            progress["done"] = True
+            self._save_checkpoint(checkpoint_path, checkpoint)
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    def _stream_sync(self, collection_name: str, table, progress: dict, batch_size: int, checkpoint: dict, checkpoint_path: str | None):
+        """按主键分页同步一个集合中主键大于检查点的记录"""
+        synced, changed = 0, 0
+        for data in self.mysql_client.iter_pages(table, batch_size=batch_size, after_id=progress["last_id"]):
+            hashes = self.vector_store.get_content_hashes(collection_name, [item["uuid"] for item in data])
+            updates = [item for item in data if hashes.get(item["uuid"], "") != self.vector_store.content_hash(item)]
+            with self.vector_store.deferred_invalidation():
+                self.vector_store.delete_documents(collection_name, [item["uuid"] for item in updates if item["uuid"] in hashes])
+                self.vector_store.add_documents(collection_name, updates)
+            synced += len(data)
+            changed += len(updates)
+            progress["last_id"] = data[-1]["id"]
+            self._save_checkpoint(checkpoint_path, checkpoint)
+        logger.info(f"全量同步: {collection_name}, 读取: {synced}, 写入: {changed}")
+
+    def _delete_orphans(self, collection_name: str, table, batch_size: int):
+        """
+        删除向量存储中存在但 MySQL 中已不存在的 uuid 对应的切片
+
+        按 iter_uuids 分页, 每页到 MySQL 中查询存在的 uuid; 遍历结束后再删除, 避免删除影响向量存储的分页
+        """
+        orphans = []
+        page = []
+        for uuid in self.vector_store.iter_uuids(collection_name, batch_size):
+            page.append(uuid)
+            if len(page) >= batch_size:
+                existing = self.mysql_client.existing_uuids(table, page)
+                orphans.extend(uuid for uuid in page if uuid not in existing)
+                page = []
+        if page:
+            existing = self.mysql_client.existing_uuids(table, page)
+            orphans.extend(uuid for uuid in page if uuid not in existing)
+        for start in range(0, len(orphans), batch_size):
+            self.vector_store.delete_documents(collection_name, orphans[start:start + batch_size])
+        logger.info(f"全量同步: {collection_name}, 删除孤立记录: {len(orphans)}")
+
+    def _load_checkpoint(self, checkpoint_path: str | None) -> dict:
+        if checkpoint_path is None or not os.path.exists(checkpoint_path):
+            return {}
+        with open(checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        logger.info(f"从检查点继续全量同步: {checkpoint}")
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint_path: str | None, checkpoint: dict):
+        if checkpoint_path is None:
+            return
+        # 先写临时文件再替换, 避免中断时留下不完整的检查点
+        temp_path = f"{checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, checkpoint_path)
 
     def register_events(self):
         """注册 SQLAlchemy 事件监听"""
@@ -81,4 +296,10 @@ class SyncManager:
         event.listen(Question, "after_delete", self.sync_on_delete)
         event.listen(KnowledgePoint, "after_insert", self.sync_on_insert)
         event.listen(KnowledgePoint, "after_update", self.sync_on_update)
-        event.listen(KnowledgePoint, "after_delete", self.sync_on_delete)
\ No newline at end of file
+        event.listen(KnowledgePoint, "after_delete", self.sync_on_delete)
+        event.listen(self.mysql_client.Session, "after_flush", self.log_question_changes)
+        if self.mode == "outbox":
+            event.listen(self.mysql_client.Session, "after_flush", self.sync_on_flush)
+        else:
+            event.listen(self.mysql_client.Session, "after_commit", self.sync_on_commit)
+        event.listen(self.mysql_client.Session, "after_rollback", self.sync_on_rollback)
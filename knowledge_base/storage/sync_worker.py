@@ -0,0 +1,250 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, update
+
+from .vector_store import VectorStore
+from .mysql_client import MySQLClient, fetch_records_by_uuids
+from .keyword_index import KeywordIndex
+from .models import Question, KnowledgePoint, SyncOutbox
+from ..utils import logger, metrics
+
+class SyncWorker:
+    """
+    后台同步工作线程池, 从 sync_outbox 表中批量读取变更并同步到向量存储
+
+    同步时以 MySQL 中的当前数据为准: 先删除 uuid 对应的全部切片, 记录仍存在时再重新添加,
+    因此同一条变更重复处理 (重试) 的结果是一致的
+
+    每批变更分三步处理, 写入向量存储期间不持有行锁, 也没有打开的事务:
+    1. 认领: 在短事务中 (SKIP LOCKED) 将一批变更标记为 processing, 记录 claimed_at 和认领标识, 然后提交
+    2. 在事务之外读取 MySQL 中的最新数据并写入向量存储
+    3. 在第二个短事务中删除已完成的变更, 失败时改回 pending 并退避
+    worker 在第 2 步崩溃时变更停留在 processing, 超过 claim_timeout 秒后由其它 worker 重新认领
+
+    认领只保证同一行不会被两个 worker 同时处理, 同一 uuid 的新旧两条变更仍可能被不同的 worker
+    同时处理, 读到旧快照的 worker 可能最后写入。因此每次写入后都在新的事务中重新读取 MySQL,
+    内容哈希与写入的数据不一致时用最新数据重写: 最后一次写入之后总有一次校验, 向量存储最终与 MySQL 一致
+    """
+
+    TABLES = {"questions": Question, "knowledge_points": KnowledgePoint}
+    # 写入后校验不一致时的最大重写次数, 超过后整批按失败重试
+    MAX_REWRITES = 3
+
+    def __init__(self, mysql_client: MySQLClient, vector_store: VectorStore, config: dict | None = None, keyword_index: KeywordIndex | None = None):
+        config = config or {}
+        self.mysql_client = mysql_client
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.workers = config.get("workers", 2)
+        self.batch_size = config.get("batch_size", 256)
+        self.poll_interval = config.get("poll_interval", 1.0)
+        self.max_attempts = config.get("max_attempts", 5)
+        self.retry_delay = config.get("retry_delay", 5.0)
+        self.claim_timeout = config.get("claim_timeout", 300.0)
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        """启动后台工作线程"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"sync-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"启动同步工作线程: {self.workers}")
+
+    def stop(self, timeout: float | None = None):
+        """停止后台工作线程, 等待正在处理的批次完成"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("同步工作线程已停止")
+
+    def _run(self):
+        reported_at = 0.0
+        while not self._stop_event.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                logger.exception(f"同步工作线程处理失败: {e}")
+                processed = 0
+            # 同步指标每个 poll_interval 最多更新一次
+            if time.monotonic() - reported_at >= self.poll_interval:
+                self.report_metrics()
+                reported_at = time.monotonic()
+            if processed == 0:
+                self._stop_event.wait(self.poll_interval)
+
+    def drain(self) -> int:
+        """在当前线程中处理完所有可处理的变更, 返回处理的条数"""
+        total = 0
+        while processed := self.process_batch():
+            total += processed
+        return total
+
+    def process_batch(self) -> int:
+        """
+        认领并处理一批变更
+
+        Returns:
+            本批次处理的变更条数, 0 表示当前没有可处理的变更
+        """
+        claim, rows = self._claim()
+        if not rows:
+            return 0
+        try:
+            with metrics.time("sync_apply_seconds", mode="outbox"):
+                self._apply(rows)
+        except Exception as e:
+            metrics.inc("sync_failures_total", mode="outbox")
+            logger.exception(f"同步批次失败, 稍后重试: {e}")
+            self._release(claim, rows, str(e))
+            return len(rows)
+        with self.mysql_client.session_scope() as session:
+            # 只删除仍由本次认领的行: 超时后被其它 worker 重新认领的行由对方删除
+            session.execute(delete(SyncOutbox).where(*self._claimed_by(claim, rows)))
+        metrics.inc("sync_applied_total", len(rows), mode="outbox")
+        logger.debug(f"同步批次完成: {len(rows)}")
+        return len(rows)
+
+    @staticmethod
+    def _claimed_by(claim: str, rows: list[SyncOutbox]) -> list:
+        return [
+            SyncOutbox.id.in_([row.id for row in rows]),
+            SyncOutbox.status == "processing",
+            SyncOutbox.claimed_by == claim,
+        ]
+
+    def _claim(self) -> tuple[str, list[SyncOutbox]]:
+        """
+        在短事务中认领一批到期的 pending 变更和认领超时的 processing 变更, 提交后返回认领标识和认领的行
+
+        SKIP LOCKED 使多个 worker 可以并行认领不同的批次; 不支持行锁的数据库 (SQLite) 上用带条件的 UPDATE
+        认领, 再按认领标识读回, 被其它 worker 先认领的行不会返回
+        """
+        now = datetime.now()
+        claim = uuid.uuid4().hex
+        claimable = or_(
+            and_(SyncOutbox.status == "pending", SyncOutbox.available_at <= now),
+            and_(SyncOutbox.status == "processing", SyncOutbox.claimed_at < now - timedelta(seconds=self.claim_timeout)),
+        )
+        with self.mysql_client.session_scope() as session:
+            rows = (
+                session.query(SyncOutbox)
+                .filter(claimable)
+                .order_by(SyncOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not rows:
+                return claim, []
+            expired = [row.id for row in rows if row.status == "processing"]
+            if expired:
+                logger.warning(f"重新认领超时的同步变更: {len(expired)}")
+            session.execute(
+                update(SyncOutbox)
+                .where(SyncOutbox.id.in_([row.id for row in rows]), claimable)
+                .values(status="processing", claimed_at=now, claimed_by=claim)
+                .execution_options(synchronize_session=False)
+            )
+            session.expunge_all()
+            rows = (
+                session.query(SyncOutbox)
+                .filter(*self._claimed_by(claim, rows))
+                .order_by(SyncOutbox.id)
+                .all()
+            )
+        return claim, rows
+
+    def _release(self, claim: str, rows: list[SyncOutbox], error: str):
+        """在短事务中将处理失败的变更改回 pending 并按指数退避, 超过最大重试次数后标记为 failed, 不再自动处理"""
+        now = datetime.now()
+        with self.mysql_client.session_scope() as session:
+            for row in session.query(SyncOutbox).filter(*self._claimed_by(claim, rows)):
+                row.attempts += 1
+                row.last_error = error[:2048]
+                row.available_at = now + timedelta(seconds=self.retry_delay * 2 ** (row.attempts - 1))
+                row.status = "failed" if row.attempts >= self.max_attempts else "pending"
+                row.claimed_at = row.claimed_by = None
+
+    def _apply(self, rows: list[SyncOutbox]):
+        """按集合合并变更, 从 MySQL 读取最新数据后批量写入向量存储, 写入后校验并重写过期的数据"""
+        uuids_by_collection: dict[str, list[str]] = {}
+        for row in rows:
+            uuids = uuids_by_collection.setdefault(str(row.collection), [])
+            if row.uuid not in uuids:
+                uuids.append(str(row.uuid))
+        for collection_name, uuids in uuids_by_collection.items():
+            table = self.TABLES.get(collection_name)
+            if table is None:
+                logger.error(f"不支持的集合名称: {collection_name}")
+                continue
+            with self.mysql_client.session_scope() as session:
+                data = [record.to_dict() for record in fetch_records_by_uuids(session, table, uuids)]
+            for _ in range(self.MAX_REWRITES + 1):
+                self._write(collection_name, uuids, data)
+                uuids, data = self._stale(table, uuids, data)
+                if not uuids:
+                    break
+                metrics.inc("sync_rewrites_total", len(uuids), mode="outbox")
+                logger.info(f"同步期间 {collection_name} 的 {len(uuids)} 条记录被修改, 使用最新数据重写")
+            else:
+                raise RuntimeError(f"{collection_name} 的记录在同步期间持续变化: {uuids[:10]}")
+
+    def _write(self, collection_name: str, uuids: list[str], data: list[dict]):
+        # 删除和写入完成后共享版本号只加一次
+        with self.vector_store.deferred_invalidation():
+            self.vector_store.delete_documents(collection_name, uuids)
+            self.vector_store.add_documents(collection_name, data)
+        if self.keyword_index is not None and collection_name == "questions":
+            self.keyword_index.remove_many(uuids)
+            self.keyword_index.add_many(data)
+
+    def _stale(self, table, uuids: list[str], data: list[dict]) -> tuple[list[str], list[dict]]:
+        """
+        在新的事务中重新读取 MySQL, 返回与刚写入的数据不一致的 uuid 及其最新数据
+
+        必须使用新的事务: 可重复读隔离级别下, 原事务只能读到开始时的快照
+        """
+        written = {item["uuid"]: self.vector_store.content_hash(item) for item in data}
+        with self.mysql_client.session_scope() as session:
+            current = {record.uuid: record.to_dict() for record in fetch_records_by_uuids(session, table, uuids)}
+        stale = [
+            uuid for uuid in uuids
+            if written.get(uuid) != (self.vector_store.content_hash(current[uuid]) if uuid in current else None)
+        ]
+        return stale, [current[uuid] for uuid in stale if uuid in current]
+
+    def pending_count(self) -> int:
+        """待同步的变更条数, 包括正在处理的"""
+        with self.mysql_client.session_scope() as session:
+            return session.query(SyncOutbox).filter(SyncOutbox.status.in_(["pending", "processing"])).count()
+
+    def lag_seconds(self) -> float:
+        """同步延迟, 即最早一条待同步变更距今的秒数, 没有待同步变更时为 0"""
+        with self.mysql_client.session_scope() as session:
+            oldest = (
+                session.query(SyncOutbox.created_at)
+                .filter(SyncOutbox.status.in_(["pending", "processing"]))
+                .order_by(SyncOutbox.id)
+                .limit(1)
+                .scalar()
+            )
+            return (datetime.now() - oldest).total_seconds() if oldest else 0.0
+
+    def report_metrics(self):
+        """更新同步延迟和待同步数量指标, 指标关闭时不查询数据库"""
+        if not metrics.enabled:
+            return
+        try:
+            metrics.set("sync_lag_seconds", self.lag_seconds())
+            metrics.set("sync_pending", self.pending_count())
+        except Exception as e:
+            logger.warning(f"读取同步指标失败: {e}")
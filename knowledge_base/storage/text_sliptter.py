@@ -1,5 +1,9 @@
+import re
+import threading
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, List
+
+from ..utils import logger
 
 class TextSplitter(ABC):
     """抽象字符串切分接口类"""
@@ -18,6 +22,10 @@ class TextSplitter(ABC):
             List of strings
         """
         pass
+
+    def warmup(self):
+        """预先加载切分所需的资源, 默认不需要"""
+        pass
     
     def get_name(self) -> str:
         """
@@ -48,4 +56,112 @@ class CharacterTextSplitter(TextSplitter):
                 break
         
         return chunks
-    
\ No newline at end of file
+    
+class SentenceTextSplitter(TextSplitter):
+    """
+    按中文句子和标点切分, 再把相邻的句子合并到不超过 max_length 个 token 的切片中
+
+    - 先按句末标点 (。！？；和换行) 切分, 超长的句子再按句内标点 (，、：) 切分, 仍然超长时按长度截断
+    - 长度由 embedding 模型的分词器计算, 且不超过模型的 max_tokens (bge 为 512, 需要留出 [CLS]/[SEP]);
+      没有分词器或分词器加载失败时按字符数计算, bge 中文分词器基本一字一 token, 字符数是一个接近的上界
+    - overlap 为相邻切片之间重叠的 token 数, 以整句为单位重叠
+    - 不会返回空切片或重复的切片, 空文档返回空列表
+
+    Args:
+        tokenizer: HuggingFace 分词器对象或模型名称 (第一次使用时加载), None 表示按字符数计算
+        max_tokens: 模型能处理的最大 token 数, 包括特殊 token
+    """
+
+    SENTENCE_END = re.compile(r"(?<=[。！？；!?;\n])")
+    CLAUSE_END = re.compile(r"(?<=[，、：,:])")
+    SPECIAL_TOKENS = 2
+
+    def __init__(self, tokenizer: Any = None, max_tokens: int = 512):
+        self._tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self) -> Any:
+        if isinstance(self._tokenizer, str):
+            with self._lock:
+                if isinstance(self._tokenizer, str):
+                    model_name = self._tokenizer
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+                    except Exception as e:
+                        logger.warning(f"加载分词器失败, 按字符数切分: {model_name}, {e}")
+                        self._tokenizer = None
+        return self._tokenizer
+
+    def warmup(self):
+        """预先加载分词器"""
+        return self.tokenizer
+
+    def count_tokens(self, text: str) -> int:
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return len(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def split(self, document: str, max_length: int, overlap: int) -> List[str]:
+        if not document or not document.strip():
+            return []
+        max_length = min(max_length, self.max_tokens - self.SPECIAL_TOKENS)
+        overlap = min(overlap, max_length // 2)
+        pieces = [(piece, self.count_tokens(piece)) for piece in self._pieces(document, max_length)]
+
+        chunks: List[str] = []
+        current: List[tuple[str, int]] = []
+        size = 0
+        for piece, length in pieces:
+            if current and size + length > max_length:
+                chunks.append("".join(text for text, _ in current))
+                # 保留末尾不超过 overlap 个 token 的整句作为下一个切片的开头
+                kept: List[tuple[str, int]] = []
+                kept_size = 0
+                for text, text_length in reversed(current):
+                    if kept_size + text_length > overlap or kept_size + text_length + length > max_length:
+                        break
+                    kept.insert(0, (text, text_length))
+                    kept_size += text_length
+                current, size = kept, kept_size
+            current.append((piece, length))
+            size += length
+        if current:
+            chunks.append("".join(text for text, _ in current))
+
+        return list(dict.fromkeys(chunk.strip() for chunk in chunks if chunk.strip()))
+
+    def _pieces(self, document: str, max_length: int) -> List[str]:
+        """把文档切分为不超过 max_length 个 token 的句子或子句"""
+        pieces: List[str] = []
+        for sentence in self.SENTENCE_END.split(document):
+            if not sentence.strip():
+                continue
+            if self.count_tokens(sentence) <= max_length:
+                pieces.append(sentence)
+                continue
+            for clause in self.CLAUSE_END.split(sentence):
+                if not clause.strip():
+                    continue
+                if self.count_tokens(clause) <= max_length:
+                    pieces.append(clause)
+                else:
+                    pieces.extend(self._truncate(clause, max_length))
+        return pieces
+
+    def _truncate(self, text: str, max_length: int) -> List[str]:
+        """没有标点可以切分的超长文本, 按 token 数截断"""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return [text[i:i + max_length] for i in range(0, len(text), max_length)]
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        parts = []
+        for start in range(0, len(offsets), max_length):
+            window = offsets[start:start + max_length]
+            end = offsets[start + max_length][0] if start + max_length < len(offsets) else len(text)
+            parts.append(text[window[0][0]:end])
+        return parts
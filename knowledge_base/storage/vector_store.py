@@ -0,0 +1,470 @@
+import json
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Any, Iterator, Optional, Union
+
+from chromadb.api.types import (
+    Embedding,
+    PyEmbedding,
+    OneOrMany,
+    Document,
+    Image,
+    URI,
+    ID,
+    Where,
+    WhereDocument,
+    Include,
+)
+
+from ..embedding import CachedEmbeddingFunction, MeteredEmbeddingFunction, MicroBatchingEmbeddingFunction
+from ..utils import get_content_based_uuid, logger, metrics
+from .text_sliptter import SentenceTextSplitter
+from .query_cache import QueryCache
+
+
+class VectorStore(ABC):
+    """
+    向量存储接口, SyncManager、SyncWorker、QuestionFinder 和 TestGenerator 只依赖这个接口
+
+    文档切分、内容哈希、按集合分派写入和按父文档分组查询的逻辑在这里实现, 子类只需要实现
+    切片级别的写入、删除、查询和读取
+    """
+
+    # where 条件中 $in 列表的最大长度, 避免超过 SQLite 的变量数量限制
+    FILTER_BATCH_SIZE = 500
+    # 指标中的 backend 标签
+    backend = ""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.embedding_function = config.get("embedding_function", None)
+        if self.embedding_function is not None:
+            # 在缓存内层记录指标, 只统计真正交给模型计算的文本
+            self.embedding_function = MeteredEmbeddingFunction(self.embedding_function)
+        embedding_cache = config.get("embedding_cache", None)
+        if embedding_cache is not None and self.embedding_function is not None:
+            # 重复的文本 (重新添加、更新、全量同步) 直接从缓存读取向量, 不再经过模型
+            self.embedding_function = CachedEmbeddingFunction(self.embedding_function, **embedding_cache)
+        # 查询文本使用的 embedding function, 开启 query_batching 时合并并发查询的文本, 一次批量计算
+        self.query_embedding_function = self.embedding_function
+        query_batching = config.get("query_batching", None)
+        if query_batching is not None and self.embedding_function is not None:
+            self.query_embedding_function = MicroBatchingEmbeddingFunction(self.embedding_function, **query_batching)
+        # 查询向量和查询结果缓存, 写入和删除会使对应集合的结果缓存失效
+        query_cache = config.get("query_cache", None)
+        self.query_cache = QueryCache(**query_cache) if query_cache is not None else None
+        # 默认按句子切分, 切片长度以 token 计, 一道题的题干、答案、选项通常各自只有一个切片
+        self.text_splitter = config.get("text_splitter", SentenceTextSplitter())
+        self.max_length = config.get("max_length", 512)
+        self.overlap = config.get("overlap", 0)
+        # 批量写入时每次写入的切片数量, 同时也是一次 embedding 的批大小
+        self.batch_size = config.get("batch_size", 256)
+        # 分组查询时初始候选切片数量为 n_results * candidate_factor, 切片分数按 aggregation 聚合
+        self.candidate_factor = config.get("candidate_factor", 4)
+        self.aggregation = config.get("aggregation", "max")
+
+    @abstractmethod
+    def _add_documents(self, collection_name: str, documents: list[tuple[str, dict]]):
+        """
+        批量添加文档, 先对所有文档进行文本分割, 然后按 batch_size 分批写入
+
+        Args:
+            collection_name: 集合名称
+            documents: (文档, 文档元数据) 列表
+        """
+
+    @abstractmethod
+    def delete_documents(self, collection_name: str, uuids: list[str]):
+        """
+        批量删除 metadata 中 uuid 属于 uuids 的所有切片
+
+        Args:
+            collection_name: 集合名称
+            uuids: 原始 uuid 列表
+        """
+
+    @abstractmethod
+    def count(self, collection_name: str) -> int:
+        """集合中的切片数量"""
+
+    @abstractmethod
+    def _query_chunks(self, collection_name: str, n_results: int, **query) -> dict[str, Any]:
+        """
+        切片级别的查询, 返回格式与 chromadb 的 collection.query 一致, 至少包含 ids、metadatas 和 distances
+
+        Args:
+            collection_name: 集合名称
+            n_results: 每个查询返回的切片数量
+            query: query_embeddings、query_texts、where 等查询参数, 值为 None 的参数已被去掉
+        """
+
+    @abstractmethod
+    def get_content_hashes(self, collection_name: str, uuids: list[str]) -> dict[str, str | None]:
+        """
+        批量获取已入库记录的内容哈希
+
+        Returns:
+            uuid -> 内容哈希, 不在集合中的 uuid 不会出现在结果中, 旧数据没有哈希时为 None
+        """
+
+    @abstractmethod
+    def iter_uuids(self, collection_name: str, page_size: int = 1000) -> Iterator[str]:
+        """遍历集合中的所有原始 uuid (每个 uuid 只返回一次)"""
+
+    @abstractmethod
+    def query_metadata(
+        self,
+        collection_name: str,
+        uuids: list[str],
+        include: Include = ["metadatas", "documents"],
+    ) -> dict[str, dict[str, list]]:
+        """
+        批量查询 uuid 对应的所有切片
+
+        Returns:
+            uuid -> {"ids": [...], include 中的每个字段: [...]}, 没有切片的 uuid 对应空列表
+        """
+
+    @staticmethod
+    def content_hash(data: dict) -> str:
+        """计算一条记录的内容哈希, 用于全量同步时判断记录是否发生变化"""
+        content = {k: v for k, v in data.items() if k != "content_hash"}
+        return get_content_based_uuid(json.dumps(content, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _with_content_hash(self, data: dict) -> dict:
+        return {**data, "content_hash": self.content_hash(data)}
+
+    def _question_documents(self, data: dict) -> list[tuple[str, dict]]:
+        """将一条试题拆成需要入库的 (文本, 元数据) 列表: 题干、答案和选项"""
+        documents = [(data["question"], data), (data["answer"], data)]
+        options = data.get("options", None)
+        if options is not None:
+            documents.append((options, data))
+        return documents
+
+    def _build_chunks(
+        self, documents: list[tuple[str, dict]]
+    ) -> tuple[list[str], list[str], list[dict]]:
+        """
+        对文档进行文本分割, 并汇总所有切片
+
+        Args:
+            documents: (文档, 文档元数据) 列表
+
+        Returns:
+            (ids, chunks, metadatas), 同一批次内重复的切片只保留第一次出现的
+        """
+        ids, chunks, metadatas = [], [], []
+        seen = set()
+        for document, metadata in documents:
+            for chunk in self.text_splitter.split(document, self.max_length, self.overlap):
+                chunk_uuid = get_content_based_uuid(chunk)
+                # 同一次 add 中出现重复 id 会直接报错, 逐条添加时重复 id 也只会保留第一条
+                if chunk_uuid in seen:
+                    continue
+                seen.add(chunk_uuid)
+                ids.append(chunk_uuid)
+                chunks.append(chunk)
+                metadatas.append(metadata)
+        return ids, chunks, metadatas
+
+    def add_question(self, data: dict) -> None:
+        self.add_questions([data])
+
+    def add_questions(self, data: list[dict]) -> None:
+        """
+        批量添加试题, 所有试题的题干、答案和选项切片会合并后分批写入
+
+        Args:
+            data: 试题元数据列表
+        """
+        try:
+            documents = [
+                document
+                for item in data
+                for document in self._question_documents(self._with_content_hash(item))
+            ]
+            with metrics.time("vector_store_seconds", backend=self.backend, op="add", collection="questions"):
+                self._add_documents("questions", documents)
+        except Exception as e:
+            logger.exception(f"Failed to add questions: {e}")
+            raise e
+        finally:
+            # 写入失败时也可能已经写入了部分切片
+            self.invalidate("questions")
+
+    def add_knowledge_point(self, data: dict) -> None:
+        self.add_knowledge_points([data])
+
+    def add_knowledge_points(self, data: list[dict]) -> None:
+        """
+        批量添加知识点
+
+        Args:
+            data: 知识点元数据列表
+        """
+        try:
+            documents = [(item["document"], self._with_content_hash(item)) for item in data]
+            with metrics.time("vector_store_seconds", backend=self.backend, op="add", collection="knowledge_points"):
+                self._add_documents("knowledge_points", documents)
+        except Exception as e:
+            logger.exception(f"Failed to add knowledge points: {e}")
+            raise e
+        finally:
+            self.invalidate("knowledge_points")
+
+    def add_documents(self, collection_name: str, data: list[dict]) -> None:
+        """
+        按集合名称批量添加文档
+
+        Args:
+            collection_name: 集合名称
+            data: 文档元数据列表
+        """
+        if collection_name == "questions":
+            self.add_questions(data)
+        elif collection_name == "knowledge_points":
+            self.add_knowledge_points(data)
+        else:
+            logger.error(f"不支持的集合名称: {collection_name}")
+
+    def update_document(self, collection_name: str, uuid: str, metadata: dict):
+        """
+        更新文档, 根据 uuid 删除文档, 然后重新添加
+
+        Args:
+            collection_name: 集合名称
+            uuid: 文档 uuid
+            metadata: 文档元数据
+        """
+        self.delete_document(collection_name, uuid)
+        self.add_documents(collection_name, [metadata])
+
+    def delete_document(self, collection_name: str, uuid: str):
+        """
+        删除 metadata 中指定 uuid 的所有切片
+
+        Args:
+            collection_name: 集合名称
+            uuid: 原始 uuid
+        """
+        self.delete_documents(collection_name, [uuid])
+
+    def invalidate(self, collection_name: str):
+        """
+        集合内容发生变化后调用, 使该集合的查询结果缓存失效
+
+        add_questions/add_knowledge_points 已经调用, 子类的 delete_documents 在删除后需要调用;
+        SyncManager 和 SyncWorker 同步变更时都经过这些方法, MySQL 中的修改同步后缓存随之失效,
+        共享版本号 (QueryCache.share_generations) 使其它进程的缓存同样失效
+        """
+        if self.query_cache is not None:
+            self.query_cache.invalidate(collection_name)
+
+    def deferred_invalidation(self):
+        """
+        同步一批变更时使用, with 块内的多次 invalidate 对每个集合只更新一次共享版本号, 见 QueryCache.deferred
+        """
+        if self.query_cache is None:
+            return nullcontext()
+        return self.query_cache.deferred()
+
+    def embed_queries(self, texts: list[str]) -> list:
+        """计算查询向量, 开启 query_cache 时已缓存的文本不再计算"""
+        if self.query_cache is None:
+            return self.query_embedding_function(texts)  # type: ignore
+        embeddings = self.query_cache.get_embeddings(texts)
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            computed = dict(zip(missing, self.query_embedding_function(missing)))  # type: ignore
+            self.query_cache.put_embeddings(missing, list(computed.values()))
+            embeddings = [computed[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    def _aggregate_scores(self, query_result, aggregation: str, rrf_k: int) -> dict[str, float]:
+        """
+        将切片级别的查询结果按 metadata 中的 uuid 聚合为父文档分数, 分数越大越相关
+
+        Args:
+            query_result: _query_chunks 的返回结果, 需要包含 metadatas 和 distances
+            aggregation: max 取最相似切片的分数, sum 累加所有切片的分数, rrf 使用倒数排名融合
+            rrf_k: rrf 的平滑常数
+        """
+        scores: dict[str, float] = {}
+        for metadatas, distances in zip(query_result["metadatas"], query_result["distances"]):
+            if len(metadatas) != len(distances):
+                raise ValueError("metadatas 和 distances 的长度不匹配")
+            for rank, (metadata, distance) in enumerate(zip(metadatas, distances), start=1):
+                uuid = str(metadata.get("uuid"))
+                if aggregation == "rrf":
+                    score = 1.0 / (rrf_k + rank)
+                else:
+                    score = 1.0 / (1.0 + float(distance))
+                if aggregation == "max":
+                    scores[uuid] = max(scores.get(uuid, 0.0), score)
+                else:
+                    scores[uuid] = scores.get(uuid, 0.0) + score
+        return scores
+
+    def query_uuid_scores(
+        self,
+        collection_name: str,
+        query_embeddings: Optional[
+            Union[
+                OneOrMany[Embedding],
+                OneOrMany[PyEmbedding],
+            ]
+        ] = None,
+        query_texts: Optional[OneOrMany[Document]] = None,
+        query_images: Optional[OneOrMany[Image]] = None,
+        query_uris: Optional[OneOrMany[URI]] = None,
+        ids: Optional[OneOrMany[ID]] = None,
+        n_results: int = 10,
+        where: Optional[Where] = None,
+        where_document: Optional[WhereDocument] = None,
+        aggregation: str | None = None,
+        rrf_k: int = 60,
+    ) -> list[tuple[str, float]]:
+        """
+        按父文档分组查询, 返回最相关的 n_results 个不重复的 uuid 及其分数
+
+        一个父文档会被切分为多个切片, 查询时先取 n_results * candidate_factor 个切片,
+        不足 n_results 个 uuid 时成倍扩大候选切片数量, 直到满足数量或集合中已没有更多切片
+
+        Args:
+            aggregation: 切片分数的聚合方式, 可选 max、sum、rrf, 默认使用配置中的 aggregation
+            rrf_k: rrf 的平滑常数
+
+        Returns:
+            按分数从高到低排列的 (uuid, score) 列表
+        """
+        aggregation = aggregation or self.aggregation
+        if aggregation not in ("max", "sum", "rrf"):
+            raise ValueError(f"不支持的聚合方式: {aggregation}")
+        # 在读取集合之前取版本号, 查询期间集合被修改时结果会存到旧版本下, 不会被之后的查询读到
+        generation = self.query_cache.generation(collection_name) if self.query_cache is not None else 0
+        if n_results <= 0:
+            return []
+        if query_texts is not None and query_embeddings is None and self.query_embedding_function is not None:
+            # 扩大候选集时会多次查询, 提前计算好查询向量, 避免重复 embedding
+            texts = [query_texts] if isinstance(query_texts, str) else list(query_texts)
+            query_embeddings = self.embed_queries(texts)
+            query_texts = None
+        cache_key = None
+        if (
+            self.query_cache is not None
+            and generation is not None
+            and query_embeddings is not None
+            and query_images is None
+            and query_uris is None
+        ):
+            cache_key = self.query_cache.result_key(
+                collection_name,
+                generation,
+                query_embeddings,
+                ids=ids,
+                n_results=n_results,
+                where=where,
+                where_document=where_document,
+                aggregation=aggregation,
+                rrf_k=rrf_k,
+            )
+            cached = self.query_cache.get_result(cache_key)
+            if cached is not None:
+                return cached
+        # 命中缓存时不需要读取集合大小
+        total = self.count(collection_name)
+        if total == 0:
+            return []
+        query = {
+            "query_embeddings": query_embeddings,
+            "query_texts": query_texts,
+            "query_images": query_images,
+            "query_uris": query_uris,
+            "ids": ids,
+            "where": where,
+            "where_document": where_document,
+        }
+        query = {key: value for key, value in query.items() if value is not None}
+        n_candidates = min(n_results * self.candidate_factor, total)
+        while True:
+            with metrics.time("vector_store_seconds", backend=self.backend, op="query", collection=collection_name):
+                result = self._query_chunks(collection_name, n_candidates, **query)
+            scores = self._aggregate_scores(result, aggregation, rrf_k)
+            exhausted = all(len(chunk_ids) < n_candidates for chunk_ids in result["ids"])
+            if len(scores) >= n_results or exhausted or n_candidates >= total:
+                break
+            n_candidates = min(n_candidates * 2, total)
+            logger.debug(f"候选切片不足 {n_results} 个 uuid, 扩大到: {n_candidates}")
+        result = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+        if cache_key is not None:
+            self.query_cache.put_result(cache_key, result)  # type: ignore
+        return result
+
+    def query_uuid(
+        self,
+        collection_name: str,
+        query_embeddings: Optional[
+            Union[
+                OneOrMany[Embedding],
+                OneOrMany[PyEmbedding],
+            ]
+        ] = None,
+        query_texts: Optional[OneOrMany[Document]] = None,
+        query_images: Optional[OneOrMany[Image]] = None,
+        query_uris: Optional[OneOrMany[URI]] = None,
+        ids: Optional[OneOrMany[ID]] = None,
+        n_results: int = 10,
+        where: Optional[Where] = None,
+        where_document: Optional[WhereDocument] = None,
+        aggregation: str | None = None,
+    ) -> list[str]:
+        """
+        按 metadata 中的 uuid 分组查询, 返回按相关性排序的 uuid 列表
+        """
+        scores = self.query_uuid_scores(
+            collection_name,
+            query_embeddings=query_embeddings,
+            query_texts=query_texts,
+            query_images=query_images,
+            query_uris=query_uris,
+            ids=ids,
+            n_results=n_results,
+            where=where,
+            where_document=where_document,
+            aggregation=aggregation,
+        )
+        return [uuid for uuid, _ in scores]
+
+    def warmup(self):
+        """预先加载 embedding 模型和切分器的分词器, 服务在接收请求前调用"""
+        warmup = getattr(self.query_embedding_function, "warmup", None)
+        if callable(warmup):
+            warmup()
+        warmup = getattr(self.text_splitter, "warmup", None)
+        if callable(warmup):
+            warmup()
+
+    def close(self):
+        """释放资源, 需要持久化的后端在这里保存数据, 子类覆盖时需要调用 super().close()"""
+        if isinstance(self.query_embedding_function, MicroBatchingEmbeddingFunction):
+            self.query_embedding_function.close()
+
+
+def create_vector_store(config: dict) -> VectorStore:
+    """
+    根据配置中的 backend 创建向量存储
+
+    Args:
+        config: 向量存储配置, backend 可选 chromadb (默认) 或 numpy
+    """
+    backend = config.get("backend", "chromadb")
+    if backend == "chromadb":
+        from .chromadb_client import ChromaDBClient
+
+        return ChromaDBClient(config)
+    if backend == "numpy":
+        from .numpy_store import NumpyVectorStore
+
+        return NumpyVectorStore(config)
+    raise ValueError(f"不支持的向量存储后端: {backend}")
@@ -0,0 +1,73 @@
+import operator
+from typing import Any
+
+import numpy as np
+
+# ChromaDB where 语法中支持的比较运算符
+_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+def where_fields(where: dict | None) -> set[str]:
+    """返回 where 条件中用到的所有字段"""
+    if not where:
+        return set()
+    fields = set()
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            for condition in value:
+                fields |= where_fields(condition)
+        else:
+            fields.add(key)
+    return fields
+
+
+def where_mask(columns: dict[str, np.ndarray], size: int, where: dict | None) -> np.ndarray:
+    """
+    按 ChromaDB 的 where 语法计算布尔掩码, 用于向量检索前的元数据预过滤
+
+    支持 {"field": value}、{"field": {"$eq"/"$ne"/"$gt"/"$gte"/"$lt"/"$lte"/"$in"/"$nin": value}}
+    以及 $and、$or 组合
+
+    Args:
+        columns: 字段名 -> 该字段所有行的取值 (object 数组)
+        size: 行数
+        where: 过滤条件, 为空时全部为 True
+    """
+    mask = np.ones(size, dtype=bool)
+    if not where:
+        return mask
+    for key, value in where.items():
+        if key == "$and":
+            for condition in value:
+                mask &= where_mask(columns, size, condition)
+        elif key == "$or":
+            any_mask = np.zeros(size, dtype=bool)
+            for condition in value:
+                any_mask |= where_mask(columns, size, condition)
+            mask &= any_mask
+        else:
+            mask &= _field_mask(columns[key][:size], value)
+    return mask
+
+
+def _field_mask(column: np.ndarray, condition: Any) -> np.ndarray:
+    if not isinstance(condition, dict):
+        return column == condition
+    mask = np.ones(len(column), dtype=bool)
+    for op, value in condition.items():
+        if op == "$in":
+            mask &= np.isin(column, list(value))
+        elif op == "$nin":
+            mask &= ~np.isin(column, list(value))
+        elif op in _OPERATORS:
+            mask &= np.array([_OPERATORS[op](item, value) for item in column], dtype=bool)
+        else:
+            raise ValueError(f"不支持的 where 运算符: {op}")
+    return mask
@@ -1,3 +1,5 @@
 from .test_generator import TestGenerator
+from .async_test_generator import AsyncTestGenerator
+from .keyword_extractor import KeywordExtractor, KeywordCache
 
-__all__ = ["TestGenerator"]
+__all__ = ["TestGenerator", "AsyncTestGenerator", "KeywordExtractor", "KeywordCache"]
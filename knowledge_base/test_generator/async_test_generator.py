@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, List
+
+from ..utils import logger, metrics
+from ..storage import AsyncMySQLClient, Question
+from .test_config import TestConfig, TestSectionConfig
+from .test_generator import Test, TestGenerator
+
+class AsyncTestGenerator:
+    """
+    TestGenerator 的异步版本, 查找器和配置与 TestGenerator 共用
+
+    - MySQL 查询使用 AsyncMySQLClient, 每个段落使用独立的 AsyncSession, 各段落并发查找
+    - 查询向量计算、向量检索等阻塞调用在 executor 中执行, executor 的线程数限制了同时进行的阻塞调用
+    - 关键词提取使用异步 LLM 客户端
+    """
+
+    def __init__(self, test_generator: TestGenerator, async_mysql_client: AsyncMySQLClient, executor: Executor | None = None):
+        self.test_generator = test_generator
+        self.async_mysql_client = async_mysql_client
+        self.executor = executor
+
+    async def generate_test(self, config: TestConfig) -> Test:
+        """生成测试试卷, 结果与 TestGenerator.generate_test 一致"""
+        logger.info(f"开始生成测试试卷: \n{config}")
+        test = Test()
+        try:
+            with metrics.time("generate_test_seconds", parallel="async"):
+                prepared = await self._prepare(config.sections)
+                results = await asyncio.gather(*(self._get_questions(section, prepared) for section in config.sections))
+        except Exception as e:
+            logger.error(f"生成测试试卷时发生错误: {e}")
+            raise e
+        for section, questions in zip(config.sections, results):
+            test.add(questions)
+            logger.debug(f"生成测试段落完成, needed={section.number}, actual={len(questions)}, condition={section}")
+        logger.info(f"生成测试试卷完成, needed={config.length}, actual={len(test.questions)}")
+        return test
+
+    async def generate_test_section(self, section: TestSectionConfig) -> Test:
+        """生成测试段落"""
+        questions = await self._get_questions(section, await self._prepare([section]))
+        logger.info(f"生成测试段落完成, needed={section.number}, actual={len(questions)}")
+        return Test(questions)
+
+    async def _prepare(self, sections: List[TestSectionConfig]) -> dict[str, dict[str, Any]]:
+        """按查找器分组, 各查找器的批量准备并发进行"""
+        grouped: dict[str, tuple[Any, List[TestSectionConfig]]] = {}
+        for section in sections:
+            question_finder = self.test_generator._get_question_finder(section)
+            grouped.setdefault(question_finder.name, (question_finder, []))[1].append(section)
+        results = await asyncio.gather(*(
+            question_finder.aprepare(self.test_generator.vector_store, finder_sections, self.executor)
+            for question_finder, finder_sections in grouped.values()
+        ))
+        return dict(zip(grouped, results))
+
+    async def _get_questions(self, section: TestSectionConfig, prepared: dict[str, dict[str, Any]]) -> List[Question]:
+        question_finder = self.test_generator._get_question_finder(section)
+        async with self.async_mysql_client.session_scope() as session:
+            return await question_finder.afind(
+                session, self.test_generator.vector_store, section, prepared.get(question_finder.name), self.executor
+            )
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, List
+from pydantic import BaseModel
+
+from ..utils import logger
+
+class Keywords(BaseModel):
+    """批量提取关键词的返回结构, 与输入的知识点一一对应"""
+    keywords: List[str]
+
+class KeywordCache:
+    """
+    知识点 -> 关键词的缓存, 支持过期时间和按最近使用淘汰
+
+    指定 path 时缓存会持久化到 JSON 文件, 每次写入后整体替换文件
+    """
+
+    def __init__(self, path: str | None = None, ttl: float | None = 7 * 24 * 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 知识点 -> (关键词, 写入时间), 按最近使用排序
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for knowledge_point, (keyword, created_at) in json.load(f).items():
+                    self._entries[knowledge_point] = (keyword, created_at)
+        except Exception as e:
+            logger.warning(f"加载关键词缓存失败, 使用空缓存: {e}")
+            self._entries.clear()
+
+    def _save(self):
+        if self.path is None:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, knowledge_point: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(knowledge_point)
+            if entry is None:
+                return None
+            if self._expired(entry[1]):
+                del self._entries[knowledge_point]
+                return None
+            self._entries.move_to_end(knowledge_point)
+            return entry[0]
+
+    def put_many(self, keywords: dict[str, str]):
+        if not keywords:
+            return
+        with self._lock:
+            now = time.time()
+            for knowledge_point, keyword in keywords.items():
+                self._entries[knowledge_point] = (keyword, now)
+                self._entries.move_to_end(knowledge_point)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+class KeywordExtractor:
+    """
+    使用 LLM 将知识点简化为检索关键词, 结果会被缓存
+
+    Args:
+        llm_client: instructor 风格的客户端, 需要提供 chat.completions.create(model, messages, response_model),
+            默认使用 utils.instructor 中的 instructor_client
+        async_llm_client: 异步版本的 llm_client, 供 aextract_many 使用,
+            默认使用 utils.instructor 中的 async_instructor_client
+        model: 使用的模型名称
+        cache: 关键词缓存, 默认使用不持久化的内存缓存
+    """
+
+    PROMPT = "请将该知识点简化为一个词汇, 不要使用知识点内容以外的其它字眼: {knowledge_point}"
+    BATCH_PROMPT = (
+        "请将下列每个知识点分别简化为一个词汇, 不要使用知识点内容以外的其它字眼, "
+        "按顺序返回与知识点数量相同的词汇列表:\n{knowledge_points}"
+    )
+
+    def __init__(self, llm_client: Any = None, model: str = "gpt-4o-mini", cache: KeywordCache | None = None, async_llm_client: Any = None):
+        self._llm_client = llm_client
+        self._async_llm_client = async_llm_client
+        self.model = model
+        self.cache = cache if cache is not None else KeywordCache()
+
+    @property
+    def llm_client(self) -> Any:
+        if self._llm_client is None:
+            from ..utils.instructor import get_instructor_client
+            self._llm_client = get_instructor_client()
+        return self._llm_client
+
+    @property
+    def async_llm_client(self) -> Any:
+        if self._async_llm_client is None:
+            from ..utils.instructor import get_async_instructor_client
+            self._async_llm_client = get_async_instructor_client()
+        return self._async_llm_client
+
+    def warmup(self):
+        """预先创建 LLM 客户端"""
+        return self.llm_client
+
+    def extract(self, knowledge_point: str) -> str:
+        """提取单个知识点的关键词"""
+        return self.extract_many([knowledge_point])[knowledge_point]
+
+    def extract_many(self, knowledge_points: List[str]) -> dict[str, str]:
+        """
+        批量提取关键词, 未命中缓存的知识点在一次请求中完成
+
+        Returns:
+            知识点 -> 关键词
+        """
+        result, missing = self._lookup(knowledge_points)
+        if missing:
+            extracted = self._request(missing)
+            self.cache.put_many(extracted)
+            result.update(extracted)
+        logger.debug(f"提取关键词: total={len(result)}, miss={len(missing)}")
+        return result
+
+    async def aextract(self, knowledge_point: str, executor: Executor | None = None) -> str:
+        """extract 的异步版本"""
+        return (await self.aextract_many([knowledge_point], executor))[knowledge_point]
+
+    async def aextract_many(self, knowledge_points: List[str], executor: Executor | None = None) -> dict[str, str]:
+        """
+        extract_many 的异步版本, 使用 async_llm_client, 等待 LLM 响应时不占用线程
+
+        写入缓存可能同步写文件, 在 executor 中执行, 不阻塞事件循环
+        """
+        result, missing = self._lookup(knowledge_points)
+        if missing:
+            extracted = await self._arequest(missing)
+            await asyncio.get_running_loop().run_in_executor(executor, self.cache.put_many, extracted)
+            result.update(extracted)
+        logger.debug(f"提取关键词: total={len(result)}, miss={len(missing)}")
+        return result
+
+    def _lookup(self, knowledge_points: List[str]) -> tuple[dict[str, str], List[str]]:
+        """查询缓存, 返回已缓存的关键词和未命中的知识点"""
+        result: dict[str, str] = {}
+        missing: List[str] = []
+        for knowledge_point in dict.fromkeys(knowledge_points):
+            keyword = self.cache.get(knowledge_point)
+            if keyword is None:
+                missing.append(knowledge_point)
+            else:
+                result[knowledge_point] = keyword
+        return result, missing
+
+    def _batch_messages(self, knowledge_points: List[str]) -> list[dict]:
+        listing = "\n".join(f"{i}. {knowledge_point}" for i, knowledge_point in enumerate(knowledge_points, start=1))
+        return [{"role": "user", "content": self.BATCH_PROMPT.format(knowledge_points=listing)}]
+
+    def _request(self, knowledge_points: List[str]) -> dict[str, str]:
+        if len(knowledge_points) == 1:
+            return {knowledge_points[0]: self._request_one(knowledge_points[0])}
+        response = self.llm_client.chat.completions.create(
+            model=self.model,
+            messages=self._batch_messages(knowledge_points),
+            response_model=Keywords,
+        )
+        if len(response.keywords) != len(knowledge_points):
+            # 数量对不上时无法确定对应关系, 退化为逐个请求
+            logger.warning(f"批量提取关键词数量不匹配: expected={len(knowledge_points)}, actual={len(response.keywords)}")
+            return {knowledge_point: self._request_one(knowledge_point) for knowledge_point in knowledge_points}
+        return dict(zip(knowledge_points, response.keywords))
+
+    def _request_one(self, knowledge_point: str) -> str:
+        return self.llm_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": self.PROMPT.format(knowledge_point=knowledge_point)}],
+            response_model=str,
+        )
+
+    async def _arequest(self, knowledge_points: List[str]) -> dict[str, str]:
+        if len(knowledge_points) == 1:
+            return {knowledge_points[0]: await self._arequest_one(knowledge_points[0])}
+        response = await self.async_llm_client.chat.completions.create(
+            model=self.model,
+            messages=self._batch_messages(knowledge_points),
+            response_model=Keywords,
+        )
+        if len(response.keywords) != len(knowledge_points):
+            logger.warning(f"批量提取关键词数量不匹配: expected={len(knowledge_points)}, actual={len(response.keywords)}")
+            keywords = await asyncio.gather(*(self._arequest_one(knowledge_point) for knowledge_point in knowledge_points))
+            return dict(zip(knowledge_points, keywords))
+        return dict(zip(knowledge_points, response.keywords))
+
+    async def _arequest_one(self, knowledge_point: str) -> str:
+        return await self.async_llm_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": self.PROMPT.format(knowledge_point=knowledge_point)}],
+            response_model=str,
+        )
@@ -1,10 +1,16 @@
+import asyncio
 from abc import abstractmethod
-from typing import List
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable, List
+from chromadb.api.types import Where
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from .test_config import TestSectionConfig
-from ..storage import ChromaDBClient, Question
-from ..utils import logger
-from ..utils.instructor import instructor_client
+from ..storage import VectorStore, Question, KeywordIndex, reciprocal_rank_fusion, fetch_records_by_uuids, afetch_records_by_uuids
+from ..utils import logger, metrics
+from .keyword_extractor import KeywordExtractor
 
 class QuestionFinder():
     """问题查找器父类"""
@@ -17,24 +23,99 @@ class QuestionFinder():
             Question.source == section.source.value if section.source else True,
         ]
         return conditions
+
+    def _build_static_filters(self, section: TestSectionConfig) -> dict[str, str]:
+        """与 _build_static_conditions 对应的字段等值条件"""
+        filters = {"type": section.type.value}
+        if section.subject:
+            filters["subject"] = section.subject.value
+        if section.difficulty:
+            filters["difficulty"] = section.difficulty.value
+        if section.source:
+            filters["source"] = section.source.value
+        return filters
+
+    def _build_static_where(self, section: TestSectionConfig) -> Where:
+        """与 _build_static_conditions 对应的 ChromaDB where 条件, 使向量检索只在满足条件的试题中进行"""
+        conditions = [{field: value} for field, value in self._build_static_filters(section).items()]
+        if len(conditions) == 1:
+            return conditions[0]  # type: ignore
+        return {"$and": conditions}  # type: ignore
     
+    def prepare(self, vector_store: VectorStore, sections: List[TestSectionConfig]) -> dict[str, Any]:
+        """
+        为多个段落批量准备查找所需的数据 (如查询向量), 结果传给 find 的 prepared 参数
+
+        Args:
+            vector_store: 向量存储
+            sections: 测试段落配置列表
+
+        Returns:
+            知识点 -> 预先计算的数据, 默认不需要准备
+        """
+        return {}
+
     @abstractmethod
-    def _find_questions(self, session: Session, chromadb_client: ChromaDBClient, section: TestSectionConfig) -> List[Question]:
+    def _find_questions(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> List[Question]:
         """
         根据知识点查找问题。
         
         Args:
             session: 数据库会话
-            chromadb_client: ChromaDB 客户端
+            vector_store: 向量存储
             section: 测试段落配置
+            prepared: prepare 返回的数据
             
         Returns:
             List of question ids
         """
         pass
 
-    def find(self, session: Session, chromadb_client: ChromaDBClient, section: TestSectionConfig) -> List[Question]:
-        questions = self._find_questions(session, chromadb_client, section)
+    # 选择逻辑写成同步和异步路径共用的辅助方法, 两条路径只在执行方式上不同:
+    # SQL 语句由 session.execute 执行或 await, 阻塞调用直接执行或在 executor 中执行
+
+    def _static_statement(self, section: TestSectionConfig, *conditions) -> Select:
+        """按静态条件 (和额外条件) 读取 section.number 道试题的查询语句"""
+        return select(Question).where(*self._build_static_conditions(section), *conditions).limit(section.number)
+
+    def _query_static(self, session: Session, section: TestSectionConfig, *conditions) -> List[Question]:
+        return list(session.execute(self._static_statement(section, *conditions)).scalars())
+
+    def _load_in_order(self, session: Session, uuids: List[str]) -> List[Question]:
+        """按 uuid 读取试题, 保持 uuids 的顺序"""
+        return fetch_records_by_uuids(session, Question, uuids)
+
+    def find(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any] | None = None) -> List[Question]:
+        with metrics.time("finder_section_seconds", finder=self.name):
+            questions = self._find_questions(session, vector_store, section, prepared or {})
+        logger.debug(f"使用 {self.name} 查找问题完成, needed={section.number}, actual={len(questions)}")
+        return questions
+
+    # 异步接口: MySQL 查询使用 AsyncSession, embedding、向量检索等阻塞调用在 executor 中执行
+
+    @staticmethod
+    async def _run(executor: Executor | None, func: Callable, *args, **kwargs) -> Any:
+        """在 executor 中执行阻塞调用"""
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+
+    async def aprepare(self, vector_store: VectorStore, sections: List[TestSectionConfig], executor: Executor | None = None) -> dict[str, Any]:
+        """prepare 的异步版本, 默认在 executor 中执行 prepare"""
+        return await self._run(executor, self.prepare, vector_store, sections)
+
+    async def _aload_in_order(self, session: AsyncSession, uuids: List[str]) -> List[Question]:
+        return await afetch_records_by_uuids(session, Question, uuids)
+
+    async def _aquery_static(self, session: AsyncSession, section: TestSectionConfig, *conditions) -> List[Question]:
+        return list((await session.execute(self._static_statement(section, *conditions))).scalars())
+
+    async def _afind_questions(self, session: AsyncSession, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any], executor: Executor | None) -> List[Question]:
+        """_find_questions 的异步版本, 默认只按静态条件查询"""
+        return await self._aquery_static(session, section)
+
+    async def afind(self, session: AsyncSession, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any] | None = None, executor: Executor | None = None) -> List[Question]:
+        """find 的异步版本"""
+        with metrics.time("finder_section_seconds", finder=self.name):
+            questions = await self._afind_questions(session, vector_store, section, prepared or {}, executor)
         logger.debug(f"使用 {self.name} 查找问题完成, needed={section.number}, actual={len(questions)}")
         return questions
     
@@ -49,41 +130,140 @@ class QuestionFinder():
         return self.__class__.__name__
 
 class ChromaDBQuestionFinder(QuestionFinder):
-    """基于 ChromaDB 的问题查找"""
-    
-    def _find_questions(self,
-        session: Session,
-        chromadb_client: ChromaDBClient,
-        section: TestSectionConfig,
-    ) -> List[Question]:
-        condition = self._build_static_conditions(section)
-        if section.knowledge_point:
-            question_ids = chromadb_client.query_uuid(collection_name="questions", query_texts=section.knowledge_point, where={"type": section.type.value})
-            condition.append(Question.uuid.in_(list(question_ids)))
-        questions = session.query(Question).filter(*condition).limit(section.number).all()
-        return questions
+    """基于向量检索的问题查找"""
+
+    def prepare(self, vector_store: VectorStore, sections: List[TestSectionConfig]) -> dict[str, Any]:
+        """一次批量计算所有段落知识点的查询向量"""
+        knowledge_points = list(dict.fromkeys(section.knowledge_point for section in sections if section.knowledge_point))
+        if not knowledge_points or vector_store.query_embedding_function is None:
+            return {}
+        embeddings = vector_store.embed_queries(knowledge_points)
+        return dict(zip(knowledge_points, embeddings))
     
+    def _vector_search(self, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any], n_results: int) -> Callable[[], List[str]]:
+        """
+        按知识点进行向量检索的调用, 返回按相关性排序的 uuid; 静态条件下推到向量检索中,
+        MySQL 只负责按 uuid 读取完整记录
+        """
+        query_embedding = prepared.get(section.knowledge_point)  # type: ignore
+        return partial(
+            vector_store.query_uuid,
+            collection_name="questions",
+            query_embeddings=[query_embedding] if query_embedding is not None else None,
+            query_texts=section.knowledge_point if query_embedding is None else None,
+            n_results=n_results,
+            where=self._build_static_where(section),
+        )
+
+    def _find_questions(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> List[Question]:
+        if not section.knowledge_point:
+            return self._query_static(session, section)
+        question_ids = self._vector_search(vector_store, section, prepared, section.number)()
+        return self._load_in_order(session, question_ids)
+
+    async def _afind_questions(self, session: AsyncSession, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any], executor: Executor | None) -> List[Question]:
+        if not section.knowledge_point:
+            return await self._aquery_static(session, section)
+        question_ids = await self._run(executor, self._vector_search(vector_store, section, prepared, section.number))
+        return await self._aload_in_order(session, question_ids)
+
+
 class KeywordQuestionFinder(QuestionFinder):
     """基于 MySQL 的问题查找"""
+
+    def __init__(self, extractor: KeywordExtractor | None = None, keyword_index: KeywordIndex | None = None):
+        self.extractor = extractor or KeywordExtractor()
+        # 提供关键词索引时使用 BM25 检索, 否则退化为 LIKE 查询
+        self.keyword_index = keyword_index
+
+    def prepare(self, vector_store: VectorStore, sections: List[TestSectionConfig]) -> dict[str, Any]:
+        """一次请求提取所有段落中未缓存知识点的关键词"""
+        knowledge_points = [section.knowledge_point for section in sections if section.knowledge_point]
+        if not knowledge_points:
+            return {}
+        return self.extractor.extract_many(knowledge_points)
     
-    def _find_questions(self, session: Session, chromadb_client: ChromaDBClient, section: TestSectionConfig) -> List[Question]:
-        condition = self._build_static_conditions(section)
-        if section.knowledge_point:
-            keyword = instructor_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": f"请将该知识点简化为一个词汇, 不要使用知识点内容以外的其它字眼: {section.knowledge_point}"}],
-                response_model=str
-            )
-            logger.debug(f"keyword: {keyword}")
-            condition.append(Question.question.like(f"%{keyword}%"))
-        questions = session.query(Question).filter(*condition).limit(section.number).all()
-        return questions
+    def _keyword_search(self, section: TestSectionConfig, keyword: str) -> Callable[[], List[str]] | None:
+        """
+        有关键词索引时返回 BM25 检索的调用 (返回按分数排序的 uuid), 否则返回 None, 调用方退化为 LIKE 查询
+        """
+        logger.debug(f"keyword: {keyword}")
+        if self.keyword_index is None:
+            return None
+        search = partial(self.keyword_index.search, keyword, section.number, self._build_static_filters(section))
+        return lambda: [uuid for uuid, _ in search()]
+
+    @staticmethod
+    def _like_condition(keyword: str):
+        return Question.question.like(f"%{keyword}%")
+
+    def _find_questions(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> List[Question]:
+        if not section.knowledge_point:
+            return self._query_static(session, section)
+        keyword = prepared.get(section.knowledge_point) or self.extractor.extract(section.knowledge_point)
+        search = self._keyword_search(section, keyword)
+        if search is None:
+            return self._query_static(session, section, self._like_condition(keyword))
+        return self._load_in_order(session, search())
+
+    async def aprepare(self, vector_store: VectorStore, sections: List[TestSectionConfig], executor: Executor | None = None) -> dict[str, Any]:
+        """使用异步 LLM 客户端提取关键词, 缓存文件在 executor 中写入"""
+        knowledge_points = [section.knowledge_point for section in sections if section.knowledge_point]
+        if not knowledge_points:
+            return {}
+        return await self.extractor.aextract_many(knowledge_points, executor)
+
+    async def _afind_questions(self, session: AsyncSession, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any], executor: Executor | None) -> List[Question]:
+        if not section.knowledge_point:
+            return await self._aquery_static(session, section)
+        keyword = prepared.get(section.knowledge_point) or await self.extractor.aextract(section.knowledge_point, executor)
+        search = self._keyword_search(section, keyword)
+        if search is None:
+            return await self._aquery_static(session, section, self._like_condition(keyword))
+        # 检索 (及其中的增量刷新) 会占用 CPU 和访问 MySQL, 在 executor 中执行
+        return await self._aload_in_order(session, await self._run(executor, search))
+
+
+class HybridQuestionFinder(QuestionFinder):
+    """向量检索与 BM25 关键词检索的混合查找, 两路结果使用倒数排名融合"""
+
+    def __init__(self, keyword_index: KeywordIndex, candidate_factor: int = 4, rrf_k: int = 60):
+        self.keyword_index = keyword_index
+        self.chromadb_question_finder = ChromaDBQuestionFinder()
+        # 每一路召回 section.number * candidate_factor 个候选再融合
+        self.candidate_factor = candidate_factor
+        self.rrf_k = rrf_k
+
+    def prepare(self, vector_store: VectorStore, sections: List[TestSectionConfig]) -> dict[str, Any]:
+        return self.chromadb_question_finder.prepare(vector_store, sections)
+
+    def _candidate_searches(self, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> tuple[Callable[[], List[str]], Callable[[], List[str]]]:
+        """两路检索的调用, 每一路召回 section.number * candidate_factor 个候选"""
+        n_candidates = section.number * self.candidate_factor
+        vector_search = self.chromadb_question_finder._vector_search(vector_store, section, prepared, n_candidates)
+        keyword_search = partial(self.keyword_index.search, section.knowledge_point, n_candidates, self._build_static_filters(section))
+        return vector_search, lambda: [uuid for uuid, _ in keyword_search()]
+
+    def _fuse(self, section: TestSectionConfig, vector_ranking: List[str], keyword_ranking: List[str]) -> List[str]:
+        fused = reciprocal_rank_fusion([vector_ranking, keyword_ranking], k=self.rrf_k)
+        return [uuid for uuid, _ in fused[:section.number]]
+
+    def _find_questions(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> List[Question]:
+        if not section.knowledge_point:
+            return self._query_static(session, section)
+        vector_search, keyword_search = self._candidate_searches(vector_store, section, prepared)
+        return self._load_in_order(session, self._fuse(section, vector_search(), keyword_search()))
+
+    async def _afind_questions(self, session: AsyncSession, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any], executor: Executor | None) -> List[Question]:
+        if not section.knowledge_point:
+            return await self._aquery_static(session, section)
+        vector_search, keyword_search = self._candidate_searches(vector_store, section, prepared)
+        rankings = [await self._run(executor, vector_search), await self._run(executor, keyword_search)]
+        return await self._aload_in_order(session, self._fuse(section, *rankings))
 
 
 class MySQLQuestionFinder(QuestionFinder):
     """基于 MySQL 的问题查找, 当不使用内容进行检索时, 使用该类"""
     
-    def _find_questions(self, session: Session, chromadb_client: ChromaDBClient, section: TestSectionConfig) -> List[Question]:
-        condition = self._build_static_conditions(section)
-        questions = session.query(Question).filter(*condition).limit(section.number).all()
-        return questions
\ No newline at end of file
+    def _find_questions(self, session: Session, vector_store: VectorStore, section: TestSectionConfig, prepared: dict[str, Any]) -> List[Question]:
+        return self._query_static(session, section)
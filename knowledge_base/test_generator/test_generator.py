@@ -1,11 +1,14 @@
 import json
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
 from sqlalchemy.orm import Session
 
-from ..utils import logger
-from ..storage import MySQLClient, ChromaDBClient, Question
+from ..utils import logger, metrics
+from ..storage import MySQLClient, VectorStore, Question, KeywordIndex
 from .test_config import TestConfig, TestSectionConfig
-from .question_finder import KeywordQuestionFinder, MySQLQuestionFinder
+from .question_finder import QuestionFinder, ChromaDBQuestionFinder, KeywordQuestionFinder, HybridQuestionFinder, MySQLQuestionFinder
+from .keyword_extractor import KeywordExtractor, KeywordCache
 
 class Test():
     def __init__(self, questions: List[Question] | None = None):
@@ -30,42 +33,111 @@ class TestGenerator:
     """
     测试生成器, 能根据不同配置生成不同的测试试卷, 覆盖小测验和考研测试
     """
-    def __init__(self, mysql_client: MySQLClient, chromadb_client: ChromaDBClient):
+    def __init__(self, mysql_client: MySQLClient, vector_store: VectorStore, config: dict | None = None, keyword_index: KeywordIndex | None = None):
+        config = config or {}
         self.mysql_client = mysql_client
-        self.chromadb_client = chromadb_client
-        self.keyword_question_finder = KeywordQuestionFinder()
+        self.vector_store = vector_store
+        keyword_extractor = KeywordExtractor(
+            llm_client=config.get("llm_client", None),
+            async_llm_client=config.get("async_llm_client", None),
+            model=config.get("keyword_model", "gpt-4o-mini"),
+            cache=KeywordCache(**config.get("keyword_cache", {})),
+        )
+        self.keyword_question_finder = KeywordQuestionFinder(keyword_extractor, keyword_index)
+        self.chromadb_question_finder = ChromaDBQuestionFinder()
+        self.hybrid_question_finder = HybridQuestionFinder(keyword_index) if keyword_index is not None else None
         self.mysql_question_finder = MySQLQuestionFinder()
+        # 有知识点的段落使用的查找器: keyword、chromadb 或 hybrid (需要关键词索引)
+        self.knowledge_point_finder = config.get("knowledge_point_finder", "keyword")
+        # 并行生成时每个工作线程使用独立的数据库会话
+        self.parallel = config.get("parallel", False)
+        self.max_workers = config.get("max_workers", 8)
 
-    def generate_test(self, config: TestConfig) -> Test:
-        """生成测试试卷"""
+    def generate_test(self, config: TestConfig, parallel: bool | None = None) -> Test:
+        """
+        生成测试试卷
+
+        Args:
+            config: 试卷配置
+            parallel: 是否并行生成各段落, 默认使用初始化配置中的 parallel
+        """
         logger.info(f"开始生成测试试卷: \n{config}")
+        parallel = self.parallel if parallel is None else parallel
         test = Test()
-        session = self.mysql_client.get_session()
-        for section in config.sections:
-            try:
-                questions = self._get_questions(session, section)
-                test.add(questions)
-                logger.debug(f"生成测试段落完成, needed={section.number}, actual={len(questions)}, condition={section}")
-            except Exception as e:
-                logger.error(f"生成测试试卷时发生错误: {e}")
-                raise e
+        try:
+            with metrics.time("generate_test_seconds", parallel=str(bool(parallel)).lower()):
+                # 所有段落的知识点一次批量准备 (如计算查询向量), 避免每个段落单独请求
+                prepared = self._prepare(config.sections)
+                if parallel and len(config.sections) > 1:
+                    results = self._generate_sections_parallel(config.sections, prepared)
+                else:
+                    results = self._generate_sections(config.sections, prepared)
+        except Exception as e:
+            logger.error(f"生成测试试卷时发生错误: {e}")
+            raise e
+        # 按段落顺序组装试卷
+        for section, questions in zip(config.sections, results):
+            test.add(questions)
+            logger.debug(f"生成测试段落完成, needed={section.number}, actual={len(questions)}, condition={section}")
         logger.info(f"生成测试试卷完成, needed={config.length}, actual={len(test.questions)}")
         logger.debug(f"测试试卷: \n{test}")
-        session.close()
         return test
 
+    def _generate_sections(self, sections: List[TestSectionConfig], prepared: dict[str, dict[str, Any]]) -> List[List[Question]]:
+        """在同一个会话中依次生成各段落"""
+        with self.mysql_client.session_scope() as session:
+            return [self._get_questions(session, section, prepared) for section in sections]
+
+    def _generate_sections_parallel(self, sections: List[TestSectionConfig], prepared: dict[str, dict[str, Any]]) -> List[List[Question]]:
+        """使用线程池并行生成各段落, 每个工作线程使用独立的会话, 结果与 sections 顺序一致"""
+        local = threading.local()
+        sessions: List[Session] = []
+
+        def generate(section: TestSectionConfig) -> List[Question]:
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = self.mysql_client.get_session()
+                sessions.append(session)
+            return self._get_questions(session, section, prepared)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sections)), thread_name_prefix="test-generator") as executor:
+                return list(executor.map(generate, sections))
+        finally:
+            for session in sessions:
+                session.close()
+
     def generate_test_section(self, section: TestSectionConfig) -> Test:
         """生成测试段落"""
         logger.info(f"开始生成测试段落: \n{section}")
         test = Test()
-        session = self.mysql_client.get_session()
-        questions = self._get_questions(session, section)
+        with self.mysql_client.session_scope() as session:
+            questions = self._get_questions(session, section, self._prepare([section]))
         test.add(questions)
         logger.info(f"生成测试段落完成, needed={section.number}, actual={len(questions)}")
         logger.debug(f"测试段落: \n{test}")
-        session.close()
         return test
+
+    def _get_question_finder(self, section: TestSectionConfig) -> QuestionFinder:
+        if not section.knowledge_point:
+            return self.mysql_question_finder
+        if self.knowledge_point_finder == "chromadb":
+            return self.chromadb_question_finder
+        if self.knowledge_point_finder == "hybrid" and self.hybrid_question_finder is not None:
+            return self.hybrid_question_finder
+        return self.keyword_question_finder
+
+    def _prepare(self, sections: List[TestSectionConfig]) -> dict[str, dict[str, Any]]:
+        """按查找器分组, 每个查找器对其负责的所有段落做一次批量准备"""
+        grouped: dict[str, tuple[QuestionFinder, List[TestSectionConfig]]] = {}
+        for section in sections:
+            question_finder = self._get_question_finder(section)
+            grouped.setdefault(question_finder.name, (question_finder, []))[1].append(section)
+        return {
+            name: question_finder.prepare(self.vector_store, finder_sections)
+            for name, (question_finder, finder_sections) in grouped.items()
+        }
     
-    def _get_questions(self, session: Session, section: TestSectionConfig) -> List[Question]:
-        question_finder = self.keyword_question_finder if section.knowledge_point else self.mysql_question_finder
-        return question_finder.find(session, self.chromadb_client, section)
+    def _get_questions(self, session: Session, section: TestSectionConfig, prepared: dict[str, dict[str, Any]] | None = None) -> List[Question]:
+        question_finder = self._get_question_finder(section)
+        return question_finder.find(session, self.vector_store, section, (prepared or {}).get(question_finder.name))
@@ -1,4 +1,5 @@
-from .utils import load_data, get_content_based_uuid
+from .utils import load_data, iter_data_chunks, get_content_based_uuid
 from .logger import logger
+from .metrics import metrics, MetricsRegistry
 
-__all__ = ["load_data", "get_content_based_uuid", "logger"]
\ No newline at end of file
+__all__ = ["load_data", "iter_data_chunks", "get_content_based_uuid", "logger", "metrics", "MetricsRegistry"]
\ No newline at end of file
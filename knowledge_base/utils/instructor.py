@@ -1,18 +1,44 @@
 import os
+from functools import cache
 import instructor
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 open_model = "gpt-4o-mini"
-
-deepseek_client = OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=os.getenv("DEEPSEEK_BASE_URL"))
 deepseek_model = "deepseek-chat"
-
-default_client = openai_client
 default_model = open_model
 
 
-instructor_client = instructor.from_openai(OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+# 客户端在第一次访问时才创建, 导入本模块不会初始化任何客户端
+@cache
+def get_openai_client() -> OpenAI:
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+@cache
+def get_deepseek_client() -> OpenAI:
+    return OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=os.getenv("DEEPSEEK_BASE_URL"))
+
+@cache
+def get_instructor_client() -> instructor.Instructor:
+    return instructor.from_openai(OpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+@cache
+def get_async_instructor_client() -> instructor.AsyncInstructor:
+    return instructor.from_openai(AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")))
+
+
+_lazy_clients = {
+    "openai_client": get_openai_client,
+    "deepseek_client": get_deepseek_client,
+    "default_client": get_openai_client,
+    "instructor_client": get_instructor_client,
+    "async_instructor_client": get_async_instructor_client,
+}
+
+def __getattr__(name: str):
+    # 兼容 from .instructor import openai_client 等旧用法
+    if name in _lazy_clients:
+        return _lazy_clients[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
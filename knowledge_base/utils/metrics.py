@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# 延迟直方图的默认分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 批大小、token 数等数量类直方图的分桶
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    进程内的计数器和直方图, 默认关闭
+
+    关闭时 inc/observe/set 只做一次布尔判断, time() 返回共享的空上下文, 热路径上几乎没有开销;
+    开启后可以通过 snapshot() 拉取当前值, 或用 to_prometheus() 导出 Prometheus 文本格式
+
+    指标名称遵循 Prometheus 约定, 计数器以 _total 结尾, 耗时直方图以 _seconds 结尾, 标签以关键字参数传入
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, _Histogram]] = {}
+        self._help: dict[str, str] = {}
+        self._buckets: dict[str, tuple[float, ...]] = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """清空所有已记录的值"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def describe(self, name: str, help: str, buckets: tuple[float, ...] | None = None):
+        """设置指标的说明和直方图分桶, 未设置时直方图使用 DEFAULT_BUCKETS"""
+        self._help[name] = help
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加 value"""
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """设置瞬时值, 如同步延迟、待处理数量"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """向直方图中记录一个值"""
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            histogram.observe(value)
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{name.removesuffix('_seconds')}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def time(self, name: str, **labels):
+        """
+        记录代码块耗时的上下文管理器, 代码块抛出异常时额外累加 <name>_errors_total
+
+        Example:
+            with metrics.time("chroma_query_seconds", collection="questions"):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timer(name, labels)
+
+    def snapshot(self) -> dict:
+        """
+        返回所有指标的当前值
+
+        Returns:
+            {"counters": {name: [{"labels": {...}, "value": v}]}, "gauges": {...},
+             "histograms": {name: [{"labels": {...}, "count": n, "sum": s, "buckets": {上界: 累计数量}}]}}
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": histogram.count,
+                            "sum": histogram.sum,
+                            "buckets": dict(zip([*map(str, histogram.buckets), "+Inf"], _cumulative(histogram.counts))),
+                        }
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """导出 Prometheus 文本格式"""
+        lines: list[str] = []
+        snapshot = self.snapshot()
+        for kind, metric_type in (("counters", "counter"), ("gauges", "gauge")):
+            for name, series in sorted(snapshot[kind].items()):
+                self._header(lines, name, metric_type)
+                for item in series:
+                    lines.append(f"{name}{_labels(item['labels'])} {_number(item['value'])}")
+        for name, series in sorted(snapshot["histograms"].items()):
+            self._header(lines, name, "histogram")
+            for item in series:
+                for bound, count in item["buckets"].items():
+                    lines.append(f"{name}_bucket{_labels({**item['labels'], 'le': bound})} {count}")
+                lines.append(f"{name}_sum{_labels(item['labels'])} {_number(item['sum'])}")
+                lines.append(f"{name}_count{_labels(item['labels'])} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: list[str], name: str, metric_type: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+class _NullContext:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def _cumulative(counts: list[int]) -> list[int]:
+    total, result = 0, []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# 全局默认实例, 调用 metrics.enable() 开启
+metrics = MetricsRegistry()
+metrics.describe("embedding_seconds", "embedding 调用耗时")
+metrics.describe("embedding_batch_size", "每次 embedding 调用的文本数量", SIZE_BUCKETS)
+metrics.describe("embedding_microbatch_requests", "查询侧每次批量计算合并的请求数量", SIZE_BUCKETS)
+metrics.describe("embedding_characters_total", "embedding 文本的总字符数 (近似 token 数)")
+metrics.describe("query_cache_requests_total", "查询缓存的请求数, 按查询向量/查询结果和命中/未命中区分")
+metrics.describe("vector_store_seconds", "向量存储 add/query/delete 操作耗时")
+metrics.describe("vector_store_chunks_total", "写入向量存储的切片数量")
+metrics.describe("mysql_query_seconds", "MySQL 语句执行耗时")
+metrics.describe("sync_lag_seconds", "sync_outbox 中最早的待同步变更的等待时间")
+metrics.describe("sync_pending", "sync_outbox 中待同步的变更数量")
+metrics.describe("sync_apply_seconds", "一批变更同步到向量存储的耗时")
+metrics.describe("sync_failures_total", "同步到向量存储失败的次数")
+metrics.describe("sync_applied_total", "已同步到向量存储的变更数量")
+metrics.describe("sync_rewrites_total", "写入后校验发现 MySQL 已被修改, 使用最新数据重写的记录数量")
+metrics.describe("import_rows_total", "从文件导入的行数, 按写入/跳过区分")
+metrics.describe("finder_section_seconds", "每个查找器查找一个试卷段落的耗时")
+metrics.describe("generate_test_seconds", "生成一套试卷的耗时")
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Iterator
 import pandas as pd
 import numpy as np
 import uuid
@@ -69,6 +70,65 @@ def load_data(path: Path) -> pd.DataFrame:
         logger.error(f"Failed to load {path}: {e}", exc_info=True)
         raise
 
+def iter_data_chunks(path: Path, chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+    """
+    分块读取数据文件, 每次只在内存中保留一个块, 用于导入大文件
+
+    - .csv: pandas 的 chunksize 分块读取, 所有列按字符串读取, 避免各块推断出不同的类型
+    - .parquet: pyarrow 按批读取, 每批不超过 chunk_size 行, 不会一次读入整个行组之外的数据
+    - .xlsx: openpyxl 只读模式逐行读取, 第一行为表头
+    - .pkl 和 .npy 无法流式读取, 整体加载后再分块返回
+
+    Args:
+        path (Path): 数据文件的路径。
+        chunk_size (int): 每个块的最大行数。
+
+    Returns:
+        Iterator[pd.DataFrame]: 依次返回每个块。
+    """
+    if isinstance(path, str):
+        path = Path(path)
+
+    if not path.exists():
+        logger.error(f"File not found: {path}")
+        raise FileNotFoundError(f"Input file not found: {path}")
+
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""]) as reader:
+            yield from reader
+    elif suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif suffix == ".xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)  # type: ignore
+            header = [str(column) for column in next(rows, ())]
+            buffer = []
+            for row in rows:
+                buffer.append(row)
+                if len(buffer) >= chunk_size:
+                    yield pd.DataFrame(buffer, columns=header)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=header)
+        finally:
+            workbook.close()
+    elif suffix in (".pkl", ".npy"):
+        logger.warning(f"{suffix} 文件不支持流式读取, 将整体加载: {path}")
+        data = load_data(path)
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+    else:
+        logger.error(f"Unsupported format: {suffix} for {path}")
+        raise ValueError(f"Unsupported file format: {suffix}")
+
 def get_content_based_uuid(content: str) -> str:
     """基于字符串内容生成固定 UUID（使用 SHA-1 哈希）"""
     namespace = uuid.NAMESPACE_DNS  # 可以使用任意命名空间（如 NAMESPACE_URL）
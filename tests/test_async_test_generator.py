@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import AsyncMySQLClient, KeywordIndex, MySQLClient, NumpyVectorStore, Question, QuestionType, Subject, SyncManager
+from knowledge_base import test_generator
+from knowledge_base.test_generator import AsyncTestGenerator
+from knowledge_base.test_generator import test_config
+from knowledge_base.test_generator.keyword_extractor import Keywords
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+class FakeLLMClient:
+    """本地替身, 取知识点的前两个字作为关键词"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, response_model):
+        content = messages[0]["content"]
+        if response_model is Keywords:
+            lines = content.split("\n")[1:]
+            return Keywords(keywords=[line.split(". ", 1)[1][:2] for line in lines])
+        return content.rsplit(": ", 1)[1][:2]
+
+
+class FakeAsyncLLMClient(FakeLLMClient):
+    """FakeLLMClient 的异步版本"""
+
+    async def create(self, model, messages, response_model):
+        return FakeLLMClient.create(self, model, messages, response_model)
+
+
+class RecordingKeywordIndex(KeywordIndex):
+    """记录执行检索的线程"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.threads: set[str] = set()
+
+    def search(self, query, n_results=10, filters=None):
+        self.threads.add(threading.current_thread().name)
+        return super().search(query, n_results, filters)
+
+
+QUESTIONS = [
+    ("操作系统", "中断处理程序的执行过程"),
+    ("操作系统", "中断向量与中断优先级"),
+    ("操作系统", "进程调度算法的比较"),
+    ("操作系统", "页面置换算法与缺页中断"),
+    ("计算机组成原理", "中断隐指令完成的操作"),
+    ("计算机组成原理", "指令流水线的冒险"),
+    ("数据结构", "二叉树的遍历"),
+    ("数据结构", "图的最短路径"),
+]
+
+TEST_CONFIG = test_config.TestConfig(sections=[
+    test_config.TestSectionConfig(type=QuestionType.SINGLE_CHOICE, number=2, subject=Subject.OPERATING_SYSTEM, knowledge_point="中断的处理过程"),
+    test_config.TestSectionConfig(type=QuestionType.SINGLE_CHOICE, number=3, knowledge_point="中断"),
+    test_config.TestSectionConfig(type=QuestionType.SINGLE_CHOICE, number=2, subject=Subject.DATA_STRUCTURE),
+    test_config.TestSectionConfig(type=QuestionType.SINGLE_CHOICE, number=1, subject=Subject.COMPUTER_ORGANIZATION, knowledge_point="指令流水线"),
+])
+
+
+class TestAsyncTestGenerator:
+    """AsyncTestGenerator 测试类"""
+
+    def test_matches_sync_generator(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'kb.db'}"
+        mysql_client = MySQLClient({"url": url})
+        store = NumpyVectorStore({
+            "backend": "numpy",
+            "embedding_function": HashEmbeddingFunction(),
+            "collections": {"questions": {}, "knowledge_points": {}},
+            "max_length": 50,
+            "overlap": 0,
+        })
+        keyword_index = RecordingKeywordIndex(mysql_client=mysql_client)
+        SyncManager(mysql_client, store, keyword_index=keyword_index)
+        mysql_client.save_questions([
+            Question(uuid=f"q{i}", document=question, type="单选题", subject=subject, question=question, options="", answer="A", difficulty="简单", source="真题")
+            for i, (subject, question) in enumerate(QUESTIONS)
+        ])
+        async_mysql_client = AsyncMySQLClient({"url": url})
+
+        for finder in ("keyword", "hybrid", "chromadb"):
+            generator = test_generator.TestGenerator(mysql_client, store, {
+                "knowledge_point_finder": finder,
+                "llm_client": FakeLLMClient(),
+                "async_llm_client": FakeAsyncLLMClient(),
+                "keyword_cache": {"path": str(tmp_path / f"{finder}_keyword_cache.json")},
+            }, keyword_index=keyword_index)
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="async-test") as executor:
+                async_generator = AsyncTestGenerator(generator, async_mysql_client, executor)
+                # 异步路径先运行, 关键词缓存的写入也发生在异步路径中
+                async_test = asyncio.run(async_generator.generate_test(TEST_CONFIG))
+            sync_test = generator.generate_test(TEST_CONFIG, parallel=False)
+            assert async_test.to_json() == sync_test.to_json()
+            assert async_test.to_json()["length"] > 0
+            if finder == "keyword":
+                assert (tmp_path / "keyword_keyword_cache.json").exists()
+
+        # 事件循环运行在主线程, 关键词检索只应在 executor 的线程中执行
+        async_threads = {name for name in keyword_index.threads if name.startswith("async-test")}
+        assert async_threads and keyword_index.threads - async_threads == {threading.current_thread().name}
+        asyncio.run(async_mysql_client.dispose())
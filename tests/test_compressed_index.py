@@ -0,0 +1,151 @@
+import hashlib
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import ChromaDBClient, CompressedVectorIndex, NumpyVectorStore
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).normal(size=64).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors  # type: ignore
+
+
+def make_questions(n: int) -> list[dict]:
+    rng = np.random.default_rng(0)
+    chars = list("进程线程调度中断页面置换死锁存储管理文件系统网络协议路由交换指令流水线缓存总线二叉树图排序查找")
+    return [
+        {
+            "uuid": f"q{i}", "question": "".join(rng.choice(chars, 12)), "answer": "A", "options": "", "type": "单选题",
+            "subject": "操作系统" if i % 2 else "数据结构", "difficulty": "简单", "source": "真题", "exam_point": f"考点{i % 5}",
+        }
+        for i in range(n)
+    ]
+
+
+def store_config(path: str | None, backend: str = "chromadb") -> dict:
+    config = {
+        "backend": backend,
+        "path": path,
+        "allow_reset": True,
+        "embedding_function": HashEmbeddingFunction(),
+        "collections": {"questions": {}, "knowledge_points": {}},
+        "max_length": 50,
+        "overlap": 0,
+    }
+    if path is not None:
+        config["compressed_index"] = {"path": f"{path}/compressed", "recall_target": 0.95}
+    return config
+
+
+def make_vectors(n: int, dim: int = 64, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestCompressedVectorIndex:
+    """CompressedVectorIndex 测试类"""
+
+    def test_recall_and_memory(self, tmp_path):
+        vectors = make_vectors(3000)
+        index = CompressedVectorIndex(str(tmp_path), recall_target=0.95)
+        index.add([f"c{i}" for i in range(len(vectors))], vectors, [{"uuid": f"q{i // 3}"} for i in range(len(vectors))])
+        assert index.tune(k=10) >= 0.95
+        usage = index.memory_usage()
+        assert usage["full_precision"] / usage["resident"] > 3.5
+        result = index.query(vectors[:2], 5)
+        assert [ids[0] for ids in result["ids"]] == ["c0", "c1"]
+        assert result["distances"][0][0] < 1e-4
+
+    def test_filter_and_delete(self, tmp_path):
+        vectors = make_vectors(10)
+        metadatas = [{"uuid": f"q{i}", "subject": "操作系统" if i % 2 else "数据结构"} for i in range(10)]
+        index = CompressedVectorIndex(str(tmp_path))
+        index.add([f"c{i}" for i in range(10)], vectors, metadatas)
+        index.add(["c0"], vectors[:1], metadatas[:1])
+        assert len(index) == 10
+        result = index.query(vectors[0], 10, where={"subject": "操作系统"})
+        assert all(metadata["subject"] == "操作系统" for metadata in result["metadatas"][0])
+        index.delete_uuids(["q1", "q3"])
+        ids = index.query(vectors[1], 10, where={"subject": {"$in": ["操作系统"]}})["ids"][0]
+        assert set(ids) == {"c5", "c7", "c9"}
+        assert not index.supports({"exam_point": "中断"})
+
+    def test_scale_grows_with_new_vectors(self, tmp_path):
+        small = make_vectors(100) * 0.01
+        large = make_vectors(100, seed=1)
+        index = CompressedVectorIndex(str(tmp_path))
+        index.add([f"s{i}" for i in range(100)], small, [{"uuid": f"s{i}"} for i in range(100)])
+        index.add([f"l{i}" for i in range(100)], large, [{"uuid": f"l{i}"} for i in range(100)])
+        # 放大比例后新向量不被截断, 不重排也能找到自身
+        ids = index.query(large, 1, rerank_factor=1)["ids"]
+        assert ids == [[f"l{i}"] for i in range(100)]
+
+    def test_save_and_load(self, tmp_path):
+        vectors = make_vectors(50)
+        index = CompressedVectorIndex(str(tmp_path))
+        index.add([f"c{i}" for i in range(50)], vectors, [{"uuid": f"q{i}"} for i in range(50)])
+        index.delete_uuids(["q0"])
+        index.save()
+        # 保存后追加的行不在元数据中, 加载时被忽略
+        index.add(["c50"], make_vectors(1, seed=1), [{"uuid": "q50"}])
+
+        loaded = CompressedVectorIndex(str(tmp_path))
+        assert loaded.load()
+        assert loaded.ids() == {f"c{i}" for i in range(1, 50)}
+        assert loaded.query(vectors[7], 3)["ids"][0][0] == "c7"
+        loaded.add(["c51"], make_vectors(1, seed=2), [{"uuid": "q51"}])
+        assert loaded.query(vectors[49], 1)["ids"][0] == ["c49"]
+        assert not CompressedVectorIndex(str(tmp_path / "empty")).load()
+
+    def test_chromadb_keeps_only_placeholders(self, tmp_path):
+        questions = make_questions(600)
+        store = ChromaDBClient(store_config(str(tmp_path)))
+        store.add_questions(questions)
+        reference = NumpyVectorStore(store_config(None, "numpy"))
+        reference.add_questions(questions)
+        # ChromaDB 中只有 1 维占位向量, 全精度向量只在压缩索引中
+        page = store.get_collection("questions").get(limit=5, include=["embeddings"])
+        assert [len(embedding) for embedding in page["embeddings"]] == [1] * 5
+        index = store.get_compressed_index("questions")
+        assert index is not None and len(index) == store.count("questions")
+
+        # 查询向量在切片向量附近, 与 NumpyVectorStore 的精确检索比较 recall@10
+        rng = np.random.default_rng(1)
+        documents = np.asarray(HashEmbeddingFunction()([question["question"] for question in questions[:50]]))
+        queries = documents + rng.normal(scale=0.5, size=documents.shape).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        hits = sum(
+            len(set(store.query_uuid("questions", query_embeddings=[query], n_results=10))
+                & set(reference.query_uuid("questions", query_embeddings=[query], n_results=10)))
+            for query in queries
+        )
+        assert hits / (10 * len(queries)) >= 0.95
+        # 索引中没有的字段和 where_document 先在 ChromaDB 中过滤
+        uuids = store.query_uuid("questions", query_embeddings=[queries[0]], n_results=5, where={"exam_point": "考点1"})
+        assert uuids and all(int(uuid[1:]) % 5 == 1 for uuid in uuids)
+        text = questions[3]["question"]
+        assert store.query_uuid("questions", query_texts=[text], n_results=5, where_document={"$contains": text}) == ["q3"]
+
+        # 重新打开时加载保存的索引; 索引文件丢失时从 ChromaDB 中的文档重新计算向量
+        store.close()
+        reopened = ChromaDBClient(store_config(str(tmp_path)))
+        assert reopened.query_uuid("questions", query_texts=[text], n_results=1) == ["q3"]
+        # 加载后内存中只有已有的行: 每个切片 dim 字节的编码、4 字节的范数和 1 字节的删除标记
+        loaded = reopened.get_compressed_index("questions")
+        assert loaded.memory_usage()["resident"] == len(loaded) * (64 + 5)  # type: ignore
+        reopened.close()
+        index.remove_files()
+        rebuilt = ChromaDBClient(store_config(str(tmp_path)))
+        assert len(rebuilt.get_compressed_index("questions")) == rebuilt.count("questions")  # type: ignore
+        assert rebuilt.query_uuid("questions", query_texts=[text], n_results=1) == ["q3"]
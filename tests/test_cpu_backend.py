@@ -0,0 +1,71 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+
+from knowledge_base.embedding import CPUEmbeddingFunction, compare_embeddings
+
+
+class StubTokenizer:
+    """每个字符一个 token, 记录每个批次填充后的长度"""
+
+    def __init__(self):
+        self.padded_lengths: list[int] = []
+
+    def __call__(self, texts, truncation=True, max_length=512):
+        input_ids = [[ord(char) % 1000 + 1 for char in text][:max_length] for text in texts]
+        return {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+
+    def pad(self, features, padding="longest", return_tensors="np"):
+        length = max(len(ids) for ids in features["input_ids"])
+        self.padded_lengths.append(length)
+        return {name: np.array([row + [0] * (length - len(row)) for row in rows]) for name, rows in features.items()}
+
+
+class StubSession:
+    """onnx InferenceSession 的替身, [CLS] 位置输出 (token 数, token id 之和, 批次大小)"""
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, output_names, feed):
+        input_ids, mask = feed["input_ids"], feed["attention_mask"]
+        hidden = np.zeros((*input_ids.shape, 3), dtype=np.float32)
+        hidden[:, 0, 0] = mask.sum(axis=1)
+        hidden[:, 0, 1] = (input_ids * mask).sum(axis=1)
+        hidden[:, 0, 2] = len(input_ids)
+        return [hidden]
+
+
+class FixedEmbeddingFunction:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __call__(self, input):
+        return self.vectors
+
+
+class TestCPUEmbeddingFunction:
+    """CPUEmbeddingFunction 测试类"""
+
+    def test_length_buckets_keep_input_order(self):
+        embedding_function = CPUEmbeddingFunction(backend="onnx", batch_size=2, max_length=6, normalize=False)
+        tokenizer = StubTokenizer()
+        embedding_function._tokenizer = tokenizer
+        embedding_function._session = StubSession()
+        texts = ["中断处理过程", "进程", "页面置换算法的比较", "死锁", "缓存"]
+        vectors = np.asarray(embedding_function(texts))
+        # 截断后的长度为 [6, 2, 6, 2, 2], 排序后分批为 [2, 2], [2, 6], [6], 每批只填充到批内最长长度
+        assert tokenizer.padded_lengths == [2, 6, 6]
+        assert vectors[:, 2].tolist() == [2, 2, 1, 2, 2]
+        assert vectors[:, 0].tolist() == [6, 2, 6, 2, 2]
+        expected = [sum(ord(char) % 1000 + 1 for char in text[:6]) for text in texts]
+        assert vectors[:, 1].tolist() == expected
+
+    def test_compare_embeddings(self):
+        reference = FixedEmbeddingFunction([[1.0, 0.0], [0.0, 2.0]])
+        candidate = FixedEmbeddingFunction([[3.0, 0.0], [1.0, 1.0]])
+        result = compare_embeddings(reference, candidate, ["a", "b"])  # type: ignore
+        assert math.isclose(result["min_cosine"], math.sqrt(0.5), rel_tol=1e-6)
+        assert math.isclose(result["mean_cosine"], (1 + math.sqrt(0.5)) / 2, rel_tol=1e-6)
+        assert math.isclose(result["max_abs_diff"], math.sqrt(0.5), rel_tol=1e-6)
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import pytest
+import tempfile
+import shutil
+
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.embedding import CachedEmbeddingFunction
+
+
+class CountingEmbeddingFunction(EmbeddingFunction):
+    """记录调用次数的简单 embedding function"""
+
+    def __init__(self):
+        self.model_name = "counting"
+        self.calls: list[list[str]] = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.calls.append(list(input))
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in input]  # type: ignore
+
+
+def write_texts(path: str, prefix: str):
+    """在子进程中分批写入缓存, 与其它进程的写入交错"""
+    embedding_function = CachedEmbeddingFunction(CountingEmbeddingFunction(), path=path, memory_size=1)
+    for start in range(0, 600, 20):
+        embedding_function([f"{prefix}{i}" for i in range(start, start + 20)] + [f"共享{start}"])
+
+
+class TestEmbeddingCache:
+    """CachedEmbeddingFunction 测试类"""
+
+    @pytest.fixture
+    def temp_cache_path(self):
+        temp_dir = tempfile.mkdtemp()
+        yield temp_dir
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_only_misses_reach_model(self, temp_cache_path):
+        inner = CountingEmbeddingFunction()
+        embedding_function = CachedEmbeddingFunction(inner, path=temp_cache_path)
+        first = embedding_function(["中断", "进程", "中断"])
+        second = embedding_function(["进程", "页表"])
+        assert inner.calls == [["中断", "进程"], ["页表"]]
+        assert list(first[0]) == list(first[2])
+        assert list(second[0]) == list(first[1])
+
+    def test_persistent(self, temp_cache_path):
+        inner = CountingEmbeddingFunction()
+        CachedEmbeddingFunction(inner, path=temp_cache_path, memory_size=1)(
+            [f"文本{i}" for i in range(2000)]
+        )
+        reloaded = CachedEmbeddingFunction(inner, path=temp_cache_path)
+        vectors = reloaded(["文本0", "文本1999"])
+        assert len(inner.calls) == 1
+        assert list(vectors[1]) == list(inner(["文本1999"])[0])
+
+    def test_missing_or_truncated_vectors(self, temp_cache_path):
+        inner = CountingEmbeddingFunction()
+        CachedEmbeddingFunction(inner, path=temp_cache_path)([f"文本{i}" for i in range(10)])
+        cache_dir = os.path.join(temp_cache_path, "counting")
+        with open(os.path.join(cache_dir, "vectors.f32"), "r+b") as f:
+            f.truncate(3 * 4 * 5)
+        reloaded = CachedEmbeddingFunction(inner, path=temp_cache_path)
+        assert len(reloaded.cache) == 0
+        vectors = reloaded(["文本9", "新文本"])
+        assert inner.calls[-1] == ["文本9", "新文本"]
+        os.remove(os.path.join(cache_dir, "vectors.f32"))
+        reloaded = CachedEmbeddingFunction(inner, path=temp_cache_path)
+        assert len(reloaded.cache) == 0
+        assert list(reloaded(["新文本"])[0]) == list(vectors[1])
+
+    def test_concurrent_processes(self, temp_cache_path):
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=write_texts, args=(temp_cache_path, prefix)) for prefix in ("甲", "乙", "丙")]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            assert process.exitcode == 0
+        inner = CountingEmbeddingFunction()
+        reloaded = CachedEmbeddingFunction(inner, path=temp_cache_path, memory_size=1)
+        texts = [f"{prefix}{i}" for prefix in ("甲", "乙", "丙") for i in range(600)] + [f"共享{i}" for i in range(0, 600, 20)]
+        vectors = reloaded(texts)
+        # 全部命中, 且每个文本对应自己的向量
+        assert inner.calls == []
+        assert len(reloaded.cache) == len(texts)
+        assert [list(vector) for vector in vectors] == [list(vector) for vector in inner(texts)]
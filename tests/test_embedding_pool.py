@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from knowledge_base.embedding import EmbeddingWorkerPool
+
+
+class StubEmbeddingFunction:
+    """可以被 pickle 的替身: 向量由文本长度和字符编码决定, "die" 使工作进程退出, "sleep" 使其等待"""
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            if text == "die":
+                os._exit(1)
+            if text == "sleep":
+                time.sleep(1.0)
+            vectors.append([len(text), sum(map(ord, text)) % 1000, 0.0, 1.0])
+        return vectors
+
+
+class TestEmbeddingWorkerPool:
+    """EmbeddingWorkerPool 测试类"""
+
+    def test_order_and_long_inputs(self):
+        texts = [f"文本{i}" * (i % 7 + 1) for i in range(23)]
+        # 超过输入槽位初始大小的文本会使槽位扩容
+        texts[5] = "长" * 2000
+        with EmbeddingWorkerPool(StubEmbeddingFunction, dim=4, workers=2, batch_size=3, max_pending=2) as pool:
+            vectors = pool(texts)
+            assert np.array_equal(np.asarray(vectors), np.asarray(StubEmbeddingFunction()(texts), dtype=np.float32))
+            assert pool(["短文本"])[0][0] == 3
+
+    def test_worker_death_fails_only_its_tasks(self):
+        with EmbeddingWorkerPool(StubEmbeddingFunction, dim=4, workers=2, batch_size=2) as pool:
+            results = []
+            thread = threading.Thread(target=lambda: results.append(pool(["sleep", "正常"])))
+            thread.start()
+            while not pool._tasks:
+                time.sleep(0.01)
+            # 另一个工作进程处理 "die" 时退出, 只有这个任务失败
+            with pytest.raises(RuntimeError):
+                pool(["die"])
+            thread.join(30)
+            assert len(results) == 1 and results[0][1][0] == 2
+            # 退出的工作进程已被替换, 之后的调用正常返回
+            assert [vector[0] for vector in pool(["a", "bb", "ccc", "dddd", "eeeee"])] == [1, 2, 3, 4, 5]
+            assert all(process.is_alive() for process in pool._processes)
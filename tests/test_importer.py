@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from knowledge_base.storage import FileImporter, MySQLClient, Question
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            "document": f"题目 {i}",
+            "type": "单选题",
+            "subject": "操作系统",
+            "question": f"题目 {i}",
+            "options": "A\nB",
+            "answer": "A",
+            "difficulty": "简单",
+            "source": "真题",
+            "unused": i,
+        }
+        for i in range(count)
+    ]
+
+
+class TestFileImporter:
+    """FileImporter 测试类"""
+
+    def test_import_csv_in_batches(self, tmp_path):
+        rows = make_rows(25)
+        rows[3]["question"] = None
+        rows[7]["answer"] = "x" * 300
+        path = tmp_path / "questions.csv"
+        pd.DataFrame(rows).to_csv(path, index=False)
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        progress = []
+        importer = FileImporter(mysql_client, config={"chunk_size": 10, "batch_size": 4})
+        stats = importer.import_file("questions", path, progress=progress.append)
+        assert (stats["read"], stats["inserted"], stats["skipped"]) == (25, 23, 2)
+        assert [item["read"] for item in progress] == [10, 20, 25]
+        session = mysql_client.get_session()
+        try:
+            questions = session.query(Question).order_by(Question.id).all()
+            assert len(questions) == 23
+            assert len({question.uuid for question in questions}) == 23
+            assert questions[0].exam_point is None
+        finally:
+            session.close()
+
+    def test_missing_required_column(self, tmp_path):
+        path = tmp_path / "questions.csv"
+        pd.DataFrame(make_rows(2)).drop(columns=["answer"]).to_csv(path, index=False)
+        importer = FileImporter(MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"}))
+        with pytest.raises(ValueError):
+            importer.import_file("questions", path)
+
+    def test_skip_duplicate_uuids(self, tmp_path):
+        rows = make_rows(12)
+        for i, row in enumerate(rows):
+            row["uuid"] = f"q{i}"
+        # 第二个块中的 q1 与第一个块重复, q9 在块内重复
+        rows[10]["uuid"] = "q1"
+        rows[11]["uuid"] = "q9"
+        path = tmp_path / "questions.csv"
+        pd.DataFrame(rows).to_csv(path, index=False)
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        importer = FileImporter(mysql_client, config={"chunk_size": 8, "batch_size": 4})
+        stats = importer.import_file("questions", path)
+        assert (stats["read"], stats["inserted"], stats["duplicates"]) == (12, 10, 2)
+        # 重复导入同一个文件时全部跳过, 不会因唯一索引中途失败
+        stats = importer.import_file("questions", path)
+        assert (stats["inserted"], stats["duplicates"]) == (0, 12)
+        with mysql_client.session_scope() as session:
+            assert session.query(Question).filter_by(uuid="q1").one().question == "题目 1"
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from knowledge_base.test_generator import KeywordExtractor, KeywordCache
+from knowledge_base.test_generator.keyword_extractor import Keywords
+
+
+class FakeLLMClient:
+    """本地替身, 取知识点的前两个字作为关键词并记录请求"""
+
+    def __init__(self):
+        self.requests: list = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, response_model):
+        content = messages[0]["content"]
+        self.requests.append(response_model)
+        if response_model is Keywords:
+            lines = content.split("\n")[1:]
+            return Keywords(keywords=[line.split(". ", 1)[1][:2] for line in lines])
+        return content.rsplit(": ", 1)[1][:2]
+
+
+class FakeAsyncLLMClient(FakeLLMClient):
+    """FakeLLMClient 的异步版本"""
+
+    async def create(self, model, messages, response_model):
+        return FakeLLMClient.create(self, model, messages, response_model)
+
+
+class TestKeywordExtractor:
+    """KeywordExtractor 测试类"""
+
+    def test_batch_and_cache(self):
+        client = FakeLLMClient()
+        extractor = KeywordExtractor(llm_client=client)
+        keywords = extractor.extract_many(["中断方式", "页面置换", "中断方式"])
+        assert keywords == {"中断方式": "中断", "页面置换": "页面"}
+        assert extractor.extract("页面置换") == "页面"
+        assert extractor.extract("死锁预防") == "死锁"
+        assert client.requests == [Keywords, str]
+
+    def test_async_batch_and_cache(self):
+        client = FakeAsyncLLMClient()
+        extractor = KeywordExtractor(llm_client=FakeLLMClient(), async_llm_client=client)
+        keywords = asyncio.run(extractor.aextract_many(["中断方式", "页面置换"]))
+        assert keywords == {"中断方式": "中断", "页面置换": "页面"}
+        assert extractor.extract("页面置换") == "页面"
+        assert asyncio.run(extractor.aextract("死锁预防")) == "死锁"
+        assert client.requests == [Keywords, str]
+
+    def test_ttl_and_eviction(self):
+        cache = KeywordCache(ttl=0.01, max_entries=2)
+        cache.put_many({"a": "1", "b": "2", "c": "3"})
+        assert len(cache) == 2 and cache.get("a") is None
+        time.sleep(0.02)
+        assert cache.get("c") is None
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "keyword_cache.json")
+        KeywordExtractor(llm_client=FakeLLMClient(), cache=KeywordCache(path)).extract("中断方式")
+        client = FakeLLMClient()
+        assert KeywordExtractor(llm_client=client, cache=KeywordCache(path)).extract("中断方式") == "中断"
+        assert client.requests == []
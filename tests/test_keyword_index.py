@@ -0,0 +1,129 @@
+import hashlib
+import threading
+
+import numpy as np
+import pytest
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import KeywordIndex, MySQLClient, NumpyVectorStore, Question, SyncManager, reciprocal_rank_fusion
+from knowledge_base.storage.models import QuestionChange
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+def make_question(uuid: str, question: str, subject: str = "操作系统") -> dict:
+    return {"uuid": uuid, "question": question, "document": "", "type": "单选题", "subject": subject, "difficulty": "简单", "source": "真题"}
+
+
+def make_record(uuid: str, question: str) -> Question:
+    return Question(uuid=uuid, document=question, type="单选题", subject="操作系统", question=question, options="", answer="A", difficulty="简单", source="真题")
+
+
+class TestKeywordIndex:
+    """KeywordIndex 测试类"""
+
+    def test_search_and_filter(self):
+        index = KeywordIndex()
+        index.add_many([
+            make_question("q1", "程序的中断方式有哪些"),
+            make_question("q2", "中断向量表存放的是中断服务程序的入口地址", subject="计算机组成原理"),
+            make_question("q3", "进程调度算法"),
+        ])
+        hits = index.search("中断", 10)
+        assert {uuid for uuid, _ in hits} == {"q1", "q2"}
+        assert hits[0][0] == "q2"
+        assert [uuid for uuid, _ in index.search("中断", 10, {"subject": "操作系统"})] == ["q1"]
+
+    def test_update_and_remove(self):
+        index = KeywordIndex()
+        index.add(make_question("q1", "程序的中断方式"))
+        index.add(make_question("q1", "页面置换算法"))
+        assert index.search("中断") == []
+        assert [uuid for uuid, _ in index.search("置换")] == ["q1"]
+        index.remove_many(["q1"])
+        assert len(index) == 0 and index.search("置换") == []
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c"]])
+        assert [uuid for uuid, _ in fused] == ["b", "c", "a"]
+
+    def test_refresh_from_other_process(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'kb.db'}"
+        # 写入方: 注册了 SyncManager 的进程
+        writer = MySQLClient({"url": url})
+        store = NumpyVectorStore({
+            "backend": "numpy",
+            "embedding_function": HashEmbeddingFunction(),
+            "collections": {"questions": {}, "knowledge_points": {}},
+            "max_length": 50,
+            "overlap": 0,
+        })
+        SyncManager(writer, store)
+        writer.save_questions([make_record("q1", "程序的中断方式")])
+        # 读取方: 另一个进程中的索引, 只能通过 MySQL 看到写入方的修改
+        index = KeywordIndex(mysql_client=MySQLClient({"url": url}), refresh_interval=0)
+        assert len(index) == 0
+        assert [uuid for uuid, _ in index.search("中断")] == ["q1"]
+
+        writer.save_questions([make_record("q2", "页面置换算法")])
+        with writer.session_scope() as session:
+            record = session.query(Question).filter_by(uuid="q1").one()
+            record.question = record.document = "进程调度算法"
+        assert [uuid for uuid, _ in index.search("置换")] == ["q2"]
+        assert index.search("中断") == [] and [uuid for uuid, _ in index.search("调度")] == ["q1"]
+        with writer.session_scope() as session:
+            session.delete(session.query(Question).filter_by(uuid="q2").one())
+        assert index.search("置换") == []
+
+        # 较小的 id 晚于较大的 id 提交时, 先记为缺口, 之后仍会被读到
+        with writer.session_scope() as session:
+            session.add(make_record("q3", "死锁的必要条件"))
+            session.flush()
+            last_id = max(change.id for change in session.query(QuestionChange))
+        with writer.session_scope() as session:
+            session.query(QuestionChange).filter_by(id=last_id).delete()
+            session.add(QuestionChange(id=last_id + 1, uuid="q3"))
+        assert [uuid for uuid, _ in index.search("死锁")] == ["q3"]
+        with writer.session_scope() as session:
+            record = session.query(Question).filter_by(uuid="q3").one()
+            record.question = record.document = "银行家算法"
+            session.add(QuestionChange(id=last_id, uuid="q3"))
+        with writer.session_scope() as session:
+            session.query(QuestionChange).filter(QuestionChange.id > last_id).delete()
+        assert index.search("死锁") == [] and [uuid for uuid, _ in index.search("银行家")] == ["q3"]
+
+    def test_rebuild_does_not_block_search(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        mysql_client.save_questions([make_record("q1", "程序的中断方式"), make_record("q2", "页面置换算法")])
+        index = KeywordIndex(mysql_client=mysql_client, refresh_interval=3600)
+        index.build()
+        iter_pages = mysql_client.iter_pages
+        searched = []
+
+        def failing_pages(*args, **kwargs):
+            # 读取第一页后在另一个线程中检索, 然后读取失败
+            for rows in iter_pages(*args, **kwargs):
+                yield rows
+                thread = threading.Thread(target=lambda: searched.append(index.search("中断")))
+                thread.start()
+                thread.join(timeout=5)
+                raise RuntimeError("连接断开")
+
+        mysql_client.iter_pages = failing_pages  # type: ignore
+        with pytest.raises(RuntimeError):
+            index.build(batch_size=1)
+        # 构建期间检索不等待构建完成, 失败后仍是完整的旧索引
+        assert [[uuid for uuid, _ in hits] for hits in searched] == [["q1"]]
+        assert len(index) == 2 and [uuid for uuid, _ in index.search("置换")] == ["q2"]
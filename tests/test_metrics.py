@@ -0,0 +1,36 @@
+import pytest
+
+from knowledge_base.utils import MetricsRegistry
+
+
+class TestMetricsRegistry:
+    """MetricsRegistry 测试类"""
+
+    def test_disabled_records_nothing(self):
+        registry = MetricsRegistry()
+        registry.inc("calls_total")
+        registry.observe("latency_seconds", 0.1)
+        with registry.time("latency_seconds"):
+            pass
+        assert registry.snapshot() == {"counters": {}, "gauges": {}, "histograms": {}}
+
+    def test_snapshot_and_prometheus(self):
+        registry = MetricsRegistry(enabled=True)
+        registry.describe("latency_seconds", "测试耗时")
+        registry.inc("calls_total", 2, op="add")
+        registry.set("pending", 3)
+        registry.observe("latency_seconds", 0.003, op="query")
+        with pytest.raises(ValueError):
+            with registry.time("latency_seconds", op="query"):
+                raise ValueError("boom")
+        snapshot = registry.snapshot()
+        assert snapshot["counters"]["calls_total"] == [{"labels": {"op": "add"}, "value": 2}]
+        assert snapshot["counters"]["latency_errors_total"][0]["value"] == 1
+        histogram = snapshot["histograms"]["latency_seconds"][0]
+        assert histogram["count"] == 2 and histogram["buckets"]["+Inf"] == 2
+        text = registry.to_prometheus()
+        assert 'calls_total{op="add"} 2' in text
+        assert "pending 3" in text
+        assert "# HELP latency_seconds 测试耗时" in text
+        assert 'latency_seconds_bucket{op="query",le="0.0025"} 1' in text
+        assert 'latency_seconds_count{op="query"} 2' in text
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from knowledge_base.embedding import MicroBatchingEmbeddingFunction
+
+
+class FatalError(BaseException):
+    """使后台线程退出的异常"""
+
+
+class RecordingEmbeddingFunction:
+    """以文本长度作为向量, 记录每次调用的批大小"""
+
+    def __init__(self):
+        self.batches: list[int] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, input):
+        with self.lock:
+            self.batches.append(len(input))
+        if "error" in input:
+            raise RuntimeError("boom")
+        if "short" in input:
+            return [[0.0]]
+        if "fatal" in input:
+            raise FatalError()
+        return [[float(len(text))] for text in input]
+
+
+class TestMicroBatchingEmbeddingFunction:
+    """MicroBatchingEmbeddingFunction 测试类"""
+
+    def test_concurrent_requests_are_batched(self):
+        inner = RecordingEmbeddingFunction()
+        embedding_function = MicroBatchingEmbeddingFunction(inner, max_wait_ms=50, max_batch_size=8)
+        texts = [["a" * (i % 7 + 1)] for i in range(40)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(embedding_function, texts))
+        embedding_function.close()
+        assert results == [[[float(len(text[0]))]] for text in texts]
+        assert max(inner.batches) <= 8
+        assert len(inner.batches) < len(texts)
+
+    def test_error_propagates(self):
+        embedding_function = MicroBatchingEmbeddingFunction(RecordingEmbeddingFunction(), max_wait_ms=1)
+        with pytest.raises(RuntimeError):
+            embedding_function(["error"])
+        assert embedding_function(["ok"]) == [[2.0]]
+        embedding_function.close()
+
+    def test_short_result_fails_request(self):
+        embedding_function = MicroBatchingEmbeddingFunction(RecordingEmbeddingFunction(), max_wait_ms=1)
+        with pytest.raises(ValueError):
+            embedding_function(["short", "ok"])
+        assert embedding_function(["ok"]) == [[2.0]]
+        embedding_function.close()
+
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+    def test_thread_restarts_after_exit(self):
+        embedding_function = MicroBatchingEmbeddingFunction(RecordingEmbeddingFunction(), max_wait_ms=1)
+        with pytest.raises(FatalError):
+            embedding_function(["fatal"])
+        assert embedding_function(["ok"]) == [[2.0]]
+        embedding_function.close()
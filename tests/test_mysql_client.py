@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from knowledge_base.storage import MySQLClient, Question, fetch_records_by_uuids
+
+
+def make_question(uuid: str) -> Question:
+    return Question(uuid=uuid, document=uuid, type="单选题", subject="操作系统", question=uuid, options="", answer="A", difficulty="简单", source="真题")
+
+
+class TestMySQLClient:
+    """MySQLClient 测试类"""
+
+    def test_get_records_by_uuids_keeps_order(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        session = mysql_client.get_session()
+        session.add_all([make_question(f"q{i}") for i in range(5)])
+        session.commit()
+        records = mysql_client.get_records_by_uuids(Question, ["q3", "missing", "q0", "q4", "q3", "q1"], session=session)
+        assert [record.uuid for record in records] == ["q3", "q0", "q4", "q1"]
+        records = fetch_records_by_uuids(session, Question, ["q4", "q2", "q0"], chunk_size=2)
+        assert [record.uuid for record in records] == ["q4", "q2", "q0"]
+        session.close()
+
+    def test_create_uuid_index_for_existing_table(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'kb.db'}"
+        engine = create_engine(url)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE questions (id INTEGER PRIMARY KEY, uuid VARCHAR(255) NOT NULL, document VARCHAR(2048) NOT NULL, "
+                "type VARCHAR(255) NOT NULL, subject VARCHAR(255) NOT NULL, question VARCHAR(2048) NOT NULL, "
+                "options VARCHAR(255) NOT NULL, answer VARCHAR(255) NOT NULL, difficulty VARCHAR(255) NOT NULL, "
+                "source VARCHAR(255) NOT NULL, exam_point VARCHAR(255))"
+            ))
+        MySQLClient({"url": url})
+        indexes = {index["name"]: index for index in inspect(engine).get_indexes("questions")}
+        assert indexes["ux_questions_uuid"]["unique"]
+        assert "ux_knowledge_points_uuid" in {index["name"] for index in inspect(engine).get_indexes("knowledge_points")}
+
+    def test_session_scope_commits_or_rolls_back(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        with mysql_client.session_scope() as session:
+            session.add(make_question("q0"))
+        with pytest.raises(RuntimeError):
+            with mysql_client.session_scope() as session:
+                session.add(make_question("q1"))
+                session.flush()
+                raise RuntimeError("boom")
+        question = mysql_client.get_question_by_uuid("q0")
+        assert question is not None and question.answer == "A"
+        assert mysql_client.get_question_by_uuid("q1") is None
+        assert mysql_client.engine.pool.checkedout() == 0
+
+    def test_iter_pages_by_primary_key(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        mysql_client.save_questions([make_question(f"q{i}") for i in range(7)])
+        pages = list(mysql_client.iter_pages(Question, batch_size=3))
+        assert [len(page) for page in pages] == [3, 3, 1]
+        assert [item["uuid"] for page in pages for item in page] == [f"q{i}" for i in range(7)]
+        pages = list(mysql_client.iter_pages(Question, [Question.uuid], batch_size=4, after_id=pages[0][-1]["id"]))
+        assert [list(item) for item in pages[0]] == [["id", "uuid"]] * 4
+        assert mysql_client.existing_uuids(Question, ["q1", "missing", "q6"], chunk_size=2) == {"q1", "q6"}
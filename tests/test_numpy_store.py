@@ -0,0 +1,82 @@
+import hashlib
+import threading
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import NumpyVectorStore
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+def make_store(path=None) -> NumpyVectorStore:
+    config = {
+        "backend": "numpy",
+        "path": path,
+        "embedding_function": HashEmbeddingFunction(),
+        "collections": {"questions": {}, "knowledge_points": {}},
+        "max_length": 50,
+        "overlap": 0,
+    }
+    return NumpyVectorStore(config)
+
+
+def make_knowledge_point(i: int) -> dict:
+    return {"uuid": f"k{i}", "document": f"知识点 {i}", "subject": "操作系统" if i % 2 else "数据结构"}
+
+
+class TestNumpyVectorStore:
+    """NumpyVectorStore 测试类"""
+
+    def test_query_filter_and_delete(self):
+        store = make_store()
+        store.add_knowledge_points([make_knowledge_point(i) for i in range(20)])
+        assert store.count("knowledge_points") == 20
+        assert store.query_uuid("knowledge_points", query_texts=["知识点 7"], n_results=3)[0] == "k7"
+        uuids = store.query_uuid("knowledge_points", query_texts=["知识点 7"], n_results=20, where={"subject": "数据结构"})
+        assert len(uuids) == 10 and all(int(uuid[1:]) % 2 == 0 for uuid in uuids)
+        store.delete_documents("knowledge_points", ["k7"])
+        assert "k7" not in store.query_uuid("knowledge_points", query_texts=["知识点 7"], n_results=5)
+        assert set(store.get_content_hashes("knowledge_points", ["k1", "k7"])) == {"k1"}
+
+    def test_save_and_load(self, tmp_path):
+        store = make_store(str(tmp_path))
+        store.add_knowledge_points([make_knowledge_point(i) for i in range(5)])
+        store.close()
+        loaded = make_store(str(tmp_path))
+        assert sorted(loaded.iter_uuids("knowledge_points")) == [f"k{i}" for i in range(5)]
+        metadata = loaded.query_metadata("knowledge_points", ["k3"])["k3"]
+        assert metadata["documents"] == ["知识点 3"]
+
+    def test_score_outside_lock(self, monkeypatch):
+        store = make_store()
+        store.add_knowledge_points([make_knowledge_point(i) for i in range(20)])
+        argpartition = np.argpartition
+        deleted = threading.Event()
+
+        def delete_while_scoring(*args, **kwargs):
+            # 打分期间其他线程的删除不应被阻塞
+            thread = threading.Thread(target=lambda: (store.delete_documents("knowledge_points", ["k7"]), deleted.set()))
+            thread.start()
+            thread.join(timeout=5)
+            return argpartition(*args, **kwargs)
+
+        monkeypatch.setattr(np, "argpartition", delete_while_scoring)
+        result = store._query_chunks("knowledge_points", 3, query_embeddings=store.embedding_function(["知识点 7"]))
+        monkeypatch.undo()
+        assert deleted.is_set()
+        # 查询结果来自删除前的快照, 文档和元数据保持一致
+        assert result["metadatas"][0][0]["uuid"] == "k7" and result["documents"][0][0] == "知识点 7"
+        assert "k7" not in store.query_uuid("knowledge_points", query_texts=["知识点 7"], n_results=5)
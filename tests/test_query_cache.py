@@ -0,0 +1,123 @@
+import hashlib
+import time
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from sqlalchemy import select
+
+from knowledge_base.storage import KnowledgePoint, MySQLClient, NumpyVectorStore, QueryCache, SyncManager
+
+
+class CountingEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量, 记录计算过的文本"""
+
+    def __init__(self):
+        self.texts: list[str] = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.texts.extend(input)
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+def make_knowledge_point(i: int, document: str | None = None) -> dict:
+    return {"uuid": f"k{i}", "document": document or f"知识点 {i}", "subject": "操作系统"}
+
+
+class CountingVectorStore(NumpyVectorStore):
+    """记录实际执行的切片查询次数"""
+
+    queries = 0
+
+    def _query_chunks(self, collection_name: str, n_results: int, **query):
+        self.queries += 1
+        return super()._query_chunks(collection_name, n_results, **query)
+
+
+class TestQueryCache:
+    """VectorStore 查询缓存测试类"""
+
+    def test_cached_until_collection_changes(self):
+        embedding_function = CountingEmbeddingFunction()
+        store = NumpyVectorStore({
+            "embedding_function": embedding_function,
+            "collections": {"questions": {}, "knowledge_points": {}},
+            "max_length": 50,
+            "overlap": 0,
+            "query_cache": {"max_entries": 100, "ttl": 60},
+        })
+        store.add_knowledge_points([make_knowledge_point(i) for i in range(20)])
+        embedding_function.texts.clear()
+        first = store.query_uuid_scores("knowledge_points", query_texts="知识点 3", n_results=5)
+        assert store.query_uuid_scores("knowledge_points", query_texts="知识点 3", n_results=5) == first
+        assert store.query_uuid_scores("knowledge_points", query_texts="知识点 3", n_results=5, where={"subject": "数据结构"}) == []
+        assert embedding_function.texts == ["知识点 3"]
+        assert first[0][0] == "k3"
+
+        store.delete_documents("knowledge_points", ["k3"])
+        assert "k3" not in store.query_uuid("knowledge_points", query_texts="知识点 3", n_results=5)
+        store.add_knowledge_points([make_knowledge_point(99, "知识点 3")])
+        assert store.query_uuid("knowledge_points", query_texts="知识点 3", n_results=5)[0] == "k99"
+        # 只失效了查询结果, 查询向量仍然来自缓存
+        assert embedding_function.texts == ["知识点 3", "知识点 3"]
+
+    def test_shared_generation_invalidates_other_processes(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        store = CountingVectorStore({
+            "embedding_function": CountingEmbeddingFunction(),
+            "collections": {"questions": {}, "knowledge_points": {}},
+            "max_length": 50,
+            "overlap": 0,
+            "query_cache": {"max_entries": 100, "ttl": 60, "shared_refresh_interval": 0},
+        })
+        store.query_cache.share_generations(mysql_client)  # type: ignore
+        store.add_knowledge_points([make_knowledge_point(i) for i in range(5)])
+        store.query_uuid("knowledge_points", query_texts="知识点 1", n_results=2)
+        store.query_uuid("knowledge_points", query_texts="知识点 1", n_results=2)
+        assert store.queries == 1
+        # 另一个进程同步了变更, 只更新了 MySQL 中的版本号
+        other = QueryCache()
+        other.share_generations(mysql_client)
+        other.invalidate("knowledge_points")
+        store.query_uuid("knowledge_points", query_texts="知识点 1", n_results=2)
+        assert store.queries == 2
+        assert mysql_client.get_generation("knowledge_points") == 2
+
+    def test_shared_generation_reused_for_refresh_interval(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        cache = QueryCache(shared_refresh_interval=0.2)
+        cache.share_generations(mysql_client)
+        before = cache.generation("questions")
+        other = QueryCache()
+        other.share_generations(mysql_client)
+        other.invalidate("questions")
+        # 其它进程的修改在 shared_refresh_interval 内不可见, 之后重新读取
+        assert cache.generation("questions") == before
+        time.sleep(0.25)
+        assert cache.generation("questions") != before
+
+    def test_sync_bumps_shared_generation_once_per_commit(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        store = CountingVectorStore({
+            "embedding_function": CountingEmbeddingFunction(),
+            "collections": {"questions": {}, "knowledge_points": {}},
+            "max_length": 50,
+            "overlap": 0,
+            "query_cache": {"max_entries": 100, "ttl": 60},
+        })
+        store.query_cache.share_generations(mysql_client)  # type: ignore
+        SyncManager(mysql_client, store)
+        mysql_client.save_knowledge_points([
+            KnowledgePoint(uuid=f"k{i}", document=f"知识点 {i}", subject="操作系统", knowledge_point=f"知识点 {i}", difficulty="简单", source="真题")
+            for i in range(3)
+        ])
+        assert mysql_client.get_generation("knowledge_points") == 1
+        # 更新需要先删除旧切片再写入, 同一个事务只加一次
+        with mysql_client.session_scope() as session:
+            for record in session.execute(select(KnowledgePoint)).scalars():
+                record.document = f"{record.document} 修改"
+        assert mysql_client.get_generation("knowledge_points") == 2
+        assert store.query_uuid("knowledge_points", query_texts="知识点 1 修改", n_results=1) == ["k1"]
@@ -0,0 +1,48 @@
+import hashlib
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import KnowledgePoint, MySQLClient, NumpyVectorStore, SyncManager
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+def make_store() -> NumpyVectorStore:
+    return NumpyVectorStore({
+        "backend": "numpy",
+        "embedding_function": HashEmbeddingFunction(),
+        "collections": {"questions": {}, "knowledge_points": {}},
+        "max_length": 50,
+        "overlap": 0,
+    })
+
+
+def make_knowledge_point(i: int) -> KnowledgePoint:
+    return KnowledgePoint(uuid=f"k{i}", document=f"知识点 {i}", subject="操作系统", knowledge_point=f"知识点 {i}", difficulty="简单", source="真题")
+
+
+class TestSyncManager:
+    """SyncManager 测试类"""
+
+    def test_full_sync_pages_and_deletes_orphans(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        mysql_client.save_knowledge_points([make_knowledge_point(i) for i in range(7)])
+        store = make_store()
+        store.add_knowledge_points([{"uuid": f"orphan{i}", "document": f"孤立 {i}"} for i in range(3)])
+        sync_manager = SyncManager(mysql_client, store)
+        sync_manager.full_sync(batch_size=2, checkpoint_path=str(tmp_path / "checkpoint.json"))
+        assert sorted(store.iter_uuids("knowledge_points")) == sorted(f"k{i}" for i in range(7))
+        assert not (tmp_path / "checkpoint.json").exists()
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from knowledge_base.storage import KnowledgePoint, MySQLClient, NumpyVectorStore, SyncManager, SyncWorker
+from knowledge_base.storage.models import SyncOutbox
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """按文本哈希生成固定随机向量的 embedding function"""
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for text in input:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).normal(size=16).astype(np.float32))
+        return vectors  # type: ignore
+
+
+class PausingVectorStore(NumpyVectorStore):
+    """指定线程第一次删除切片前暂停, 用于构造两个 worker 交错写入的场景"""
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.pause_thread: str | None = None
+        self.paused = threading.Event()
+        self.resume = threading.Event()
+
+    def delete_documents(self, collection_name: str, uuids: list[str]):
+        if threading.current_thread().name == self.pause_thread:
+            self.pause_thread = None
+            self.paused.set()
+            self.resume.wait(10)
+        super().delete_documents(collection_name, uuids)
+
+
+def make_knowledge_point(uuid: str, document: str) -> KnowledgePoint:
+    return KnowledgePoint(uuid=uuid, document=document, subject="操作系统", knowledge_point=document, difficulty="简单", source="真题")
+
+
+def make_store() -> PausingVectorStore:
+    return PausingVectorStore({
+        "backend": "numpy",
+        "embedding_function": HashEmbeddingFunction(),
+        "collections": {"questions": {}, "knowledge_points": {}},
+        "max_length": 50,
+        "overlap": 0,
+    })
+
+
+class TestSyncWorker:
+    """SyncWorker 测试类"""
+
+    def test_interleaved_workers_keep_latest(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        store = make_store()
+        SyncManager(mysql_client, store, mode="outbox")
+        worker_a = SyncWorker(mysql_client, store)
+        worker_b = SyncWorker(mysql_client, store)
+        mysql_client.save_knowledge_points([KnowledgePoint(
+            uuid="k1", document="旧的知识点", subject="操作系统", knowledge_point="旧的知识点", difficulty="简单", source="真题",
+        )])
+
+        # worker A 读到旧数据后暂停, 此时记录被修改, worker B 同步了新数据
+        store.pause_thread = "worker-a"
+        thread = threading.Thread(target=worker_a.process_batch, name="worker-a")
+        thread.start()
+        assert store.paused.wait(10)
+        with mysql_client.session_scope() as session:
+            record = session.query(KnowledgePoint).filter_by(uuid="k1").one()
+            record.document = "新的知识点"
+        assert worker_b.process_batch() > 0
+        # worker A 随后写入旧快照, 写入后的校验应当发现并用最新数据重写
+        store.resume.set()
+        thread.join(10)
+        worker_a.drain()
+
+        result = store.query_metadata("knowledge_points", ["k1"])["k1"]
+        assert result["documents"] == ["新的知识点"]
+        assert worker_a.pending_count() == 0
+
+    def test_claim_is_committed_before_apply(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        store = make_store()
+        SyncManager(mysql_client, store, mode="outbox")
+        worker_a = SyncWorker(mysql_client, store)
+        worker_b = SyncWorker(mysql_client, store)
+        mysql_client.save_knowledge_points([make_knowledge_point("k1", "知识点")])
+
+        store.pause_thread = "worker-a"
+        thread = threading.Thread(target=worker_a.process_batch, name="worker-a")
+        thread.start()
+        assert store.paused.wait(10)
+        # 写入向量存储期间认领已经提交, 其它事务可以读写 outbox, 其它 worker 不会重复处理
+        with mysql_client.session_scope() as session:
+            assert [row.status for row in session.query(SyncOutbox)] == ["processing"]
+        assert worker_b.process_batch() == 0
+        store.resume.set()
+        thread.join(10)
+        assert worker_a.pending_count() == 0
+        assert store.query_metadata("knowledge_points", ["k1"])["k1"]["documents"] == ["知识点"]
+
+    def test_reclaims_stale_claims_and_releases_failures(self, tmp_path):
+        mysql_client = MySQLClient({"url": f"sqlite:///{tmp_path / 'kb.db'}"})
+        store = make_store()
+        SyncManager(mysql_client, store, mode="outbox")
+        worker = SyncWorker(mysql_client, store, {"claim_timeout": 60, "retry_delay": 0})
+        mysql_client.save_knowledge_points([make_knowledge_point("k1", "知识点 1"), make_knowledge_point("k2", "知识点 2")])
+        # k1 被一个已崩溃的 worker 认领且已超时, k2 刚被另一个 worker 认领
+        with mysql_client.session_scope() as session:
+            rows = {row.uuid: row for row in session.query(SyncOutbox)}
+            rows["k1"].status, rows["k1"].claimed_at, rows["k1"].claimed_by = "processing", datetime.now() - timedelta(minutes=5), "crashed"
+            rows["k2"].status, rows["k2"].claimed_at, rows["k2"].claimed_by = "processing", datetime.now(), "running"
+        assert worker.process_batch() == 1
+        assert store.query_metadata("knowledge_points", ["k1"])["k1"]["documents"] == ["知识点 1"]
+        with mysql_client.session_scope() as session:
+            assert [(row.uuid, row.claimed_by) for row in session.query(SyncOutbox)] == [("k2", "running")]
+
+        # 处理失败时在新的事务中改回 pending 并记录错误
+        with mysql_client.session_scope() as session:
+            session.query(SyncOutbox).delete()
+        mysql_client.save_knowledge_points([make_knowledge_point("k3", "知识点 3")])
+        store.add_documents = lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("写入失败"))  # type: ignore
+        assert worker.process_batch() == 1
+        with mysql_client.session_scope() as session:
+            row = session.query(SyncOutbox).one()
+            assert (row.status, row.attempts, row.claimed_by, row.last_error) == ("pending", 1, None, "写入失败")
@@ -0,0 +1,33 @@
+from knowledge_base.storage.text_sliptter import SentenceTextSplitter
+
+
+class PairTokenizer:
+    """每两个字符为一个 token 的分词器替身"""
+
+    def encode(self, text, add_special_tokens=False):
+        return list(range((len(text) + 1) // 2))
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        return {"offset_mapping": [(i, min(i + 2, len(text))) for i in range(0, len(text), 2)]}
+
+
+class TestSentenceTextSplitter:
+    """SentenceTextSplitter 测试类"""
+
+    def test_sentence_boundaries(self):
+        splitter = SentenceTextSplitter()
+        document = "进程是资源分配的基本单位。线程是调度的基本单位！进程是资源分配的基本单位。"
+        assert splitter.split(document, 512, 0) == [document]
+        chunks = splitter.split(document, 14, 0)
+        assert chunks == ["进程是资源分配的基本单位。", "线程是调度的基本单位！"]
+        assert splitter.split("", 512, 0) == [] and splitter.split(" \n ", 512, 0) == []
+
+    def test_token_limit_and_overlap(self):
+        splitter = SentenceTextSplitter(tokenizer=PairTokenizer(), max_tokens=12)
+        # 每句 3 个 token, 最多 10 个 token (12 减去两个特殊 token)
+        chunks = splitter.split("第一句话。第二句话。第三句话。第四句话。", 100, 3)
+        assert chunks == ["第一句话。第二句话。第三句话。", "第三句话。第四句话。"]
+        chunks = splitter.split("第一句话，" + "没有标点的超长文本" * 4, 100, 0)
+        assert all(chunk.strip() for chunk in chunks) and len(set(chunks)) == len(chunks)
+        assert max(splitter.count_tokens(chunk) for chunk in chunks) <= 10
+        assert "".join(chunks) == "第一句话，" + "没有标点的超长文本" * 4